@@ -0,0 +1,78 @@
+#HTTP client for service.py, used by the Streamlit UI (app.py).
+#Query methods return the service's NDJSON events as dicts, as they arrive.
+import json
+import os
+from urllib.parse import quote
+
+import requests
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "600")) #Seconds to wait for an upload or an answer.
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ApiClient:
+    def __init__(self, base_url=API_URL, timeout=API_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session() #Keeps the connection to the service open between requests.
+
+    def _post(self, path, **kwargs):
+        response = self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            response.close()
+            raise ApiError(response.status_code, detail)
+        return response
+
+    def _events(self, path, body):
+        response = self._post(path, json={**body, "stream": True}, stream=True)
+        with response:
+            #chunk_size=None: hand over each line as soon as it arrives instead of filling a buffer first.
+            for line in response.iter_lines(chunk_size=None):
+                if line:
+                    yield json.loads(line)
+
+    def upload_document(self, file_name, data, replaces=None):
+        #Returns {"document_id", "name", "chunks", "already_indexed"}.
+        #replaces: id of the document this file is a new version of (only its changed chunks are embedded).
+        data_fields = {"replaces": replaces} if replaces else None
+        return self._post("/documents", files={"file": (file_name, data)}, data=data_fields).json()
+
+    def query_document(self, document_id, question, top_k=5):
+        #Events: {"type": "text", "text"}..., then {"type": "done", "cached", "time_to_first_token", ...}.
+        return self._events(f"/documents/{quote(document_id, safe='')}/query", {"question": question, "top_k": top_k})
+
+    def upload_table(self, file_name, data):
+        #Returns {"table_name", "rows", "columns", "seconds", "already_loaded", "preview"}.
+        return self._post("/tables", files={"file": (file_name, data)}).json()
+
+    def query_table(self, table_name, question):
+        #Events: {"type": "plan", "function_call", "result", ...}, {"type": "text", "text"}..., then
+        #{"type": "done", "time_to_first_token", ...}.
+        return self._events(f"/tables/{quote(table_name, safe='')}/query", {"question": question})
+
+    def query(self, question, document_ids=None, table_names=(), search_documents=True, top_k=5):
+        #One answer from several documents (None: all of them) and tables, searched in parallel.
+        #Events: {"type": "plan", "branches", "tables", ...}, {"type": "text", "text"}..., then {"type": "done", ...}.
+        return self._events("/query", {"question": question, "documents": document_ids,
+                                       "search_documents": search_documents, "tables": list(table_names),
+                                       "top_k": top_k})
+
+
+def stream_text(events, stats):
+    #The text of "text" events, for st.write_stream; stats is filled from the "done" event.
+    for event in events:
+        if event["type"] == "text":
+            yield event["text"]
+        elif event["type"] == "done":
+            stats.update({key: value for key, value in event.items() if key != "type"})
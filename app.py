@@ -1,43 +1,167 @@
 import streamlit as st
 import os
-import tempfile
-import sys
+from api_client import API_URL, ApiClient, ApiError, stream_text
+
+# Thin client of the HTTP service (service.py): uploads, retrieval, SQL and answer generation all run
+# there, so this script only renders. Start the service first:  uvicorn service:app --port 8000
+DOCUMENT_TYPES = [".pdf", ".docx", ".pptx"]
+TABLE_TYPES = [".csv", ".xlsx"]
+
+
+@st.cache_resource
+def get_client():
+    # One client (and pooled connection) per Streamlit server, not per rerun
+    return ApiClient()
 
-# Add paths to both sub-apps
-sys.path.append("rag-gemini-pdf")
-sys.path.append("rag-structured-data")
 
 # Title and UI
 st.set_page_config(page_title="Unified Document QA")
 st.title("📁 Unified Document Query Assistant")
 st.markdown("Upload any document (PDF, DOCX, PPTX, CSV, XLSX). The system will automatically choose the correct pipeline.")
 
+if 'uploaded_documents' not in st.session_state:
+    st.session_state.uploaded_documents = []
+if 'uploads' not in st.session_state:
+    st.session_state.uploads = {}  # upload id -> service response, so reruns don't upload the file again
+
 # File upload
 uploaded_file = st.file_uploader("Upload a file", type=["pdf", "docx", "pptx", "csv", "xlsx"])
 
-if uploaded_file:
-    file_ext = os.path.splitext(uploaded_file.name)[-1].lower()
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_path = tmp_file.name
 
-    #st.success(f"Uploaded: {uploaded_file.name}")
+def upload(uploaded_file, send):
+    upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    if upload_id not in st.session_state.uploads:
+        st.session_state.uploads[upload_id] = send(uploaded_file.name, uploaded_file.getvalue())
+        st.session_state.uploads[upload_id]["new"] = True
+    else:
+        st.session_state.uploads[upload_id]["new"] = False
+    return st.session_state.uploads[upload_id]
 
-    # Store the file path in session state so sub-apps can access it
-    st.session_state.uploaded_file_path = tmp_path
-    st.session_state.uploaded_file_name = uploaded_file.name
 
-    # Determine and route based on file type
-    if file_ext in [".pdf", ".docx", ".pptx"]:
-        #st.subheader("🔎 Running Unstructured Document QA")
-        # Execute the unstructured document QA app with the uploaded file
-        exec(open("rag-gemini-pdf/app.py", encoding='utf-8').read(), globals())
+def show_document(client, uploaded_file):
+    # A file with the name of a document uploaded earlier in this session is a new version of it
+    previous_version = next(
+        (doc['id'] for doc in st.session_state.uploaded_documents if doc['name'] == uploaded_file.name), None
+    )
+    with st.spinner(f"Indexing '{uploaded_file.name}'..."):
+        document = upload(uploaded_file, lambda name, data: client.upload_document(name, data, previous_version))
+    if document["already_indexed"] or not document["new"]:
+        st.info(f"📄 '{document['name']}' is already in the knowledge base. Using the existing document for queries.")
+    else:
+        st.success(f"📄 Document '{document['name']}' processed and added to knowledge base!")
+    st.session_state.uploaded_documents = [
+        doc for doc in st.session_state.uploaded_documents if doc['id'] != document['document_id']
+    ] + [{'id': document['document_id'], 'name': document['name']}]
+    for doc in st.session_state.uploaded_documents:
+        st.write(f"  • {doc['name']}")
 
-    elif file_ext in [".csv", ".xlsx"]:
-        #st.subheader("🧠 Running Structured Data QA")
-        # Execute the structured data QA app with the uploaded file
-        exec(open("rag-structured-data/app.py", encoding='utf-8').read(), globals())
+    st.subheader("🔍 Ask Questions")
+    names = {doc['id']: doc['name'] for doc in st.session_state.uploaded_documents}
+    selected = st.multiselect("Search in:", list(names), default=[document['document_id']], format_func=names.get)
+    query = st.text_input("Ask a question based on your uploaded documents:")
+    if query and selected:
+        st.subheader("📌 Answer")
+        # Show the answer as the service generates it; several documents are searched together
+        generation_stats = {}
+        if selected == [document['document_id']]:
+            events = client.query_document(document['document_id'], query)
+        else:
+            events = client.query(query, document_ids=selected)
+        st.write_stream(stream_text(events, generation_stats))
+        if generation_stats.get("cached"):
+            st.caption("⚡ Answered from cache")
+        elif generation_stats.get("total_seconds") is not None:
+            st.caption(f"⏱️ First words after {generation_stats['time_to_first_token'] or 0:.1f}s, "
+                       f"complete after {generation_stats['total_seconds']:.1f}s")
+        st.caption("🔍 Searched in: " + ", ".join(f"'{names[document_id]}'" for document_id in selected))
 
+
+def show_table(client, uploaded_file):
+    with st.spinner("Loading data..."):
+        table = upload(uploaded_file, client.upload_table)
+    st.success("✅ File uploaded successfully!")
+    if table["already_loaded"] or not table["new"]:
+        st.caption(f"{table['rows']:,} rows (already loaded)")
     else:
-        st.error("Unsupported file type.")
+        st.caption(f"{table['rows']:,} rows loaded in {table['seconds']:.1f}s")
+    st.dataframe(table["preview"])
+
+    st.subheader("💬 Ask a Question")
+    loaded = sorted({upload["table_name"] for upload in st.session_state.uploads.values() if "table_name" in upload})
+    selected = st.multiselect("Tables:", loaded, default=[table["table_name"]])
+    user_query = st.text_input("Enter your query related to the data")
+    if not user_query or not selected:
+        return
+    with st.spinner("🤖 Thinking..."):
+        if selected == [table["table_name"]]:
+            events = client.query_table(table["table_name"], user_query)
+            response = next(events)  # the plan: the function Gemini chose and, for SQL, its result
+        else:
+            # Several tables are queried together, with their combined schema
+            events = client.query(user_query, table_names=selected, search_documents=False)
+            response = next(events)["tables"] or {"error": "❌ The tables did not answer in time."}
+    try:
+        show_table_answer(response, events)
+    finally:
+        events.close()  # hands the connection back even when the answer text isn't read
+
+
+def show_table_answer(response, events):
+    st.subheader("📬 Gemini Response")
+
+    if "error" in response:
+        st.error(response["error"])
+        if "raw" in response:
+            st.write("**Raw Response:**")
+            st.text(response["raw"])
+        return
+    function_call = response.get("function_call", {})
+    function_name = function_call.get("name", "❌ No function returned by LLM")
+    st.write("**Function Called**:", function_name)
+    if response.get("cached"):
+        st.caption("⚡ Reused the plan of an earlier question (no Gemini call)")
+    if function_name == "execute_sql_query":
+        st.code(function_call.get("arguments", {}).get("query", "No query found"), language="sql")
+
+    st.subheader("✅ Answer")
+    result = response.get("result", "No result found")
+    if not isinstance(result, dict):
+        st.write(result)  # a static response
+    elif "result" in result:
+        sql_result = result["result"]
+        if isinstance(sql_result, list) and sql_result:
+            # The service phrases the rows as a sentence; show it as it is generated
+            generation_stats = {}
+            st.write_stream(stream_text(events, generation_stats))
+            if generation_stats.get("total_seconds") is not None:
+                st.caption(f"⏱️ First words after {generation_stats['time_to_first_token'] or 0:.1f}s, "
+                           f"complete after {generation_stats['total_seconds']:.1f}s")
+            if result.get("truncated"):
+                st.caption(f"Only the first {result['max_rows']} rows of the result were used.")
+        elif isinstance(sql_result, list):
+            st.write("No data found matching your query.")
+        else:
+            st.write(str(sql_result))
+    elif "error" in result:
+        st.error(result["error"])
+    elif "message" in result:
+        st.write(result["message"])
+    else:
+        st.write(result)
+
+
+if uploaded_file:
+    file_ext = os.path.splitext(uploaded_file.name)[-1].lower()
+    client = get_client()
+    try:
+        # Determine and route based on file type
+        if file_ext in DOCUMENT_TYPES:
+            show_document(client, uploaded_file)
+        elif file_ext in TABLE_TYPES:
+            show_table(client, uploaded_file)
+        else:
+            st.error("Unsupported file type.")
+    except ApiError as e:
+        st.error(f"❌ {e.detail}")
+    except OSError as e:  # requests' connection errors
+        st.error(f"❌ Could not reach the service at {API_URL} ({e}). Start it with: uvicorn service:app --port 8000")
@@ -0,0 +1,276 @@
+#Offline end-to-end benchmark of both pipelines, for catching performance regressions between commits.
+#Gemini (embeddings and generation) and Qdrant are replaced by deterministic fakes with configurable
+#latency (utils/fakes.py, gemini_fakes.py and the local vector store), and the inputs are synthetic
+#corpora (benchmarks/corpora.py), so a run needs no API keys or network and is repeatable.
+#  documents:<format>:<size>  ingest a generated manual, then answer questions about it concurrently
+#  tables:csv:<size>          load a generated sales table, then answer questions about it concurrently
+#Every case runs in its own subprocess with fresh stores and caches, so peak RSS and cache hits belong
+#to that case alone. Results are written as JSON; compare two runs with benchmarks/compare.py.
+#Run from the repository root:
+#  python benchmarks/bench_pipelines.py [--sizes small medium] [--output results.json]
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpora import (DOCUMENT_FORMATS, DOCUMENT_SIZES, TABLE_SIZES, document_questions, make_document,
+                     make_table, table_questions)
+
+PATHS = ("documents", "tables")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else None
+
+
+def latency_stats(seconds):
+    #Milliseconds, like telemetry.summary().
+    return {
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p95_ms": percentile(seconds, 95) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+        "max_ms": max(seconds) * 1000,
+    }
+
+
+def _setup(workdir, settings):
+    #Runs inside the subprocess: stores under workdir, fakes in place of Gemini and Qdrant.
+    os.environ.update(
+        VECTOR_STORE="local",
+        VECTOR_STORE_PATH=os.path.join(workdir, "vector_store"),
+        BM25_INDEX_PATH=os.path.join(workdir, "bm25_index.db"),
+        DOCUMENT_REGISTRY_PATH=os.path.join(workdir, "document_registry.db"),
+        EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+        STRUCTURED_DB_PATH=os.path.join(workdir, "uploaded_data.db"),
+        PLAN_CACHE_PATH=os.path.join(workdir, "plan_cache.db"),
+        PARQUET_CACHE_DIR=os.path.join(workdir, "parquet_cache"),
+        COLUMNAR_DB_PATH=os.path.join(workdir, "columnar.duckdb"),
+    )
+    sys.path.insert(0, ROOT)
+    sys.path.append(os.path.join(ROOT, "rag-gemini-pdf"))
+    sys.path.append(os.path.join(ROOT, "rag-structured-data"))
+
+    from utils import fakes, gemini_llm, qdrant_client
+    gemini_llm.embedding_engine.backend = fakes.FakeEmbeddingBackend(latency=settings["embed_latency"])
+    gemini_llm.chat_model = fakes.FakeChatModel(first_token_latency=settings["llm_latency"],
+                                                token_latency=settings["token_latency"])
+    qdrant_client.qdrant = fakes.LatencyProxy(qdrant_client.get_qdrant(), settings["vector_latency"])
+
+
+def _run_questions(questions, answer, concurrency):
+    #answer(question) -> dict of per-question results; returns (end-to-end seconds per question, results, wall seconds).
+    def timed(question):
+        started = time.perf_counter()
+        result = answer(question)
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, questions))
+    return [seconds for seconds, _ in timings], [result for _, result in timings], time.perf_counter() - started
+
+
+def run_documents(workdir, file_format, size, settings):
+    from utils.context_builder import build_context
+    from utils.gemini_llm import embed_fn, stream_answer
+    from utils.ingestion import ingest_document
+    from utils.qdrant_client import create_or_get_collection, document_registry
+
+    pages = DOCUMENT_SIZES[size]
+    path = os.path.join(workdir, f"manual.{file_format}")
+    parts = make_document(path, pages, file_format)
+    create_or_get_collection()
+
+    started = time.perf_counter()
+    document_id, chunks = ingest_document(path, embed_fn, registry=document_registry, name=os.path.basename(path))
+    ingest_seconds = time.perf_counter() - started
+
+    def answer(question):
+        stats = {}
+        results, chunk_ids = build_context(question, embed_fn, top_k=settings["top_k"], document_id=document_id,
+                                           stats=stats)
+        "".join(stream_answer(results, question, document_id=document_id, chunk_ids=chunk_ids, stats=stats))
+        part = re.search(r"P-\d{5}", question).group(0)
+        return {"hit": any(part in chunk for chunk in results), "ttft": stats.get("time_to_first_token"),
+                "cached": stats.get("cached", False), "context_tokens": stats["context_tokens"],
+                "prompt_tokens": stats.get("prompt_tokens"), "duplicates": stats["duplicates"]}
+
+    questions = document_questions(parts, settings["queries"])
+    latencies, results, wall = _run_questions(questions, answer, settings["concurrency"])
+    return {
+        "pages": pages,
+        "chunks": chunks,
+        "file_mb": os.path.getsize(path) / (1024 * 1024),
+        "ingest_seconds": ingest_seconds,
+        "pages_per_sec": pages / ingest_seconds,
+        "chunks_per_sec": chunks / ingest_seconds,
+        "queries": len(questions),
+        "queries_per_sec": len(questions) / wall,
+        "retrieval_hit_rate": sum(result["hit"] for result in results) / len(results),
+        "answer_cache_hits": sum(result["cached"] for result in results),
+        "context_tokens_mean": sum(result["context_tokens"] for result in results) / len(results),
+        #Cached answers send no prompt.
+        "prompt_tokens_mean": sum(result["prompt_tokens"] or 0 for result in results) / max(1, sum(
+            not result["cached"] for result in results)),
+        "duplicate_chunks_dropped": sum(result["duplicates"] for result in results),
+        "latency": latency_stats(latencies),
+        "time_to_first_token": latency_stats([result["ttft"] or 0.0 for result in results]),
+    }
+
+
+def run_tables(workdir, file_format, size, settings):
+    import route_query
+    from common import llm_config
+    from gemini_fakes import FakeChatModel
+    from result_formatter import stream_result_with_llm
+    from table_ingestion import ingest_table
+
+    rows = TABLE_SIZES[size]
+    path = os.path.join(workdir, f"sales.{file_format}")
+    make_table(path, rows)
+
+    started = time.perf_counter()
+    table = ingest_table(path, os.path.basename(path))
+    ingest_seconds = time.perf_counter() - started
+
+    questions = table_questions(table["table_name"], settings["queries"])
+    plans = {question: sql for question, sql in questions}
+
+    def respond(prompt):
+        #Routing prompts are chat messages: answer with the SQL a model would write for the question at
+        #their end. Formatting prompts are plain text: answer with a sentence.
+        if isinstance(prompt, str):
+            return "The answer is in the query result above."
+        question = prompt[0]["parts"][0].rsplit("User Query:", 1)[-1].strip()
+        return json.dumps({"function_call": {"name": "execute_sql_query", "arguments": {"query": plans[question]}}})
+
+    llm_config.model = FakeChatModel(respond, first_token_latency=settings["llm_latency"],
+                                     token_latency=settings["token_latency"])
+
+    def answer(question):
+        stats = {}
+        routed = route_query.route_query(question, table["metadata"])
+        result = routed.get("result") or {}
+        if "error" in routed or "error" in result:
+            return {"error": True, "cached": False, "ttft": None}
+        "".join(stream_result_with_llm(result["result"], question, result["query"], stats))
+        return {"error": False, "cached": bool(routed.get("cached")), "ttft": stats.get("time_to_first_token"),
+                "engine": result.get("engine")}
+
+    latencies, results, wall = _run_questions([question for question, _ in questions], answer,
+                                              settings["concurrency"])
+    return {
+        "rows": rows,
+        "file_mb": os.path.getsize(path) / (1024 * 1024),
+        "ingest_seconds": ingest_seconds,
+        "rows_per_sec": rows / ingest_seconds,
+        "queries": len(questions),
+        "queries_per_sec": len(questions) / wall,
+        "errors": sum(result["error"] for result in results),
+        "plan_cache_hits": sum(result["cached"] for result in results),
+        "engines": sorted({result["engine"] for result in results if result.get("engine")}),
+        "latency": latency_stats(latencies),
+        "time_to_first_token": latency_stats([result["ttft"] or 0.0 for result in results]),
+    }
+
+
+def run_case(case, settings):
+    #Runs inside the subprocess; prints the results as one JSON line after RESULT_PREFIX (background
+    #threads such as the index advisor may still log after it).
+    path, file_format, size = case.split(":")
+    workdir = tempfile.mkdtemp()
+    _setup(workdir, settings)
+    from common.loader import peak_rss_mb
+    from telemetry import summary
+
+    result = (run_documents if path == "documents" else run_tables)(workdir, file_format, size, settings)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["stages"] = summary()["stages"]
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--sizes", nargs="+", choices=list(DOCUMENT_SIZES), default=["small", "medium"])
+    parser.add_argument("--formats", nargs="+", choices=DOCUMENT_FORMATS, default=list(DOCUMENT_FORMATS),
+                        help="document formats to benchmark")
+    parser.add_argument("--queries", type=int, default=50, help="questions per case")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions answered at once")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per fake embedding request")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the fake model's first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds between the fake model's chunks")
+    parser.add_argument("--vector-latency", type=float, default=0.005, help="seconds per fake vector store request")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--settings", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, json.loads(args.settings))
+        return
+
+    settings = {
+        "queries": args.queries,
+        "concurrency": args.concurrency,
+        "top_k": args.top_k,
+        "embed_latency": args.embed_latency,
+        "llm_latency": args.llm_latency,
+        "token_latency": args.token_latency,
+        "vector_latency": args.vector_latency,
+    }
+    cases = []
+    if "documents" in args.paths:
+        cases += [f"documents:{file_format}:{size}" for file_format in args.formats for size in args.sizes]
+    if "tables" in args.paths:
+        cases += [f"tables:csv:{size}" for size in args.sizes]
+
+    results = {}
+    print(f"{'case':>22} {'ingest s':>9} {'q/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak RSS MB':>12}")
+    for case in cases:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", case, "--settings", json.dumps(settings)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(line for line in output.splitlines() if line.startswith(RESULT_PREFIX))
+        result = results[case] = json.loads(line[len(RESULT_PREFIX):])
+        latency = result["latency"]
+        print(f"{case:>22} {result['ingest_seconds']:>9.2f} {result['queries_per_sec']:>7.1f} "
+              f"{latency['p50_ms']:>8.0f} {latency['p95_ms']:>8.0f} {latency['p99_ms']:>8.0f} "
+              f"{result['peak_rss_mb'] or 0:>12.0f}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "settings": settings,
+            "cases": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
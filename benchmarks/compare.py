@@ -0,0 +1,91 @@
+#Compares two result files of benchmarks/bench_pipelines.py and flags regressions.
+#Times, latencies, errors and peak RSS are better lower; *_per_sec and hit rates are better higher.
+#Exits with status 1 when a metric got worse by more than --threshold, so it can gate CI.
+#Run from the repository root:  python benchmarks/compare.py baseline.json candidate.json [--threshold 0.1]
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("_per_sec", "hit_rate")
+LOWER_IS_BETTER = ("_ms", "_seconds", "peak_rss_mb", "errors")
+
+
+def direction(metric):
+    #1 when higher is better, -1 when lower is better, 0 for sizes and counts that only describe the case.
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def flatten(case, stages=False):
+    #{"latency.p95_ms": ..., "ingest_seconds": ...}; per-stage metrics only with stages=True.
+    metrics = {}
+    for key, value in case.items():
+        if isinstance(value, dict):
+            if key == "stages" and not stages:
+                continue
+            for name, inner in flatten(value, stages).items():
+                metrics[f"{key}.{name}"] = inner
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[key] = value
+    return metrics
+
+
+def compare(baseline, candidate, threshold, min_ms, stages=False):
+    #Returns [(case, metric, old, new, relative change, verdict)] with verdict "regression",
+    #"improvement" or "" for every metric both runs measured.
+    rows = []
+    for case, new_case in candidate["cases"].items():
+        old_case = baseline["cases"].get(case)
+        if old_case is None:
+            continue
+        old_metrics, new_metrics = flatten(old_case, stages), flatten(new_case, stages)
+        for metric, new in new_metrics.items():
+            old = old_metrics.get(metric)
+            sign = direction(metric)
+            if old is None or sign == 0:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            verdict = ""
+            #Latencies of a few milliseconds jitter by more than any sensible threshold.
+            noise = metric.endswith("_ms") and abs(new - old) < min_ms
+            if abs(change) > threshold and not noise:
+                verdict = "improvement" if change * sign > 0 else "regression"
+            rows.append((case, metric, old, new, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts (0.1 = 10%%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="ignore latency changes smaller than this")
+    parser.add_argument("--stages", action="store_true", help="also compare the per-stage telemetry")
+    parser.add_argument("--all", action="store_true", help="list unchanged metrics too")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"baseline {baseline.get('git_commit')} ({baseline.get('created_at')}) -> "
+          f"candidate {candidate.get('git_commit')} ({candidate.get('created_at')})")
+    if baseline.get("settings") != candidate.get("settings"):
+        print("Warning: the runs used different settings, so the numbers are not directly comparable")
+
+    rows = compare(baseline, candidate, args.threshold, args.min_ms, args.stages)
+    print(f"{'case':>22} {'metric':>36} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for case, metric, old, new, change, verdict in rows:
+        if verdict or args.all:
+            print(f"{case:>22} {metric:>36} {old:>12.2f} {new:>12.2f} {change:>+8.1%} {verdict}")
+    regressions = sum(verdict == "regression" for *_, verdict in rows)
+    improvements = sum(verdict == "improvement" for *_, verdict in rows)
+    print(f"{regressions} regression(s), {improvements} improvement(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
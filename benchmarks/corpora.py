@@ -0,0 +1,103 @@
+#Synthetic, deterministic corpora for the pipeline benchmarks: technical manuals as PDF, DOCX or PPTX and
+#sales tables as CSV. Every manual page holds facts about a few part numbers, so generated questions have
+#a known answer location; the tables are the ones rag-structured-data/benchmarks/bench_loader.py makes.
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag-structured-data", "benchmarks"))
+from bench_loader import make_csv
+
+#Pages (PDF), slides (PPTX) or page-sized paragraph groups (DOCX) per document size, rows per table size.
+DOCUMENT_SIZES = {"small": 20, "medium": 200, "large": 1000}
+TABLE_SIZES = {"small": 10_000, "medium": 200_000, "large": 2_000_000}
+DOCUMENT_FORMATS = ("pdf", "docx", "pptx")
+PARTS_PER_PAGE = 4
+
+_WORDS = ["pump", "valve", "pressure", "the", "system", "must", "be", "checked", "before", "operation",
+          "warranty", "clause", "maintenance", "interval", "torque", "sensor", "and", "of", "to", "seal"]
+
+
+def part_number(i):
+    return f"P-{i:05d}"
+
+
+def _page_paragraphs(page, rng):
+    #A heading, one fact sentence per part number and filler text: roughly 400 words per page.
+    paragraphs = [f"Section {page + 1}: maintenance of assembly {page + 1}"]
+    for k in range(PARTS_PER_PAGE):
+        part = page * PARTS_PER_PAGE + k
+        paragraphs.append(f"Part {part_number(part)} must be torqued to {10 + part % 90} Nm and inspected every "
+                          f"{1 + part % 24} months.")
+        paragraphs.append(" ".join(rng.choice(_WORDS) for _ in range(90)))
+    return paragraphs
+
+
+def make_document(path, pages, file_format, seed=0):
+    rng = random.Random(seed)
+    if file_format == "pdf":
+        import fitz
+        doc = fitz.open()
+        for page in range(pages):
+            doc.new_page().insert_textbox(fitz.Rect(40, 40, 555, 800), "\n".join(_page_paragraphs(page, rng)),
+                                          fontsize=8)
+        doc.save(path)
+        doc.close()
+    elif file_format == "docx":
+        import docx
+        doc = docx.Document()
+        for page in range(pages):
+            for paragraph in _page_paragraphs(page, rng):
+                doc.add_paragraph(paragraph)
+        doc.save(path)
+    elif file_format == "pptx":
+        from pptx import Presentation
+        from pptx.util import Inches
+        presentation = Presentation()
+        for page in range(pages):
+            slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+            frame = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6.5)).text_frame
+            paragraphs = _page_paragraphs(page, rng)
+            frame.text = paragraphs[0]
+            for paragraph in paragraphs[1:]:
+                frame.add_paragraph().text = paragraph
+        presentation.save(path)
+    else:
+        raise ValueError(f"Unknown document format: {file_format}")
+    return pages * PARTS_PER_PAGE
+
+
+def document_questions(parts, count, seed=0):
+    rng = random.Random(seed)
+    #Parts are drawn with replacement, so some questions repeat (and can be served by the answer cache).
+    return [f"What torque does part {part_number(rng.randrange(parts))} need?" for _ in range(count)]
+
+
+def make_table(path, rows, seed=0):
+    make_csv(path, rows, seed)
+
+
+def table_questions(table_name, count, seed=0):
+    #[(question, SQL a model would answer it with)]: point lookups, filtered aggregates and a group-by.
+    rng = random.Random(seed)
+    regions = ["North", "South", "East", "West", "Central"]
+    questions = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            product = f"SKU-{rng.randrange(500):05d}"
+            questions.append((f"What is the total quantity sold for product {product}?",
+                              f"SELECT SUM(quantity) AS total_quantity FROM {table_name} WHERE product = '{product}'"))
+        elif kind == 1:
+            region = rng.choice(regions)
+            questions.append((f"How many orders were placed in the {region} region?",
+                              f"SELECT COUNT(*) AS orders FROM {table_name} WHERE region = '{region}'"))
+        elif kind == 2:
+            month = rng.randint(1, 12)
+            questions.append((f"What was the average unit price in month {month} of 2024?",
+                              f"SELECT AVG(unit_price) AS average_price FROM {table_name} "
+                              f"WHERE order_date BETWEEN '2024-{month:02d}-01' AND '2024-{month:02d}-31'"))
+        else:
+            questions.append(("Which regions sold the most units?",
+                              f"SELECT region, SUM(quantity) AS units FROM {table_name} GROUP BY region ORDER BY units DESC"))
+    return questions
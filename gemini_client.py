@@ -0,0 +1,73 @@
+#Process-wide Gemini client shared by both pipelines (rag-gemini-pdf/utils/gemini_llm.py and
+#rag-structured-data/common/llm_config.py).
+#google.generativeai takes about a second to import, so it is imported and configured on first use
+#instead of when a pipeline module is imported, and every caller gets the same model object.
+#stream_generate is the one streaming generation call both pipelines use, with the same timing stats.
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from telemetry import observe, record_llm
+
+load_dotenv()
+
+CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", "gemini-2.5-flash")
+
+_genai = None
+_models = {}
+_lock = threading.Lock()
+
+
+def get_genai():
+    #The configured google.generativeai module.
+    global _genai
+    with _lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _genai = genai
+        return _genai
+
+
+def get_chat_model(name=CHAT_MODEL):
+    #One GenerativeModel per model name for the whole process.
+    genai = get_genai()
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            model = _models[name] = genai.GenerativeModel(name)
+        return model
+
+
+def stream_generate(model, prompt, stats=None):
+    #Yields the response text piece by piece as the model produces it (generate_content with stream=True).
+    #model: get_chat_model() or any object with the same generate_content (e.g. gemini_fakes.FakeChatModel).
+    #stats: optional dict, filled with time_to_first_token, total_seconds, chars and prompt_tokens (as
+    #   reported by the API, else estimated at 4 characters per token).
+    stats = {} if stats is None else stats
+    stats.update(time_to_first_token=None, total_seconds=None, chars=0, prompt_tokens=None)
+    started = time.perf_counter()
+    response_bytes, usage = 0, None
+    for chunk in model.generate_content(prompt, stream=True):
+        usage = getattr(chunk, "usage_metadata", None) or usage #The last chunk carries the totals.
+        try:
+            text = chunk.text
+        except ValueError:
+            continue #A chunk without text parts (e.g. only the finish reason).
+        if not text:
+            continue
+        if stats["time_to_first_token"] is None:
+            stats["time_to_first_token"] = time.perf_counter() - started
+            observe("llm_first_token", stats["time_to_first_token"])
+        stats["chars"] += len(text)
+        response_bytes += len(text.encode("utf-8"))
+        yield text
+    stats["total_seconds"] = time.perf_counter() - started
+    stats["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or -(-len(prompt) // 4)
+    #Recorded by hand: a span can't stay open across the yields of a generator that may be resumed
+    #from different threads.
+    observe("llm_generate", stats["total_seconds"])
+    record_llm("generate", getattr(model, "model_name", type(model).__name__), len(prompt.encode("utf-8")),
+               response_bytes, usage)
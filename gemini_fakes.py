@@ -0,0 +1,51 @@
+#Local, deterministic stand-in for the Gemini chat model shared by both pipelines
+#(gemini_client.get_chat_model's counterpart), so they can be exercised without network access or API keys.
+#Re-exported by rag-gemini-pdf/utils/fakes.py next to the embedding and vector store fakes.
+import threading
+import time
+
+
+class FakeResponseChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeChatModel:
+    #Stand-in for genai.GenerativeModel: generate_content returns an object with .text, or with
+    #stream=True an iterator of chunks with .text, like the Gemini SDK.
+    #respond: callable(prompt) -> answer text (default: echo the start of the prompt's question).
+    #first_token_latency / token_latency: seconds before the first chunk and between chunks.
+    #words_per_chunk: how many words each streamed chunk carries.
+    def __init__(self, respond=None, first_token_latency=0.0, token_latency=0.0, words_per_chunk=3):
+        self.respond = respond or self._default_answer
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.words_per_chunk = words_per_chunk
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_answer(prompt):
+        question = prompt.rsplit("Question:", 1)[-1].strip().splitlines()[0] if "Question:" in prompt else prompt[:80]
+        return f"Fake answer to: {question}"
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+        answer = self.respond(prompt)
+        if not stream:
+            if self.first_token_latency or self.token_latency:
+                words = len(answer.split())
+                time.sleep(self.first_token_latency + self.token_latency * max(0, words // self.words_per_chunk))
+            return FakeResponseChunk(answer)
+        return self._stream(answer)
+
+    def _stream(self, answer):
+        words = answer.split(" ")
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for start in range(0, len(words), self.words_per_chunk):
+            if start and self.token_latency:
+                time.sleep(self.token_latency)
+            piece = " ".join(words[start:start + self.words_per_chunk])
+            yield FakeResponseChunk(piece if start + self.words_per_chunk >= len(words) else piece + " ")
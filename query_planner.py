@@ -0,0 +1,122 @@
+#Fan-out query planner: one question over several documents and tables at once.
+#  documents: a single hybrid search over every selected document (one MatchAny filter on document_id
+#             rather than a search per document), then the usual context assembly (context_builder)
+#  tables:    a single route_query call over the combined schema of the selected tables
+#             (metadata.combine_metadata), so the model can JOIN or UNION them in one SQL query
+#The branches run in parallel under one latency budget (PLANNER_LATENCY_BUDGET). Each also has its own
+#timeout (PLANNER_BRANCH_TIMEOUT); a branch that isn't done by then is left out of the answer instead of
+#holding it up (it finishes in the background and its result is dropped). The answer is then generated
+#once, from the document chunks and the SQL result together.
+#Needs rag-gemini-pdf and rag-structured-data on sys.path, as service.py sets up.
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metadata import combine_metadata
+from route_query import route_query
+from telemetry import traced
+from utils.context_builder import build_context
+from utils.gemini_llm import embed_fn, stream_answer
+
+PLANNER_LATENCY_BUDGET = float(os.getenv("PLANNER_LATENCY_BUDGET", "20")) #Seconds for all branches together.
+PLANNER_BRANCH_TIMEOUT = float(os.getenv("PLANNER_BRANCH_TIMEOUT", "15")) #Seconds for any one branch.
+PLANNER_MAX_ROWS = int(os.getenv("PLANNER_MAX_ROWS", "50")) #SQL result rows put in the answer prompt.
+
+_branch_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="planner")
+
+
+def _search_documents(question, document_ids, top_k, token_budget):
+    stats = {}
+    chunks, chunk_ids = build_context(question, embed_fn, top_k=top_k, document_id=document_ids,
+                                      token_budget=token_budget, stats=stats)
+    return {"chunks": chunks, "chunk_ids": chunk_ids, "stats": stats}
+
+
+def _query_tables(question, metadatas):
+    return route_query(question, combine_metadata(metadatas))
+
+
+def table_passage(routed, max_rows=PLANNER_MAX_ROWS):
+    #The tables' answer as a context passage for the answer prompt, or None when there is nothing to add.
+    if not routed or "error" in routed:
+        return None
+    function_call = routed.get("function_call", {})
+    result = routed.get("result")
+    if function_call.get("name") != "execute_sql_query":
+        return f"From the tables: {result}" if result else None
+    rows = result.get("result") if isinstance(result, dict) else None
+    if not isinstance(rows, list) or not rows:
+        return None
+    sql_query = function_call.get("arguments", {}).get("query", "")
+    shown = f"first {max_rows} of {len(rows)} rows" if len(rows) > max_rows else f"{len(rows)} rows"
+    return (f"Result of the SQL query {sql_query} on the uploaded tables ({shown}):\n"
+            f"{json.dumps(rows[:max_rows], default=str)}")
+
+
+@traced("plan_query")
+def fan_out(question, document_ids=None, tables=(), top_k=5, token_budget=None, latency_budget=None,
+            branch_timeout=None, search_documents=True):
+    #Runs the document search and the table query side by side and collects what finished in time.
+    #document_ids: documents to search (None for every indexed document); search_documents=False skips them.
+    #tables: metadata of the tables to query (none skips the table branch).
+    #Returns {"chunks", "chunk_ids", "document_ids", "tables" (route_query result or None), "context"
+    #(context_builder stats) and "branches": {name: {"status": "done" | "timeout" | "error", "seconds"}}}.
+    latency_budget = latency_budget or PLANNER_LATENCY_BUDGET
+    branch_timeout = min(branch_timeout or PLANNER_BRANCH_TIMEOUT, latency_budget)
+    started = time.perf_counter()
+    deadline = started + latency_budget
+
+    futures = {}
+    #Each branch runs in a copy of this context, so its spans are children of plan_query.
+    if search_documents:
+        futures["documents"] = _branch_pool.submit(contextvars.copy_context().run, _search_documents, question,
+                                                   document_ids, top_k, token_budget)
+    if tables:
+        futures["tables"] = _branch_pool.submit(contextvars.copy_context().run, _query_tables, question,
+                                                list(tables))
+
+    plan = {"chunks": [], "chunk_ids": [], "document_ids": [], "tables": None, "context": {}, "branches": {}}
+    results = {}
+    for name, future in futures.items():
+        #All branches started together, so waiting for them one after another still bounds the total.
+        timeout = max(0.0, min(started + branch_timeout, deadline) - time.perf_counter())
+        try:
+            results[name] = future.result(timeout=timeout)
+            status = {"status": "done"}
+        except FutureTimeout:
+            print(f"Query planner: the {name} branch took longer than {time.perf_counter() - started:.1f}s, "
+                  "answering without it")
+            status = {"status": "timeout"}
+        except Exception as e:
+            print(f"Query planner: the {name} branch failed, answering without it: {e}")
+            status = {"status": "error", "error": str(e)}
+        status["seconds"] = time.perf_counter() - started
+        plan["branches"][name] = status
+
+    if "documents" in results:
+        documents = results["documents"]
+        plan.update(chunks=documents["chunks"], chunk_ids=documents["chunk_ids"], context=documents["stats"],
+                    document_ids=documents["stats"]["document_ids"])
+    if "tables" in results:
+        plan["tables"] = results["tables"]
+    return plan
+
+
+def stream_plan_answer(plan, question, stats=None):
+    #Yields one answer from everything fan_out collected, as it is generated (see stream_answer).
+    #stats: optional dict, filled as by stream_answer.
+    stats = {} if stats is None else stats
+    chunks, chunk_ids = list(plan["chunks"]), list(plan["chunk_ids"])
+    passage = table_passage(plan["tables"])
+    if passage is not None:
+        chunks.append(passage)
+        chunk_ids.append(passage) #Identifies the SQL result by its text, so new data gets a new answer.
+    if not chunks:
+        yield "Sorry, none of the selected documents or tables returned anything for this question in time."
+        return
+    #Answers from several documents are cached under all of them, so re-indexing any one drops the answer.
+    document_ids = plan["document_ids"]
+    document_key = document_ids[0] if len(document_ids) == 1 and passage is None else tuple(sorted(document_ids))
+    yield from stream_answer(chunks, question, document_id=document_key, chunk_ids=chunk_ids, stats=stats)
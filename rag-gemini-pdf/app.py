@@ -1,9 +1,13 @@
 import streamlit as st
 import tempfile
 import os
-from utils.document_loader import load_unstructured_file, chunk_text
-from utils.qdrant_client import create_or_get_collection, upload_chunks_to_qdrant, search_similar_chunks
-from utils.gemini_llm import embed_fn, generate_answer
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # telemetry.py, shared by both pipelines
+from utils.qdrant_client import create_or_get_collection, count_document_points, document_registry
+from utils.context_builder import build_context
+from utils.document_registry import file_sha256
+from utils.ingestion import ingest_document
+from utils.gemini_llm import embed_fn, stream_answer, answer_cache
 
 #st.title("📄 Document-based Q&A (PDF, DOCX, PPTX Only)")
 #st.markdown("Upload your **unstructured document**, ask any question related to its content.")
@@ -13,6 +17,10 @@ if 'current_document_id' not in st.session_state:
     st.session_state.current_document_id = None
 if 'uploaded_documents' not in st.session_state:
     st.session_state.uploaded_documents = []
+if 'saved_uploads' not in st.session_state:
+    st.session_state.saved_uploads = {}  # upload id -> temp file path, so reruns don't write the file again
+if 'file_hashes' not in st.session_state:
+    st.session_state.file_hashes = {}  # file path -> content hash, so reruns don't hash the file again
 
 # Check if file was uploaded from main app, otherwise show file uploader
 if 'uploaded_file_path' in st.session_state:
@@ -21,9 +29,13 @@ if 'uploaded_file_path' in st.session_state:
 else:
     uploaded_file = st.file_uploader("Upload DOCX / PDF / PPTX", type=["pdf", "docx", "pptx"])
     if uploaded_file:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[-1]) as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            file_path = tmp_file.name
+        upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+        if upload_id not in st.session_state.saved_uploads:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[-1]) as tmp_file:
+                tmp_file.write(uploaded_file.read())
+            st.session_state.saved_uploads[upload_id] = tmp_file.name
+        file_path = st.session_state.saved_uploads[upload_id]
+        doc_name = uploaded_file.name
         st.success("Document uploaded successfully.")
     else:
         file_path = None
@@ -33,29 +45,53 @@ if file_path:
     # Get document name
     if 'uploaded_file_name' in st.session_state:
         doc_name = st.session_state.uploaded_file_name
-    else:
-        doc_name = f"Document_{len(st.session_state.uploaded_documents) + 1}"
     
-    # Check if document with same name already exists
-    existing_doc = next((doc for doc in st.session_state.uploaded_documents if doc['name'] == doc_name), None)
+    # Check if a document with the same content is already indexed (in this or any earlier session)
+    content_hash = st.session_state.file_hashes.get(file_path)
+    if content_hash is None:
+        content_hash = st.session_state.file_hashes[file_path] = file_sha256(file_path)
+    existing_doc = document_registry.find_by_hash(content_hash)
+    session_ids = {doc['id'] for doc in st.session_state.uploaded_documents}
+    if existing_doc and existing_doc['document_id'] not in session_ids and not count_document_points(existing_doc['document_id']):
+        existing_doc = None  # Registered, but no longer in the collection: index it again
     
     if existing_doc:
-        st.warning(f"📄 Document '{doc_name}' already exists in the knowledge base. Skipping upload.")
-        st.session_state.current_document_id = existing_doc['id']
-        st.info("Using existing document for queries.")
+        st.info(f"📄 '{doc_name}' is already in the knowledge base. Using the existing document for queries.")
+        st.session_state.current_document_id = existing_doc['document_id']
+        if not any(doc['id'] == existing_doc['document_id'] for doc in st.session_state.uploaded_documents):
+            st.session_state.uploaded_documents.append({
+                'id': existing_doc['document_id'],
+                'name': doc_name
+            })
     else:
-        # Step 1: Extract and chunk
-        full_text = load_unstructured_file(file_path)
-        chunks = chunk_text(full_text)
-
-        # Step 2: Qdrant upload (do NOT clear previous document data)
+        # Qdrant upload (do NOT clear previous document data)
         create_or_get_collection(clear_existing=False)
-        document_id = upload_chunks_to_qdrant(chunks, embed_fn)
+
+        # Extract, chunk, embed and upload page by page, showing progress as pages are indexed.
+        # A file with the name of a document uploaded earlier in this session is a new version of it: only
+        # changed chunks are embedded. (Other sessions' documents are never replaced, whatever their name.)
+        previous_version = next(
+            (doc['id'] for doc in st.session_state.uploaded_documents if doc['name'] == doc_name), None
+        )
+        progress_bar = st.progress(0.0, text=f"Indexing '{doc_name}'...")
+
+        def show_progress(progress):
+            if progress["total_pages"]:
+                fraction = min(progress["pages_read"] / progress["total_pages"], 1.0)
+                progress_bar.progress(fraction, text=f"Indexed {progress['chunks_upserted']} chunks from {progress['pages_read']}/{progress['total_pages']} pages")
+            else:
+                progress_bar.progress(0.5, text=f"Indexed {progress['chunks_upserted']} chunks")
+
+        document_id, _ = ingest_document(file_path, embed_fn, document_id=previous_version, progress_callback=show_progress,
+                                         registry=document_registry, name=doc_name, content_hash=content_hash)
+        progress_bar.empty()
+        answer_cache.invalidate_document(document_id)  # Answers from an earlier version may be outdated
         
-        # Store current document ID and add to document list
+        # Store current document ID and add to document list (replacing an earlier version of it)
         st.session_state.current_document_id = document_id
-        
-        # Add to uploaded documents list
+        st.session_state.uploaded_documents = [
+            doc for doc in st.session_state.uploaded_documents if doc['id'] != document_id
+        ]
         st.session_state.uploaded_documents.append({
             'id': document_id,
             'name': doc_name
@@ -71,28 +107,44 @@ if file_path:
 
 # Query interface
 st.subheader("🔍 Ask Questions")
+document_names = {doc['id']: doc['name'] for doc in st.session_state.uploaded_documents}
+selected_documents = st.multiselect(
+    "Search in:", list(document_names), format_func=document_names.get,
+    default=[st.session_state.current_document_id] if st.session_state.current_document_id in document_names else []
+)
 query = st.text_input("Ask a question based on your uploaded documents:")
 
 if query:
     if not st.session_state.uploaded_documents:
         st.warning("Please upload a document first!")
+    elif not selected_documents:
+        st.warning("Please select at least one document to search!")
     else:
         with st.spinner("Searching across your documents..."):
-            # Search only in the current document
-            matched_chunks = search_similar_chunks(
-                query, 
-                embed_fn, 
-                document_id=st.session_state.current_document_id  # Search current document only
+            # Search the selected documents with one query, keeping the best non-redundant chunks within the token budget
+            context_stats = {}
+            matched_chunks, chunk_ids = build_context(
+                query,
+                embed_fn,
+                document_id=selected_documents,
+                stats=context_stats
             )
-            response = generate_answer(matched_chunks, query)
             
         st.subheader("📌 Answer")
-        st.write(response)
+        # Show the answer as it is generated instead of waiting for the full response
+        generation_stats = {}
+        # An answer drawn from several documents is cached under all of them
+        answer_key = selected_documents[0] if len(selected_documents) == 1 else tuple(sorted(selected_documents))
+        st.write_stream(stream_answer(matched_chunks, query, document_id=answer_key,
+                                      chunk_ids=chunk_ids, stats=generation_stats))
+        if generation_stats.get("cached"):
+            st.caption("⚡ Answered from cache")
+        elif generation_stats.get("total_seconds") is not None:
+            st.caption(f"⏱️ First words after {generation_stats['time_to_first_token'] or 0:.1f}s, "
+                       f"complete after {generation_stats['total_seconds']:.1f}s · "
+                       f"{generation_stats['prompt_tokens']} prompt tokens, "
+                       f"{context_stats['context_tokens']}/{context_stats['token_budget']} context tokens "
+                       f"from {context_stats['chunks']} chunks")
         
-        # Show which document was searched
-        current_doc_name = next(
-            (doc['name'] for doc in st.session_state.uploaded_documents 
-             if doc['id'] == st.session_state.current_document_id), 
-            "current document"
-        )
-        st.caption(f"🔍 Searched in: '{current_doc_name}'")
+        # Show which documents were searched
+        st.caption("🔍 Searched in: " + ", ".join(f"'{document_names[document_id]}'" for document_id in selected_documents))
@@ -0,0 +1,76 @@
+#Micro-benchmark: new Chunker vs the previous sentence-splitting chunk_text on multi-MB inputs.
+#Run from rag-gemini-pdf/:  python benchmarks/bench_chunker.py [--sizes-mb 1 4 16] [--max-tokens 300]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #telemetry.py
+from utils.chunker import Chunker
+
+
+def legacy_chunk_text(text, max_tokens=300):
+    #The chunk_text implementation that Chunker replaced, kept here as the baseline.
+    sentences = text.split(". ")
+    chunks, current_chunk = [], ""
+    for sentence in sentences:
+        if len((current_chunk + sentence).split()) <= max_tokens:
+            current_chunk += sentence + ". "
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence + ". "
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def synthetic_text(size_bytes, seed=0):
+    #Manual-like text: numbered headings, paragraphs of 3-8 sentences of 8-25 words.
+    rng = random.Random(seed)
+    words = ["pump", "valve", "pressure", "the", "system", "must", "be", "checked", "before", "operation",
+             "warranty", "clause", "section", "maintenance", "interval", "torque", "sensor", "and", "of", "to"]
+    parts, size, section = [], 0, 0
+    while size < size_bytes:
+        section += 1
+        block = [f"{section}. SECTION TITLE {section}\n"]
+        for _ in range(rng.randint(2, 6)):
+            sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(8, 25))).capitalize() + "."
+                         for _ in range(rng.randint(3, 8))]
+            block.append(" ".join(sentences) + "\n\n")
+        text = "".join(block)
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--overlap-tokens", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'impl':>10} {'seconds':>9} {'MB/s':>8} {'chunks':>7}")
+    for size_mb in args.sizes_mb:
+        text = synthetic_text(int(size_mb * 1024 * 1024))
+        mb = len(text) / (1024 * 1024)
+        runs = [
+            ("legacy", lambda t: legacy_chunk_text(t, args.max_tokens)),
+            ("chunker", lambda t: Chunker(args.max_tokens).chunk_text(t)),
+            ("overlap", lambda t: Chunker(args.max_tokens, args.overlap_tokens).chunk_text(t)),
+        ]
+        for name, fn in runs:
+            seconds, chunks = timed(fn, text)
+            print(f"{mb:>7.1f}M {name:>10} {seconds:>9.3f} {mb / seconds:>8.1f} {len(chunks):>7}")
+
+
+if __name__ == "__main__":
+    main()
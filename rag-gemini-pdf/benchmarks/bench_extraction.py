@@ -0,0 +1,66 @@
+#Benchmark: serial vs parallel PDF text extraction for different numbers of worker processes.
+#Generates a synthetic manual with PyMuPDF (or uses --pdf) and extracts it with 1..N workers.
+#Run from rag-gemini-pdf/:  python benchmarks/bench_extraction.py [--pages 600] [--pdf manual.pdf]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #telemetry.py
+import fitz
+from utils.document_loader import iter_pdf_pages
+
+
+def make_pdf(path, pages, seed=0):
+    #Text-dense pages, similar to a printed technical manual.
+    rng = random.Random(seed)
+    words = ["pump", "valve", "pressure", "the", "system", "must", "be", "checked", "before", "operation",
+             "warranty", "clause", "maintenance", "interval", "torque", "sensor", "and", "of", "to"]
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = f"{page_number + 1}. SECTION {page_number + 1}\n" + " ".join(
+            rng.choice(words) for _ in range(700))
+        page.insert_textbox(fitz.Rect(40, 40, 555, 800), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def worker_counts(max_workers):
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--pdf", help="existing PDF to extract instead of a generated one")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = args.pdf
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "manual.pdf")
+        make_pdf(path, args.pages)
+
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            pages = sum(1 for _ in iter_pdf_pages(path, workers=workers))
+            best = min(best, time.perf_counter() - started)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>9.3f} {pages / best:>9.1f} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#Recall/latency benchmark for search_similar_chunks in vector, lexical and hybrid mode.
+#Uses the local vector store and the fake embedding backend, so no API keys or network are needed.
+#Each synthetic chunk mentions a unique part number and a few topic words. "part" queries ask about one
+#part number in natural language, "topic" queries use some of a chunk's topic words without the part
+#number; a query counts as recalled when its chunk is in the top_k.
+#Run from rag-gemini-pdf/:  python benchmarks/bench_retrieval.py [--chunks 20000] [--queries 200]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+workdir = tempfile.mkdtemp()
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("VECTOR_STORE_PATH", os.path.join(workdir, "vector_store"))
+os.environ.setdefault("BM25_INDEX_PATH", os.path.join(workdir, "bm25_index.db"))
+os.environ.setdefault("DOCUMENT_REGISTRY_PATH", os.path.join(workdir, "document_registry.db"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #telemetry.py
+from utils.fakes import FakeEmbeddingBackend
+from utils.qdrant_client import create_or_get_collection, upload_chunks_to_qdrant, search_chunks
+
+TOPICS = ["corrosion", "lubrication", "calibration", "overheating", "vibration", "leakage", "alignment",
+          "grounding", "filtration", "insulation", "coolant", "firmware", "gasket", "impeller", "actuator",
+          "manifold", "thermostat", "compressor", "regulator", "diaphragm", "solenoid", "bushing", "flange"]
+WORDS = ["pump", "valve", "pressure", "system", "checked", "before", "operation", "warranty", "clause",
+         "maintenance", "interval", "torque", "sensor", "seal", "housing", "bearing", "replace", "inspect"]
+
+
+def part_number(i):
+    return f"PX-{i * 7919 % 100000:05d}"
+
+
+def make_chunks(count, rng):
+    chunks, topics = [], []
+    for i in range(count):
+        chunk_topics = rng.sample(TOPICS, 4)
+        words = [rng.choice(WORDS) for _ in range(60)] + chunk_topics * 2
+        rng.shuffle(words)
+        chunks.append(f"Part {part_number(i)} " + " ".join(words) + ".")
+        topics.append(chunk_topics)
+    return chunks, topics
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per fake embedding request")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    backend = FakeEmbeddingBackend()
+    create_or_get_collection()
+    chunks, topics = make_chunks(args.chunks, rng)
+    document_id = upload_chunks_to_qdrant(chunks, backend)
+
+    slow_backend = FakeEmbeddingBackend(latency=args.embed_latency)
+    targets = rng.sample(range(args.chunks), args.queries)
+    queries = {
+        "part": [(i, f"What is the maintenance interval for part {part_number(i)}?") for i in targets],
+        "topic": [(i, "Notes on " + " and ".join(topics[i])) for i in targets],
+    }
+    print(f"{'queries':>8} {'mode':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for kind, kind_queries in queries.items():
+        for mode in ("vector", "lexical", "hybrid"):
+            hits, latencies = 0, []
+            for i, query in kind_queries:
+                started = time.perf_counter()
+                results = search_chunks(query, slow_backend, top_k=args.top_k, document_id=document_id, mode=mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += any(part_number(i) in payload["text"] for _, _, payload in results)
+            print(f"{kind:>8} {mode:>8} {hits / len(kind_queries):>9.3f} "
+                  f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
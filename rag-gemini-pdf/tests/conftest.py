@@ -0,0 +1,15 @@
+#Imports the pipeline's modules the way app.py does (from rag-gemini-pdf, with the repository root for
+#gemini_client.py and telemetry.py), with the local vector store and every on-disk index and cache in a
+#temporary directory.
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+_data_dir = tempfile.mkdtemp(prefix="pdf-tests-")
+os.environ.setdefault("VECTOR_STORE", "local")
+for name, file_name in (("VECTOR_STORE_PATH", "vector_store"), ("BM25_INDEX_PATH", "bm25_index.db"),
+                        ("DOCUMENT_REGISTRY_PATH", "document_registry.db"),
+                        ("EMBEDDING_CACHE_PATH", "embedding_cache.db")):
+    os.environ.setdefault(name, os.path.join(_data_dir, file_name))
+sys.path[:0] = [os.path.dirname(HERE), os.path.dirname(os.path.dirname(HERE))]
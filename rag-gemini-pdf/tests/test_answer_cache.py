@@ -0,0 +1,39 @@
+import pytest
+
+from utils import gemini_llm
+from utils.answer_cache import AnswerCache
+from utils.fakes import FakeChatModel, FakeEmbeddingBackend
+
+CHUNKS = ["Revenue in 2023 was 4.2 million euros.", "Costs in 2023 were 3.1 million euros."]
+
+
+@pytest.fixture
+def answer_cache(monkeypatch):
+    cache = AnswerCache(similarity_threshold=0.9)
+    embed = FakeEmbeddingBackend()
+    monkeypatch.setattr(gemini_llm, "answer_cache", cache)
+    monkeypatch.setattr(gemini_llm, "embed_fn", lambda texts: embed(texts, task_type="retrieval_query"))
+    return cache
+
+
+def answer(question, model):
+    stats = {}
+    text = "".join(gemini_llm.stream_answer(CHUNKS, question, document_id="report", stats=stats, model=model))
+    return text, stats["cached"]
+
+
+def test_paraphrase_of_the_first_answer_is_a_semantic_hit(answer_cache):
+    model = FakeChatModel()
+    first, cached = answer("What was the total revenue in 2023?", model)
+    assert not cached
+    second, cached = answer("what was total revenue in 2023", model)
+    assert cached and second == first
+    assert model.calls == 1
+    assert answer_cache.stats()["hits_semantic"] == 1
+
+
+def test_unrelated_question_is_not_served_from_the_cache(answer_cache):
+    model = FakeChatModel()
+    answer("What was the total revenue in 2023?", model)
+    _, cached = answer("Which costs went up the most?", model)
+    assert not cached and model.calls == 2
@@ -0,0 +1,41 @@
+import sqlite3
+
+from utils.bm25_index import BM25Index
+
+
+def postings_size(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(rows)), 0) FROM postings").fetchone()
+
+
+def next_row(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT next_row FROM next_rows").fetchone()[0]
+
+
+def test_deleted_chunks_leave_the_postings(tmp_path):
+    db_path = str(tmp_path / "bm25_index.db")
+    index = BM25Index(db_path, compact_dead_fraction=1.0) #Never renumber, to see the postings shrink alone.
+    index.add("docs", "manual", [1, 2, 3], ["pump AB-1234 pressure", "valve pressure limits", "pump seals"],
+              [0, 1, 2])
+    assert postings_size(db_path) == (8, 4 * 10) #One posting per term, 4 bytes per row in it.
+    index.delete("docs", [1, 3])
+    assert postings_size(db_path) == (3, 4 * 3) #valve, pressure and limits, for chunk 2 only.
+    assert index.search("docs", "pump") == []
+    assert [hit[0] for hit in index.search("docs", "pressure")] == [2]
+
+
+def test_rows_are_renumbered_once_most_are_dead(tmp_path):
+    db_path = str(tmp_path / "bm25_index.db")
+    index = BM25Index(db_path)
+    for version in range(5): #A document re-indexed again and again, plus one that stays.
+        index.add("docs", "manual", [f"m{version}-0", f"m{version}-1"],
+                  ["pump pressure", f"valve revision {version}"], [0, 1])
+        if version:
+            index.delete("docs", [f"m{version - 1}-0", f"m{version - 1}-1"])
+    index.add("docs", "spec", ["s0"], ["pump flow rate"], [0])
+    index.delete_document("docs", "manual")
+    assert next_row(db_path) == 1
+    assert postings_size(db_path)[0] == 3 #pump, flow and rate, all for s0
+    hits = index.search("docs", "pump flow")
+    assert [(hit[0], hit[2]["document_id"]) for hit in hits] == [("s0", "spec")]
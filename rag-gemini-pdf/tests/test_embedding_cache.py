@@ -0,0 +1,35 @@
+import sqlite3
+import time
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def disk_keys(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {key for (key,) in conn.execute("SELECT key FROM embeddings")}
+
+
+def test_memory_hits_keep_a_vector_from_disk_eviction(tmp_path):
+    db_path = str(tmp_path / "embedding_cache.db")
+    cache = EmbeddingCache(db_path, max_disk_bytes=40) #Room for two 4-float vectors.
+    cache.put_many([("hot", [1.0, 0.0, 0.0, 0.0])])
+    time.sleep(0.01)
+    cache.put_many([("cold", [0.0, 1.0, 0.0, 0.0])])
+    time.sleep(0.01)
+    assert cache.get_many(["hot"]) == {"hot": [1.0, 0.0, 0.0, 0.0]}
+    assert cache.stats()["hits_memory"] == 1
+    time.sleep(0.01)
+    cache.put_many([("new", [0.0, 0.0, 1.0, 0.0])])
+    assert disk_keys(db_path) == {"hot", "new"}
+
+
+def test_memory_hits_reach_disk_after_touch_seconds(tmp_path):
+    db_path = str(tmp_path / "embedding_cache.db")
+    cache = EmbeddingCache(db_path, touch_seconds=0)
+    cache.put_many([("key", [1.0, 2.0])])
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT last_used FROM embeddings").fetchone()[0]
+    time.sleep(0.01)
+    cache.get_many(["key"])
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT last_used FROM embeddings").fetchone()[0] > stored
@@ -0,0 +1,42 @@
+import queue
+import threading
+
+from utils.ingestion import _StageError, _drain, _run_stage
+
+
+def _stage(items, out_queue, stop):
+    thread = threading.Thread(target=_run_stage, args=(items, out_queue, stop), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_stage_output_ends_with_done():
+    out_queue, stop = queue.Queue(maxsize=1), threading.Event()
+    _stage(iter(range(5)), out_queue, stop)
+    assert list(_drain(out_queue, stop)) == list(range(5))
+
+
+def test_stage_exits_on_stop_with_a_full_queue():
+    def failing():
+        yield "first"
+        raise RuntimeError("extraction failed")
+
+    for items in (iter(["first"]), failing()):
+        out_queue, stop = queue.Queue(maxsize=1), threading.Event()
+        thread = _stage(items, out_queue, stop)
+        thread.join(0.3)
+        assert thread.is_alive() #Waiting to hand over _DONE or the error; nobody reads the queue.
+        stop.set()
+        thread.join(1)
+        assert not thread.is_alive()
+        assert out_queue.get_nowait() == "first"
+
+
+def test_stage_errors_reach_the_consumer():
+    def failing():
+        raise RuntimeError("extraction failed")
+        yield
+
+    out_queue = queue.Queue(maxsize=1)
+    _stage(failing(), out_queue, threading.Event())
+    assert isinstance(out_queue.get(timeout=1), _StageError)
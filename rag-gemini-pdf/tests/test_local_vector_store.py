@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from utils.local_vector_store import LocalVectorStore, request_models as models
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def point(point_id, vector, document_id):
+    return models.PointStruct(id=point_id, vector=vector, payload={"document_id": document_id, "text": str(point_id)})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "vector_store"))
+    store.recreate_collection("docs", models.VectorParams(size=2, distance=models.Distance.COSINE))
+    store.upsert("docs", [point(1, [1.0, 0.0], "a"), point(2, [0.0, 1.0], "b")])
+    return store
+
+
+def document(document_id):
+    return models.Filter(must=[models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))])
+
+
+def test_a_failed_write_leaves_the_collection_unchanged(store):
+    collection = store._collection("docs")
+
+    class FailingConnection:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def executemany(self, sql, rows):
+            list(rows)
+            raise OSError("disk full")
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+    db = collection.db
+    collection.db = FailingConnection(db)
+    with pytest.raises(OSError):
+        store.upsert("docs", [point(3, [1.0, 1.0], "a"), point(2, [1.0, 0.0], "a")])
+    collection.db = db
+    assert store.count("docs").count == 2
+    assert store.count("docs", document("a")).count == 1
+    assert [hit.id for hit in store.search("docs", [0.0, 1.0], limit=1)] == [2]
+    store.upsert("docs", [point(3, [1.0, 1.0], "a")])
+    assert store.count("docs", document("a")).count == 2
+
+
+def test_searches_run_while_a_write_is_in_progress(store):
+    collection = store._collection("docs")
+    hits = []
+    with collection.write_lock: #A writer waiting on a slow commit.
+        searcher = threading.Thread(target=lambda: hits.extend(store.search("docs", [1.0, 0.0], limit=1,
+                                                                              query_filter=document("a"))))
+        searcher.start()
+        searcher.join(5)
+    assert [hit.id for hit in hits] == [1]
+
+
+def test_local_store_works_without_qdrant_client(tmp_path):
+    #The whole local path (collection, upsert, filtered search, payload updates, deletes) with qdrant_client
+    #made unimportable.
+    script = """
+import sys
+sys.modules["qdrant_client"] = None
+sys.path[:0] = sys.argv[1:3]
+from utils import qdrant_client as store
+store.warm_up()
+store.create_or_get_collection()
+ids = store.upsert_chunk_page(["pump pressure", "valve seals"], [[1.0] + [0.0] * 767, [0.0, 1.0] + [0.0] * 766], "doc")
+assert store.count_document_points("doc") == 2
+hits = store.search_chunks("pump", lambda texts: [[1.0] + [0.0] * 767], top_k=1, document_id=["doc"], mode="vector")
+assert hits[0][0] == ids[0], hits
+store.set_chunk_positions([(ids[1], 5, {"page": 2})])
+store.delete_points([ids[0]])
+assert store.count_document_points("doc") == 1
+assert store.fetch_vectors([ids[1]])[ids[1]][1] == 1.0
+print("ok")
+"""
+    env = dict(os.environ, VECTOR_STORE="local", VECTOR_STORE_PATH=str(tmp_path / "vector_store"),
+               BM25_INDEX_PATH=str(tmp_path / "bm25.db"), DOCUMENT_REGISTRY_PATH=str(tmp_path / "registry.db"))
+    result = subprocess.run([sys.executable, "-c", script, os.path.dirname(HERE), os.path.dirname(os.path.dirname(HERE))],
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip().endswith("ok"), result.stderr
@@ -0,0 +1,140 @@
+#Answer cache for generate_answer.
+#An answer is stored under (document_id, retrieved chunk set, normalised question). A later question
+#with the same key is answered instantly; with the semantic tier enabled, a differently worded question
+#over the same document and chunk set is also served when its embedding is close enough to a cached one.
+#Entries expire after a TTL, the least recently used ones are evicted past max_entries, and all answers
+#for a document are dropped when the document is re-indexed (document_id may also be a tuple of ids, for
+#answers drawn from several documents).
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    #Case, repeated whitespace and trailing punctuation don't change the question.
+    return _SPACE_RE.sub(" ", query.strip().lower()).rstrip(" ?!.")
+
+
+def chunk_set_key(chunk_ids):
+    #Order-independent fingerprint of the retrieved chunks.
+    return hashlib.sha256("\x00".join(sorted(str(i) for i in chunk_ids)).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    #ttl_seconds: how long an answer stays valid.
+    #similarity_threshold: minimum cosine similarity between question embeddings for a semantic hit
+    #   (None disables the semantic tier).
+    def __init__(self, max_entries=1000, ttl_seconds=3600, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict() #key -> entry dict
+        self._groups = {} #(document_id, chunk key) -> set of keys, for the semantic scan
+        self._lock = threading.Lock()
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, query, document_id, chunk_ids, embed_query=None):
+        #Returns the cached answer or None.
+        #embed_query: callable() -> query vector, only called when the exact lookup misses and there are
+        #answers for the same chunks to compare with; on a miss, pass the vector to store() anyway (computing
+        #it then if needed), so that later paraphrases can match the new answer.
+        group = (document_id, chunk_set_key(chunk_ids))
+        key = group + (normalize_query(query),)
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None:
+                self.hits_exact += 1
+                return self._serve(key, entry)
+            candidates = list(self._groups.get(group, ()))
+        if self.similarity_threshold is not None and embed_query is not None and candidates:
+            query_vector = _unit(embed_query())
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in candidates:
+                    entry = self._live_entry(candidate)
+                    if entry is None or entry["vector"] is None:
+                        continue
+                    score = float(np.dot(entry["vector"], query_vector))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self.hits_semantic += 1
+                    return self._serve(best_key, self._entries[best_key])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, query, document_id, chunk_ids, answer, seconds, query_vector=None):
+        #seconds: how long generating the answer took, counted as saved time on every later hit.
+        group = (document_id, chunk_set_key(chunk_ids))
+        key = group + (normalize_query(query),)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "seconds": seconds,
+                "created": time.time(),
+                "vector": _unit(query_vector) if query_vector is not None else None,
+            }
+            self._entries.move_to_end(key)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def invalidate_document(self, document_id):
+        #Drops every answer generated from this document's chunks.
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0] == document_id or (isinstance(key[0], tuple) and document_id in key[0])]:
+                del self._entries[key]
+                self._forget(key)
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            self._forget(key)
+            return None
+        return entry
+
+    def _serve(self, key, entry):
+        self._entries.move_to_end(key)
+        self.saved_seconds += entry["seconds"]
+        return entry["answer"]
+
+    def _forget(self, key):
+        group = self._groups.get(key[:2])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[key[:2]]
+
+    def stats(self):
+        hits = self.hits_exact + self.hits_semantic
+        total = hits + self.misses
+        return {
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
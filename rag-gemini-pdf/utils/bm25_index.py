@@ -0,0 +1,298 @@
+#Lexical (BM25) index over the same chunks that go into the vector store.
+#Postings are stored compactly in SQLite as packed uint32 row / uint16 term-frequency arrays, one
+#posting blob per (term, upload batch), and scored with NumPy at query time. This finds exact terms
+#(part numbers, clause ids, names) that dense embeddings tend to miss, and needs no embedding call.
+#Deleting chunks also removes them from the postings that mention them, and once more than
+#compact_dead_fraction of a collection's row numbers belong to deleted chunks the rows are renumbered,
+#so re-indexed documents don't make the index grow for good.
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+#Words and compound tokens such as "AB-1234", "3.2.1" or "v2_final".
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with"
+    .split()
+)
+
+
+def tokenize(text):
+    #Compound tokens are indexed whole and by their parts, so "AB-1234" matches "AB-1234", "ab" and "1234".
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    #k1, b: the usual BM25 parameters (term-frequency saturation and length normalisation).
+    #compact_dead_fraction: share of unused row numbers past which a collection's rows are renumbered.
+    def __init__(self, db_path="bm25_index.db", k1=1.2, b=0.75, compact_dead_fraction=0.25):
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self.compact_dead_fraction = compact_dead_fraction
+        self._lock = threading.Lock()
+        self._lengths = {} #collection -> (lengths array, document_id array), rebuilt after writes.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " collection TEXT NOT NULL,"
+            " row INTEGER NOT NULL,"
+            " point_id TEXT NOT NULL,"
+            " document_id TEXT,"
+            " chunk_index INTEGER,"
+            " length INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " PRIMARY KEY (collection, row))"
+        )
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_point ON chunks(collection, point_id)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chunks_position ON chunks(collection, document_id, chunk_index)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " collection TEXT NOT NULL,"
+            " term TEXT NOT NULL,"
+            " document_id TEXT,"
+            " rows BLOB NOT NULL,"
+            " tfs BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_term ON postings(collection, term)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_document ON postings(collection, document_id)")
+        #Rows are handed out in increasing order; deleted ones are only reused when _compact renumbers them.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS next_rows (collection TEXT PRIMARY KEY, next_row INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def add(self, collection, document_id, point_ids, texts, chunk_indexes):
+        #Indexes one batch of chunks (called for every page the ingestion pipeline upserts).
+        with self._lock:
+            found = self._conn.execute("SELECT next_row FROM next_rows WHERE collection = ?", (collection,)).fetchone()
+            start = found[0] if found else 0
+            self._conn.execute("INSERT OR REPLACE INTO next_rows VALUES (?, ?)", (collection, start + len(point_ids)))
+            chunk_rows, term_rows, term_tfs = [], defaultdict(list), defaultdict(list)
+            for offset, (point_id, text, chunk_index) in enumerate(zip(point_ids, texts, chunk_indexes)):
+                row = start + offset
+                counts = Counter(tokenize(text))
+                chunk_rows.append((collection, row, str(point_id), document_id, chunk_index, sum(counts.values()), text))
+                for term, tf in counts.items():
+                    term_rows[term].append(row)
+                    term_tfs[term].append(min(tf, 65535))
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", chunk_rows)
+            self._conn.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?, ?)",
+                [
+                    (collection, term, document_id,
+                     np.asarray(rows, dtype=np.uint32).tobytes(), np.asarray(term_tfs[term], dtype=np.uint16).tobytes())
+                    for term, rows in term_rows.items()
+                ],
+            )
+            self._conn.commit()
+            self._lengths.pop(collection, None)
+
+    def delete(self, collection, point_ids):
+        #Removed chunks drop out of chunks and out of the postings of their terms (found by tokenizing
+        #their stored text again).
+        point_ids = [str(point_id) for point_id in point_ids]
+        with self._lock:
+            deleted = []
+            for start in range(0, len(point_ids), 500): #Stay below SQLite's bound-parameter limit.
+                part = point_ids[start:start + 500]
+                deleted += self._conn.execute(
+                    f"SELECT row, document_id, text FROM chunks"
+                    f" WHERE collection = ? AND point_id IN ({','.join('?' * len(part))})",
+                    [collection, *part],
+                ).fetchall()
+            if not deleted:
+                return
+            dead = np.asarray([row for row, _, _ in deleted], dtype=np.uint32)
+            terms_by_document = defaultdict(set)
+            for _, document_id, text in deleted:
+                terms_by_document[document_id].update(tokenize(text))
+            for document_id, terms in terms_by_document.items():
+                terms = sorted(terms)
+                for start in range(0, len(terms), 500):
+                    part = terms[start:start + 500]
+                    self._remove_rows(dead, self._conn.execute(
+                        f"SELECT rowid, rows, tfs FROM postings WHERE collection = ? AND document_id IS ?"
+                        f" AND term IN ({','.join('?' * len(part))})",
+                        [collection, document_id, *part],
+                    ).fetchall())
+            self._conn.executemany("DELETE FROM chunks WHERE collection = ? AND row = ?",
+                                   [(collection, row) for row, _, _ in deleted])
+            self._compact(collection)
+            self._conn.commit()
+            self._lengths.pop(collection, None)
+
+    def delete_document(self, collection, document_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE collection = ? AND document_id = ?", (collection, document_id))
+            self._conn.execute("DELETE FROM postings WHERE collection = ? AND document_id = ?", (collection, document_id))
+            self._compact(collection)
+            self._conn.commit()
+            self._lengths.pop(collection, None)
+
+    def _remove_rows(self, dead, postings):
+        #Rewrites the given (rowid, rows, tfs) postings without the dead rows; empty ones are deleted.
+        updates, emptied = [], []
+        for rowid, rows, tfs in postings:
+            rows, tfs = np.frombuffer(rows, dtype=np.uint32), np.frombuffer(tfs, dtype=np.uint16)
+            keep = ~np.isin(rows, dead)
+            if keep.all():
+                continue
+            if keep.any():
+                updates.append((rows[keep].tobytes(), tfs[keep].tobytes(), rowid))
+            else:
+                emptied.append((rowid,))
+        self._conn.executemany("UPDATE postings SET rows = ?, tfs = ? WHERE rowid = ?", updates)
+        self._conn.executemany("DELETE FROM postings WHERE rowid = ?", emptied)
+
+    def _compact(self, collection):
+        #Renumbers the collection's rows 0..n-1 once too many row numbers are unused, so the per-row
+        #arrays built at query time stay as small as the live chunks. Postings are rewritten with the new
+        #numbers (dropping any entries for deleted rows); the relative order of rows doesn't change.
+        found = self._conn.execute("SELECT next_row FROM next_rows WHERE collection = ?", (collection,)).fetchone()
+        size = found[0] if found else 0
+        live = np.asarray([row for (row,) in self._conn.execute(
+            "SELECT row FROM chunks WHERE collection = ? ORDER BY row", (collection,))], dtype=np.int64)
+        if not size or (size - len(live)) / size <= self.compact_dead_fraction:
+            return
+        renumbered = np.full(size, -1, dtype=np.int64)
+        renumbered[live] = np.arange(len(live))
+        #In increasing order every new number is at most the old one and already free.
+        self._conn.executemany("UPDATE chunks SET row = ? WHERE collection = ? AND row = ?",
+                               [(new, collection, int(old)) for new, old in enumerate(live)])
+        updates, emptied = [], []
+        for rowid, rows, tfs in self._conn.execute(
+                "SELECT rowid, rows, tfs FROM postings WHERE collection = ?", (collection,)).fetchall():
+            rows = renumbered[np.frombuffer(rows, dtype=np.uint32)]
+            keep = rows >= 0
+            if keep.any():
+                updates.append((rows[keep].astype(np.uint32).tobytes(),
+                                np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes(), rowid))
+            else:
+                emptied.append((rowid,))
+        self._conn.executemany("UPDATE postings SET rows = ?, tfs = ? WHERE rowid = ?", updates)
+        self._conn.executemany("DELETE FROM postings WHERE rowid = ?", emptied)
+        self._conn.execute("INSERT OR REPLACE INTO next_rows VALUES (?, ?)", (collection, len(live)))
+
+    def clear(self, collection):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+            self._conn.execute("DELETE FROM postings WHERE collection = ?", (collection,))
+            self._conn.execute("DELETE FROM next_rows WHERE collection = ?", (collection,))
+            self._conn.commit()
+            self._lengths.pop(collection, None)
+
+    def set_chunk_indexes(self, collection, moves):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET chunk_index = ? WHERE collection = ? AND point_id = ?",
+                [(chunk_index, collection, str(point_id)) for point_id, chunk_index in moves],
+            )
+            self._conn.commit()
+
+    def _collection_lengths(self, collection):
+        #Chunk lengths indexed by row (-1 for deleted rows) and each row's document_id, cached until the next write.
+        cached = self._lengths.get(collection)
+        if cached is None:
+            rows = self._conn.execute(
+                "SELECT row, length, document_id FROM chunks WHERE collection = ?", (collection,)
+            ).fetchall()
+            found = self._conn.execute("SELECT next_row FROM next_rows WHERE collection = ?", (collection,)).fetchone()
+            size = found[0] if found else 0 #Covers the rows of deleted chunks too, until _compact drops them.
+            lengths = np.full(size, -1.0, dtype=np.float32)
+            documents = np.empty(size, dtype=object)
+            for row, length, document_id in rows:
+                lengths[row] = length
+                documents[row] = document_id
+            cached = self._lengths[collection] = (lengths, documents)
+        return cached
+
+    def search(self, collection, query, limit=10, document_ids=None):
+        #Returns [(point_id, score, payload)] for the best BM25 matches, payload holding text,
+        #document_id and chunk_index like a vector-store hit.
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            lengths, documents = self._collection_lengths(collection)
+            if not len(lengths):
+                return []
+            in_scope = lengths >= 0
+            where, params = "collection = ? AND term IN ({})".format(",".join("?" * len(terms))), [collection, *terms]
+            if document_ids:
+                in_scope &= np.isin(documents, list(document_ids))
+                where += " AND document_id IN ({})".format(",".join("?" * len(document_ids)))
+                params += list(document_ids)
+            postings = defaultdict(list)
+            for term, rows, tfs in self._conn.execute(f"SELECT term, rows, tfs FROM postings WHERE {where}", params):
+                postings[term].append((np.frombuffer(rows, dtype=np.uint32), np.frombuffer(tfs, dtype=np.uint16)))
+
+            n = int(in_scope.sum())
+            if not n or not postings:
+                return []
+            avg_length = float(lengths[in_scope].mean()) or 1.0
+            scores = np.zeros(len(lengths), dtype=np.float32)
+            for term, parts in postings.items():
+                rows = np.concatenate([rows for rows, _ in parts])
+                tfs = np.concatenate([tfs for _, tfs in parts]).astype(np.float32)
+                keep = in_scope[rows]
+                rows, tfs = rows[keep], tfs[keep]
+                if not len(rows):
+                    continue
+                idf = np.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / avg_length)
+                scores[rows] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+            matched = np.flatnonzero(scores)
+            if not len(matched):
+                return []
+            k = min(limit, len(matched))
+            top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            placeholders = ",".join("?" * len(top))
+            details = {
+                row: (point_id, document_id, chunk_index, text)
+                for row, point_id, document_id, chunk_index, text in self._conn.execute(
+                    f"SELECT row, point_id, document_id, chunk_index, text FROM chunks"
+                    f" WHERE collection = ? AND row IN ({placeholders})",
+                    [collection, *(int(row) for row in top)],
+                )
+            }
+        hits = []
+        for row in top:
+            point_id, document_id, chunk_index, text = details[int(row)]
+            payload = {"text": text, "document_id": document_id, "chunk_index": chunk_index}
+            hits.append((int(point_id) if point_id.isdigit() else point_id, float(scores[row]), payload))
+        return hits
+
+    def chunks_at(self, collection, document_id, chunk_indexes):
+        #The chunks of one document at the given positions, as [(point_id, payload)] in chunk_index order
+        #(used to add the neighbours of retrieved chunks to the context).
+        chunk_indexes = sorted({int(i) for i in chunk_indexes})
+        if not chunk_indexes:
+            return []
+        placeholders = ",".join("?" * len(chunk_indexes))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT point_id, chunk_index, text FROM chunks"
+                f" WHERE collection = ? AND document_id = ? AND chunk_index IN ({placeholders}) ORDER BY chunk_index",
+                [collection, document_id, *chunk_indexes],
+            ).fetchall()
+        return [
+            (int(point_id) if point_id.isdigit() else point_id,
+             {"text": text, "document_id": document_id, "chunk_index": chunk_index})
+            for point_id, chunk_index, text in rows
+        ]
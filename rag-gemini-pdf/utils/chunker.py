@@ -0,0 +1,201 @@
+#Linear-time, token-aware chunker.
+#Text is split hierarchically (headings -> paragraphs -> sentences -> words) into small units,
+#each unit's token count is computed exactly once, and units are packed into chunks with a
+#running token total, so the cost is linear in the input size (the old chunk_text re-split the
+#whole chunk for every sentence, which is quadratic in chunk size).
+#Every chunk carries its position: page range and char offsets into the extracted text
+#(the "\n"-joined pages, i.e. what load_unstructured_file returns).
+import re
+from collections import deque, namedtuple
+
+Chunk = namedtuple("Chunk", ["text", "page", "page_end", "char_start", "char_end", "tokens"])
+
+#One piece of text that is never split further unless it is longer than a whole chunk.
+#section_start: the unit is a heading (good place to start a new chunk).
+#paragraph_start: first unit of a paragraph (joined with a blank line instead of a space).
+_Unit = namedtuple("_Unit", ["text", "page", "start", "end", "tokens", "section_start", "paragraph_start"])
+
+_WORD_RE = re.compile(r"\S+")
+_LINE_RE = re.compile(r"[^\n]*\n?")
+#End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace.
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S.*"                                                   #Markdown heading
+    r"|(?:Chapter|CHAPTER|Section|SECTION|Part|PART|Appendix|APPENDIX)\s+\w[\w.]*\b.*" #"Chapter 3", "Section 2.1 ..."
+    r"|\d+(?:\.\d+)*\.?\s+[A-Z].*"                                         #"2.1 Scope"
+    r"|[A-Z][A-Z0-9 &,()/\-]{2,})$"                                        #ALL CAPS line
+)
+
+
+def count_words(text):
+    #Default token counter: whitespace-separated words, the same measure the old chunk_text used.
+    return len(text.split())
+
+
+def tiktoken_counter(encoding_name="cl100k_base"):
+    #Returns a counter based on real BPE tokens. tiktoken is only imported when this is used.
+    import tiktoken
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _is_heading(line):
+    #Short line without closing punctuation that looks like a title.
+    line = line.strip()
+    if not line or len(line) > 120 or len(line.split()) > 12 or line.endswith((".", ",", ";", ":")):
+        return False
+    return bool(_HEADING_RE.match(line))
+
+
+def _blocks(text):
+    #Yields (start, end, is_heading) for every paragraph/heading in text. Paragraphs are runs of
+    #non-blank lines; a heading line always forms its own block.
+    start = end = None
+    pos = 0
+    for match in _LINE_RE.finditer(text):
+        line = match.group()
+        if not line:
+            break
+        line_start, pos = pos, pos + len(line)
+        if not line.strip():
+            if start is not None:
+                yield start, end, False
+                start = None
+        elif _is_heading(line):
+            if start is not None:
+                yield start, end, False
+                start = None
+            yield line_start, line_start + len(line.rstrip()), True
+        else:
+            if start is None:
+                start = line_start
+            end = line_start + len(line.rstrip())
+    if start is not None:
+        yield start, end, False
+
+
+def _sentences(text, start, end):
+    #Yields (start, end) of each sentence in text[start:end].
+    sentence_start = start
+    for match in _SENTENCE_END_RE.finditer(text, start, end):
+        yield sentence_start, match.start() + len(match.group().rstrip())
+        sentence_start = match.end()
+    if sentence_start < end:
+        yield sentence_start, end
+
+
+class Chunker:
+    #max_tokens: upper bound for a chunk, as measured by token_counter.
+    #overlap_tokens: how many tokens from the end of a chunk are repeated at the start of the next one
+    #   (not applied across headings, where a new section starts anyway).
+    #min_tokens: a chunk is only cut early at a heading or paragraph boundary once it holds this many tokens.
+    #token_counter: callable(text) -> int, count_words by default (see tiktoken_counter).
+    def __init__(self, max_tokens=300, overlap_tokens=0, min_tokens=None, token_counter=count_words):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = max_tokens // 2 if min_tokens is None else min_tokens
+        self.token_counter = token_counter
+
+    def chunk_text(self, text):
+        return list(self.iter_chunks([(None, text)]))
+
+    def iter_chunks(self, pages):
+        #pages: iterable of (page_number, text) as produced by iter_unstructured_file.
+        #Yields Chunk tuples; units are packed as they arrive, so a document is never held whole in memory.
+        units = deque()
+        total = 0
+
+        def emit(count, overlap_budget=0):
+            #Emits the first `count` units as one chunk. Up to overlap_budget tokens from its end are put
+            #back in front of the remaining units, so they are repeated at the start of the next chunk.
+            nonlocal total
+            taken = [units.popleft() for _ in range(count)]
+            total -= sum(u.tokens for u in taken)
+            overlap_budget = min(overlap_budget, self.overlap_tokens)
+            for unit in reversed(taken[1:]):
+                if unit.tokens > overlap_budget:
+                    break
+                units.appendleft(unit._replace(section_start=False, paragraph_start=False))
+                overlap_budget -= unit.tokens
+                total += unit.tokens
+            return self._make_chunk(taken)
+
+        offset = 0
+        for page, text in pages:
+            for unit in self._units(page, text, offset):
+                if units and unit.section_start and total >= self.min_tokens:
+                    #Prefer to start a new chunk at a heading (no overlap into a new section).
+                    yield emit(len(units))
+                elif units and total + unit.tokens > self.max_tokens:
+                    #Over budget: cut at the last paragraph boundary if that keeps the chunk big enough,
+                    #otherwise right before this unit.
+                    cut, running, kept = len(units), 0, 0
+                    for i, u in enumerate(units):
+                        if i and u.paragraph_start and running >= self.min_tokens:
+                            cut, kept = i, total - running
+                        running += u.tokens
+                    overlap_budget = 0 if unit.section_start else self.max_tokens - kept - unit.tokens
+                    yield emit(cut, overlap_budget)
+                    if units and total + unit.tokens > self.max_tokens:
+                        #The units left after the paragraph cut still do not fit with this one.
+                        yield emit(len(units))
+                units.append(unit)
+                total += unit.tokens
+            offset += len(text) + 1 #+1 for the "\n" that joins pages in load_unstructured_file.
+        if units:
+            yield emit(len(units))
+
+    def _units(self, page, text, offset):
+        for start, end, is_heading in _blocks(text):
+            if is_heading:
+                #A heading is its own unit and marks where a new chunk should preferably start.
+                yield _Unit(text[start:end], page, offset + start, offset + end,
+                            self.token_counter(text[start:end]), True, True)
+                continue
+            paragraph_start = True
+            for s_start, s_end in _sentences(text, start, end):
+                sentence = text[s_start:s_end]
+                tokens = self.token_counter(sentence)
+                if tokens <= self.max_tokens:
+                    yield _Unit(sentence, page, offset + s_start, offset + s_end, tokens, False, paragraph_start)
+                else:
+                    for piece in self._split_words(page, text, s_start, s_end, offset):
+                        yield piece._replace(paragraph_start=paragraph_start)
+                        paragraph_start = False
+                paragraph_start = False
+
+    def _split_words(self, page, text, start, end, offset):
+        #Last resort for a "sentence" longer than a whole chunk (tables, lists without punctuation).
+        piece_start = piece_end = None
+        piece_tokens = 0
+        for match in _WORD_RE.finditer(text, start, end):
+            tokens = self.token_counter(match.group())
+            if piece_start is not None and piece_tokens + tokens > self.max_tokens:
+                yield _Unit(text[piece_start:piece_end], page, offset + piece_start, offset + piece_end,
+                            piece_tokens, False, False)
+                piece_start = None
+            if piece_start is None:
+                piece_start, piece_tokens = match.start(), 0
+            piece_end = match.end()
+            piece_tokens += tokens
+        if piece_start is not None:
+            yield _Unit(text[piece_start:piece_end], page, offset + piece_start, offset + piece_end,
+                        piece_tokens, False, False)
+
+    @staticmethod
+    def _make_chunk(units):
+        parts = []
+        for i, unit in enumerate(units):
+            if i:
+                parts.append("\n\n" if unit.paragraph_start else " ")
+            parts.append(unit.text)
+        return Chunk(
+            text="".join(parts),
+            page=units[0].page,
+            page_end=units[-1].page,
+            char_start=units[0].start,
+            char_end=units[-1].end,
+            tokens=sum(u.tokens for u in units),
+        )
@@ -0,0 +1,185 @@
+#Context assembly between retrieval and answer generation: the prompt gets the most useful text that
+#fits a token budget instead of whatever the search returned.
+#  over-fetched hits -> near-duplicates dropped (MinHash over word shingles)
+#  -> MMR rerank (relevance to the question vs. similarity to chunks already chosen, on stored vectors)
+#  -> up to top_k chunks that fit the budget -> their neighbours (chunk_index +-1, ...) while budget is left
+#  -> the chosen chunks in document order
+#Tokens are counted like the chunker counts them (count_words), which is what the token_count payload holds.
+import functools
+import os
+import time
+
+import numpy as np
+
+from utils.chunker import count_words
+from utils.qdrant_client import fetch_vectors, neighbour_chunks, search_chunks
+from telemetry import traced
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")) #Context tokens per answer.
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "30")) #Hits fetched before dedup and rerank.
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")) #1 = relevance only, 0 = diversity only.
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8")) #Estimated Jaccard similarity.
+CONTEXT_NEIGHBOURS = int(os.getenv("CONTEXT_NEIGHBOURS", "1")) #Chunks on each side of a chosen chunk.
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 64
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0)
+_PERMUTATION_A = _rng.integers(1, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def chunk_tokens(payload):
+    return payload.get("token_count") or count_words(payload["text"])
+
+
+@functools.lru_cache(maxsize=4096)
+def minhash(text):
+    #MinHash signature of the text's word shingles. Signatures are only compared within one process,
+    #so Python's (per-process salted) string hash is good enough and much faster than a digest.
+    #Cached: the same chunks come back for related questions.
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((hash(shingle) & 0xFFFFFFFF for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_PERMUTATION_A[:, None] * hashes[None, :] + _PERMUTATION_B[:, None]) % _PRIME).min(axis=1)
+
+
+def estimated_jaccard(signature, others):
+    #Estimated Jaccard similarity of signature to each row of others.
+    return (np.asarray(others) == signature).mean(axis=1)
+
+
+def is_near_duplicate(signature, others, threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    return bool(others) and float(estimated_jaccard(signature, others).max()) >= threshold
+
+
+def drop_near_duplicates(hits, threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    #Keeps the first (best ranked) of every group of near-identical chunks: repeated boilerplate,
+    #the same paragraph in two versions of a document, overlapping chunks.
+    #Returns (kept hits, their signatures, number dropped).
+    kept, signatures = [], []
+    for hit in hits:
+        signature = minhash(hit[2]["text"])
+        if is_near_duplicate(signature, signatures, threshold):
+            continue
+        kept.append(hit)
+        signatures.append(signature)
+    return kept, signatures, len(hits) - len(kept)
+
+
+def _unit_rows(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_order(query_vector, vectors, lambda_=CONTEXT_MMR_LAMBDA):
+    #Maximal marginal relevance: repeatedly picks the candidate that is most similar to the question
+    #and least similar to the candidates picked so far. The first candidate (the search's best hit, which
+    #may be an exact match on an identifier the embeddings rank low) always stays first.
+    #vectors: one per candidate (a zero vector for a candidate without one). Returns candidate positions.
+    if len(vectors) <= 2:
+        return list(range(len(vectors)))
+    matrix = _unit_rows(vectors)
+    relevance = matrix @ _unit_rows([query_vector])[0]
+    similarity = matrix @ matrix.T
+    selected, remaining = [0], list(range(1, len(vectors)))
+    redundancy = similarity[remaining, 0]
+    while remaining:
+        best = int(np.argmax(lambda_ * relevance[remaining] - (1.0 - lambda_) * redundancy))
+        selected.append(remaining.pop(best))
+        redundancy = np.delete(redundancy, best)
+        if remaining:
+            redundancy = np.maximum(redundancy, similarity[remaining, selected[-1]])
+    return selected
+
+
+@traced("assemble_context")
+def build_context(query, embed_fn, collection_name="doc_chunks", top_k=5, document_id=None, token_budget=None,
+                  candidates=None, neighbours=None, stats=None):
+    #Returns (chunk texts, point ids) for the answer prompt, in document order.
+    #token_budget: context tokens at most (default CONTEXT_TOKEN_BUDGET); top_k: retrieved chunks at most,
+    #   before neighbours are added.
+    #document_id: one document, a list of documents or None for all (see search_chunks).
+    #stats: optional dict, filled with candidates, duplicates, chunks, neighbours, context_tokens,
+    #   token_budget, context_seconds and document_ids (the documents the chunks come from).
+    stats = {} if stats is None else stats
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    candidates = max(top_k, candidates or CONTEXT_CANDIDATES)
+    neighbours = CONTEXT_NEIGHBOURS if neighbours is None else neighbours
+    started = time.perf_counter()
+
+    #1. Over-fetch, keeping the vectors the vector search returns
+    vectors = {}
+    hits = search_chunks(query, embed_fn, collection_name, candidates, document_id, candidates=candidates,
+                         vectors=vectors)
+    hits, signatures, duplicates = drop_near_duplicates(hits)
+
+    #2. Rerank. Without any vector (the vector search timed out) the search order is kept.
+    order = list(range(len(hits)))
+    if vectors:
+        missing = [point_id for point_id, _, _ in hits if point_id not in vectors]
+        vectors.update(fetch_vectors(missing, collection_name))
+        dim = len(next(iter(vectors.values())))
+        query_vector = embed_fn([query])[0] #Served from the embedding cache: the vector search embedded it.
+        order = mmr_order(query_vector, [vectors.get(point_id) or [0.0] * dim for point_id, _, _ in hits])
+
+    #3. Pack the best chunks into the budget
+    chosen, chosen_signatures, used = {}, [], 0
+    primaries = []
+    for position in order:
+        if len(primaries) == top_k:
+            break
+        point_id, _, payload = hits[position]
+        tokens = chunk_tokens(payload)
+        if used + tokens > token_budget and primaries:
+            continue #The best chunk is always used, even when it alone is over the budget.
+        chosen[point_id] = payload
+        chosen_signatures.append(signatures[position])
+        primaries.append(payload)
+        used += tokens
+
+    #4. Fill what is left of the budget with the chunks around them, nearest and best ranked first
+    added = 0
+    for distance in range(1, neighbours + 1):
+        wanted = {}
+        for payload in primaries:
+            if payload.get("chunk_index") is not None:
+                wanted.setdefault(payload["document_id"], []).extend(
+                    (payload["chunk_index"] - distance, payload["chunk_index"] + distance))
+        for neighbour_document, positions in wanted.items():
+            found = dict((payload["chunk_index"], (point_id, payload)) for point_id, payload in
+                         neighbour_chunks(neighbour_document, positions, collection_name))
+            for chunk_index in positions:
+                point_id, payload = found.get(chunk_index, (None, None))
+                if payload is None or point_id in chosen:
+                    continue
+                tokens = chunk_tokens(payload)
+                if used + tokens > token_budget:
+                    continue
+                signature = minhash(payload["text"])
+                if is_near_duplicate(signature, chosen_signatures):
+                    continue
+                chosen[point_id] = payload
+                chosen_signatures.append(signature)
+                used += tokens
+                added += 1
+
+    #5. Document order: documents by their best chunk, chunks by position
+    document_rank = {}
+    for payload in primaries:
+        document_rank.setdefault(payload.get("document_id"), len(document_rank))
+    ordered = sorted(chosen.items(), key=lambda item: (document_rank.get(item[1].get("document_id"), len(document_rank)),
+                                                         item[1].get("chunk_index") is None,
+                                                         item[1].get("chunk_index") or 0))
+    stats.update(
+        candidates=len(hits) + duplicates,
+        duplicates=duplicates,
+        chunks=len(ordered),
+        neighbours=added,
+        context_tokens=used,
+        token_budget=token_budget,
+        context_seconds=time.perf_counter() - started,
+        document_ids=list(document_rank),
+    )
+    return [payload["text"] for _, payload in ordered], [point_id for point_id, _ in ordered]
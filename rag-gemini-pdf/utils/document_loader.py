@@ -1,8 +1,12 @@
-import fitz  # PyMuPDF-used to read and extract text from PDF
-import docx #from python-docx library used to read DOCX files 
-from pptx import Presentation # From python-pptx library; used to load PowerPoint files and access slide contents.
+#The format libraries (PyMuPDF, python-docx, python-pptx) are imported by the functions that read that
+#format, so a process only loads the ones for the files it actually opens.
 import os #Standard Python module for handling file paths and extensions.
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.chunker import Chunker, count_words
+from telemetry import traced
 
+@traced("load_unstructured_file")
 def load_unstructured_file(file_path):
     #Splits the file path into (filename, extension)
     ext = os.path.splitext(file_path)[1].lower() #[1].lower(): Extracts the extension (e.g., .pdf) and converts it to lowercase for consistency.
@@ -15,40 +19,155 @@ def load_unstructured_file(file_path):
     else: #if not a supported file structure, returns empty string
         return ""
 
+def iter_unstructured_file(file_path):
+    #Streaming version of load_unstructured_file: yields (page_number, text) one page/slide at a time
+    #so large documents never have to be held in memory as a single string.
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        return iter_pdf_pages(file_path)
+    elif ext == ".docx":
+        return iter_docx_paragraphs(file_path)
+    elif ext == ".pptx":
+        return iter_pptx_slides(file_path)
+    else:
+        return iter(())
+
+def count_pages(file_path):
+    #Number of pages/slides, used to report ingestion progress. None when the format has no pages (DOCX).
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        import fitz
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    elif ext == ".pptx":
+        from pptx import Presentation
+        return len(Presentation(file_path).slides)
+    return None
+
+# Parallel extraction: page ranges are sharded across a process pool, each worker opens its own
+# document handle, and shards are yielded back in page order. Small files stay on the serial path,
+# where starting worker processes would cost more than it saves.
+PARALLEL_MIN_PAGES = 64 #PDFs with fewer pages are extracted serially.
+PARALLEL_MIN_SLIDES = 200 #Every worker re-parses the whole PPTX, so it only pays off for big decks.
+
+
+def extraction_workers(workers=None):
+    #Number of worker processes: the argument, else EXTRACTION_WORKERS, else one per CPU core.
+    if workers is None:
+        workers = int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1))
+    return max(1, workers)
+
+
+def _iter_sharded(file_path, page_count, extract_range, workers):
+    #Splits [0, page_count) into shards (about 4 per worker so fast workers pick up more work),
+    #keeps at most 2 shards per worker in flight and yields each shard's pages in order.
+    shard_size = max(8, -(-page_count // (workers * 4)))
+    shards = iter(range(0, page_count, shard_size))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def submit_next():
+            start = next(shards, None)
+            if start is not None:
+                pending.append(pool.submit(extract_range, file_path, start, min(start + shard_size, page_count)))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+
+
+def _pdf_page_range(file_path, start, stop):
+    #Runs in a worker process: opens its own fitz handle and extracts pages [start, stop).
+    import fitz
+    with fitz.open(file_path) as doc:
+        return [(page_number + 1, doc[page_number].get_text()) for page_number in range(start, stop)]
+
+
+def _pptx_slide_text(slide):
+    texts = []
+    for shape in slide.shapes:#Iterates through each shape on the slide (like textbox, title, etc.).
+        if hasattr(shape, "text"):#Some shapes may not have text; this safely checks if text exists.
+            texts.append(shape.text)#Collects text from valid shapes.
+    return "\n".join(texts) if texts else None
+
+
+def _pptx_slide_range(file_path, start, stop):
+    #Runs in a worker process: loads the deck and extracts slides [start, stop) that have text.
+    from pptx import Presentation
+    slides = Presentation(file_path).slides
+    pages = []
+    for slide_number in range(start, stop):
+        text = _pptx_slide_text(slides[slide_number])
+        if text is not None:
+            pages.append((slide_number + 1, text))
+    return pages
+
+
+def iter_pdf_pages(file_path, workers=None):
+    import fitz  # PyMuPDF-used to read and extract text from PDF
+    workers = extraction_workers(workers)
+    with fitz.open(file_path) as doc: # Opens the PDF using PyMuPDF.
+        if workers > 1 and doc.page_count >= PARALLEL_MIN_PAGES:
+            page_count = doc.page_count
+        else:
+            for page_number, page in enumerate(doc, start=1):
+                yield page_number, page.get_text() #page.get_text(): Extracts all text from each page.
+            return
+    yield from _iter_sharded(file_path, page_count, _pdf_page_range, workers)
+
+def iter_docx_paragraphs(file_path):
+    #DOCX is one XML document, so it is always read serially: every worker would have to parse all of it.
+    import docx #from python-docx library used to read DOCX files
+    doc = docx.Document(file_path) #Opens the Word document.
+    for p in doc.paragraphs: #Loops through each paragraph and extracts the text.
+        yield None, p.text #DOCX files have no fixed pages, so the page number is None.
+
+def iter_pptx_slides(file_path, workers=None):
+    from pptx import Presentation # From python-pptx library; used to load PowerPoint files and access slide contents.
+    workers = extraction_workers(workers)
+    prs = Presentation(file_path)
+    if workers > 1 and len(prs.slides) >= PARALLEL_MIN_SLIDES:
+        slide_count = len(prs.slides)
+        del prs
+        yield from _iter_sharded(file_path, slide_count, _pptx_slide_range, workers)
+        return
+    for slide_number, slide in enumerate(prs.slides, start=1):
+        text = _pptx_slide_text(slide)
+        if text is not None:
+            yield slide_number, text
+
 def extract_text_from_pdf(file_path):
-    doc = fitz.open(file_path) # Opens the PDF using PyMuPDF.
-    text = "\n".join(page.get_text() for page in doc)
-    #page.get_text(): Extracts all text from each page.
+    return "\n".join(text for _, text in iter_pdf_pages(file_path))
     #"\n".join(...): Joins text from all pages with newlines to 
     # create a single string of the full document content.
-    return text
 
 def extract_text_from_docx(file_path):
-    doc = docx.Document(file_path) #Opens the Word document.
-    return "\n".join([p.text for p in doc.paragraphs])#Loops through each paragraph and extracts the text.
+    return "\n".join(text for _, text in iter_docx_paragraphs(file_path))
     #"\n".join(...): Combines all paragraph texts into a single string with line breaks.
 
 
 def extract_text_from_pptx(file_path):
-    prs = Presentation(file_path)
-    texts = []#Initializes an empty list to collect texts from all slides.
-    for slide in prs.slides:
-        for shape in slide.shapes:#Iterates through each slide and each shape (like textbox, title, etc.).
-            if hasattr(shape, "text"):#Some shapes may not have text; this safely checks if text exists.
-                texts.append(shape.text)#Collects text from valid shapes.
-    return "\n".join(texts) #Combines all extracted slide texts into one big string separated by line breaks.
-
-
-# Sentence-based Fixed-size Chunking
-def chunk_text(text, max_tokens=300):
-    sentences = text.split(". ") #Splits the full text into sentences using . as the separator.
-    chunks, current_chunk = [], ""
-    for sentence in sentences:
-        if len((current_chunk + sentence).split()) <= max_tokens:
-            current_chunk += sentence + ". "
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + ". "
-    if current_chunk:
-        chunks.append(current_chunk.strip())#.strip() removes leading/trailing spaces.
-    return chunks
+    return "\n".join(text for _, text in iter_pptx_slides(file_path)) #Combines all extracted slide texts into one big string separated by line breaks.
+
+
+# Token-aware chunking (headings -> paragraphs -> sentences), linear in the size of the text.
+# See utils/chunker.py; max_tokens is counted in words unless a token_counter is given.
+@traced("chunk_text")
+def chunk_text(text, max_tokens=300, overlap_tokens=0):
+    return [chunk.text for chunk in Chunker(max_tokens, overlap_tokens).chunk_text(text)]
+
+
+def iter_chunk_records(pages, max_tokens=300, overlap_tokens=0, token_counter=count_words):
+    #Incremental chunking for the streaming pipeline.
+    #pages: iterable of (page_number, text) as produced by iter_unstructured_file.
+    #Yields Chunk tuples (text, page, page_end, char_start, char_end, tokens); a chunk can span pages.
+    return Chunker(max_tokens, overlap_tokens, token_counter=token_counter).iter_chunks(pages)
+
+
+def iter_chunks(pages, max_tokens=300, overlap_tokens=0):
+    #Same as iter_chunk_records, but yields only the chunk texts.
+    for chunk in iter_chunk_records(pages, max_tokens, overlap_tokens):
+        yield chunk.text
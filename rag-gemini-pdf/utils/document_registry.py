@@ -0,0 +1,112 @@
+#Persistent registry of indexed documents.
+#Documents are keyed on the SHA-256 of the file bytes and every chunk on the SHA-256 of its text,
+#so re-uploading identical content is a single lookup, and re-uploading an edited document
+#only has to embed the chunks whose text changed (see ingest_document in utils/ingestion.py).
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    #Hashes the file in blocks so large uploads are never read into memory at once.
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentRegistry:
+    #One row per document (content hash, display name, chunk count) and one row per chunk
+    #(chunk hash and the id of its point in the vector store).
+    def __init__(self, db_path="document_registry.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " document_id TEXT PRIMARY KEY,"
+            " name TEXT,"
+            " content_hash TEXT NOT NULL,"
+            " chunk_count INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_name ON documents(name)")
+        #point_id is stored as TEXT because vector-store ids are unsigned 64-bit integers,
+        #which do not fit SQLite's signed INTEGER.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " document_id TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL,"
+            " chunk_hash TEXT NOT NULL,"
+            " point_id TEXT NOT NULL,"
+            " PRIMARY KEY (document_id, chunk_index))"
+        )
+        self._conn.commit()
+
+    def _document(self, where, value):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT document_id, name, content_hash, chunk_count, updated_at FROM documents WHERE {where} = ?"
+                " ORDER BY updated_at DESC LIMIT 1",
+                (value,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("document_id", "name", "content_hash", "chunk_count", "updated_at"), row))
+
+    def find_by_hash(self, content_hash):
+        #The indexed document with exactly these bytes, or None.
+        return self._document("content_hash", content_hash)
+
+    def find_by_id(self, document_id):
+        return self._document("document_id", document_id)
+
+    def list_documents(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT document_id, name, content_hash, chunk_count, updated_at FROM documents ORDER BY updated_at"
+            ).fetchall()
+        return [dict(zip(("document_id", "name", "content_hash", "chunk_count", "updated_at"), row)) for row in rows]
+
+    def chunk_points(self, document_id):
+        #{chunk_hash: [(point_id, chunk_index), ...]} for a document; a list because the same text
+        #can occur more than once in a document.
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_hash, point_id, chunk_index FROM chunks WHERE document_id = ? ORDER BY chunk_index DESC",
+                (document_id,),
+            ).fetchall()
+        points = {}
+        for chunk_hash, point_id, chunk_index in rows:
+            points.setdefault(chunk_hash, []).append((int(point_id), chunk_index))
+        return points
+
+    def save_document(self, document_id, name, content_hash, chunks):
+        #chunks: list of (chunk_index, chunk_hash, point_id) describing the document's current points.
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            self._conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [(document_id, index, chunk_hash, str(point_id)) for index, chunk_hash, point_id in chunks],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (document_id, name, content_hash, len(chunks), time.time()),
+            )
+            self._conn.commit()
+
+    def forget(self, document_id):
+        #Drops a document whose points are no longer in the vector store (e.g. the collection was recreated).
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._conn.commit()
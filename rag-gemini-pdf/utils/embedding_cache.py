@@ -0,0 +1,181 @@
+#Content-addressed embedding cache.
+#Vectors are keyed on sha256(model, task_type, text), so the same chunk or question
+#is only ever sent to the embedding API once. Lookups go through an in-process LRU
+#first and then an on-disk SQLite tier that survives restarts. Memory hits are written through to the
+#disk tier's last_used in batches, so disk eviction sees which vectors are really in use.
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+def make_cache_key(model, task_type, text):
+    #\x00 separators so ("a", "bc") and ("ab", "c") can never hash to the same key.
+    return hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    #memory_items: how many vectors the in-process LRU keeps.
+    #max_disk_bytes: size limit for the SQLite tier; least recently used vectors are evicted past it.
+    #touch_seconds: how often last_used is updated on disk for vectors served from memory (and always
+    #   before an eviction, or once 1000 of them are pending).
+    def __init__(self, db_path="embedding_cache.db", memory_items=10000, max_disk_bytes=512 * 1024 * 1024,
+                 touch_seconds=60):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.touch_seconds = touch_seconds
+        self._memory = OrderedDict()
+        self._touched = {} #key -> time of its last memory hit, not yet written to disk
+        self._touched_flushed = time.time()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        #Returns {key: vector} for every key that is cached in either tier.
+        found = {}
+        disk_keys = []
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self._touched[key] = now
+                    self.hits_memory += 1
+                else:
+                    disk_keys.append(key)
+            if self._touched and (len(self._touched) >= 1000 or now - self._touched_flushed >= self.touch_seconds):
+                self._flush_touched()
+                self._conn.commit()
+
+            if disk_keys:
+                #SQLite limits the number of bound parameters, so look keys up in slices.
+                for start in range(0, len(disk_keys), 500):
+                    part = disk_keys[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f")
+                        vector.frombytes(blob)
+                        vector = vector.tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if rows:
+                        self._conn.executemany(
+                            "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key, _ in rows]
+                        )
+                        self.hits_disk += len(rows)
+                self._conn.commit()
+                self.misses += sum(1 for key in disk_keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        #items: list of (key, vector) pairs.
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, list(vector))
+                blob = array("f", vector).tobytes()
+                rows.append((key, blob, len(blob), now))
+            existing = 0
+            for start in range(0, len(rows), 500):
+                part = [row[0] for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(part))
+                existing += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._disk_bytes += sum(row[2] for row in rows) - existing
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def get_or_compute(self, model, task_type, texts, compute):
+        #compute: callable(list of texts) -> list of vectors, only called for cache misses.
+        texts = list(texts)
+        keys = [make_cache_key(model, task_type, t) for t in texts]
+        found = self.get_many(keys)
+
+        #Embed each missing text once, even if it appears several times in the input.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = compute(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.put_many(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        #Writes pending memory hits to last_used (the caller commits).
+        self._conn.executemany("UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE key = ?",
+                               [(used, key) for key, used in self._touched.items()])
+        self._touched.clear()
+        self._touched_flushed = time.time()
+
+    def _evict(self):
+        #Drop least recently used vectors until the disk tier is back to 90% of its limit.
+        self._flush_touched()
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            dropped = []
+            for key, size in rows:
+                dropped.append((key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", dropped)
+            self.evictions += len(dropped)
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
@@ -0,0 +1,99 @@
+#Batched, concurrent embedding engine.
+#Instead of one embedding request per chunk, chunks are grouped into batches,
+#a bounded number of batches are sent at the same time, rate-limit errors are
+#retried with exponential backoff, and vectors come back in the same order as the input texts.
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def is_rate_limit_error(e):
+    #Gemini raises google.api_core.exceptions.ResourceExhausted (HTTP 429) when the quota is hit.
+    #We check by name/message so this module does not need google-api-core to be importable.
+    name = type(e).__name__
+    message = str(e).lower()
+    return (
+        name in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable")
+        or "429" in message
+        or "rate limit" in message
+        or "resource has been exhausted" in message
+    )
+
+
+class EmbeddingEngine:
+    #backend: callable(texts, task_type) -> list of vectors (one request for the whole list).
+    #batch_size: how many texts go into one backend request (Gemini allows up to 100).
+    #max_in_flight: how many batch requests can be running at the same time.
+    def __init__(self, backend, batch_size=100, max_in_flight=4, max_retries=5, base_delay=1.0, max_delay=30.0):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.last_stats = {}
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    def embed(self, texts, task_type="retrieval_document"):
+        texts = list(texts)
+        if not texts:
+            return []
+
+        started = time.perf_counter()
+        #Split the input into (start offset, batch) pairs so results can be put back in input order.
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+        vectors = [None] * len(texts)
+        retries = []
+
+        def run(batch):
+            start, batch_texts = batch
+            batch_vectors, batch_retries = self._embed_batch(batch_texts, task_type)
+            retries.append(batch_retries)
+            return start, batch_vectors
+
+        if len(batches) == 1:
+            results = [run(batches[0])]
+        else:
+            #The pool size bounds how many requests are in flight at once.
+            with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as pool:
+                results = list(pool.map(run, batches))
+
+        for start, batch_vectors in results:
+            vectors[start:start + len(batch_vectors)] = batch_vectors
+
+        elapsed = time.perf_counter() - started
+        self.total_chunks += len(texts)
+        self.total_seconds += elapsed
+        self.last_stats = {
+            "chunks": len(texts),
+            "batches": len(batches),
+            "retries": sum(retries),
+            "seconds": elapsed,
+            "chunks_per_sec": len(texts) / elapsed if elapsed > 0 else float("inf"),
+        }
+        return vectors
+
+    def _embed_batch(self, batch_texts, task_type):
+        attempt = 0
+        while True:
+            try:
+                batch_vectors = self.backend(batch_texts, task_type)
+                if len(batch_vectors) != len(batch_texts):
+                    raise ValueError(f"Embedding backend returned {len(batch_vectors)} vectors for {len(batch_texts)} texts")
+                return batch_vectors, attempt
+            except Exception as e:
+                if attempt >= self.max_retries or not is_rate_limit_error(e):
+                    raise
+                #Exponential backoff with jitter so parallel batches don't retry in lockstep.
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                print(f"Embedding rate limited ({e}). Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                attempt += 1
+
+    def throughput(self):
+        #Average chunks/sec over everything this engine has embedded so far.
+        if self.total_seconds <= 0:
+            return 0.0
+        return self.total_chunks / self.total_seconds
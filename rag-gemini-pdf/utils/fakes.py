@@ -0,0 +1,70 @@
+#Local, deterministic stand-ins for the remote services so the pipeline can be
+#exercised without network access or API keys.
+import hashlib
+import math
+import re
+import threading
+import time
+
+from gemini_fakes import FakeChatModel, FakeResponseChunk #The chat model fake, shared with the structured pipeline
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class FakeRateLimitError(Exception):
+    #Looks like the 429 error Gemini returns when the quota is exhausted.
+    pass
+
+
+class FakeEmbeddingBackend:
+    #Drop-in replacement for the Gemini embedding backend used by EmbeddingEngine.
+    #Vectors are hashed bag-of-words, so texts sharing words get similar vectors.
+    #latency: seconds slept per request, to simulate network round trips.
+    #rate_limit_every: raise a fake 429 on every Nth request (0 = never).
+    def __init__(self, dim=768, latency=0.0, rate_limit_every=0):
+        self.dim = dim
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, task_type="retrieval_document"):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limit_every and call_number % self.rate_limit_every == 0:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake)")
+        with self._lock:
+            self.texts_embedded += len(texts)
+        return [self.embed_one(t) for t in texts]
+
+    def embed_one(self, text):
+        vec = [0.0] * self.dim
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vec[index] += sign
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+
+class LatencyProxy:
+    #Wraps a client (e.g. LocalVectorStore standing in for Qdrant) and sleeps `latency` seconds before
+    #every method call, to simulate the network round trip to a remote server.
+    def __init__(self, client, latency=0.0):
+        self._client = client
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or not self.latency:
+            return attribute
+
+        def call(*args, **kwargs):
+            time.sleep(self.latency)
+            return attribute(*args, **kwargs)
+        return call
@@ -1,30 +1,75 @@
-import google.generativeai as genai
-from dotenv import load_dotenv
 import os
+from utils.embedding_engine import EmbeddingEngine
+from utils.embedding_cache import EmbeddingCache
+from utils.answer_cache import AnswerCache
+from utils.document_registry import text_sha256
+from gemini_client import get_chat_model, get_genai, stream_generate #Gemini, imported and configured on first use
+from telemetry import observe, record_llm, traced
+import time
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+#The model that answers questions: None uses the process-wide Gemini model (gemini_client.get_chat_model),
+#created on first use; assign another model (e.g. utils.fakes.FakeChatModel) to use that instead.
+#Its .generate_content() handles natural language prompts.
+chat_model = None
 
-embedding_model = genai.embed_content
-#This function allows you to generate embeddings (dense vector representations) 
-# of texts for tasks like semantic search.
-chat_model = genai.GenerativeModel("gemini-2.5-flash")
-#chat_model is now an object that can handle natural language prompts via .generate_content().
 
+EMBEDDING_MODEL = "models/embedding-001"
 
+
+def gemini_embed_backend(texts, task_type="retrieval_document"):
+    #Sends a whole batch of texts in one request; with a list as content,
+    #embed_content returns one embedding per text in the same order.
+    texts = list(texts)
+    #embed_content generates embeddings (dense vector representations) of texts for tasks like semantic search.
+    vectors = get_genai().embed_content(model=EMBEDDING_MODEL, content=texts, task_type=task_type)["embedding"]
+    record_llm("embed", EMBEDDING_MODEL, sum(len(text.encode("utf-8")) for text in texts), 0)
+    return vectors
+
+
+#Batches chunks into requests of up to 100, keeps a few requests in flight at once
+#and retries rate-limit errors with backoff (see utils/embedding_engine.py).
+embedding_engine = EmbeddingEngine(gemini_embed_backend)
+
+#Persistent cache in front of the engine: unchanged chunks and repeated questions
+#are served from memory/disk instead of calling the embedding API again.
+embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db"))
+
+
+#Answers for the same (or, above the similarity threshold, a near-identical) question over the same
+#document and retrieved chunks are reused instead of calling the chat model again.
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+)
+
+
+@traced("embed")
 def embed_fn(texts):
     #This uses Gemini 2.5’s embedding API, which returns embedding vectors for documents or queries. 
     # It is a different family of models from sentence-transformers.
-    return [embedding_model(model="models/embedding-001", content=t, task_type="retrieval_document")["embedding"] for t in texts]
-    #embedding_model(...) is called to generate an embedding vector.
+    #Only texts missing from the cache are sent to the embedding engine.
+    vectors = embedding_cache.get_or_compute(
+        EMBEDDING_MODEL,
+        "retrieval_document",
+        texts,
+        lambda missing: embedding_engine.embed(missing, task_type="retrieval_document"),
+    )
+    if len(vectors) > 1:
+        cache_stats = embedding_cache.stats()
+        print(f"Embedding cache: {cache_stats['hits_memory'] + cache_stats['hits_disk']} hits, {cache_stats['misses']} misses")
+        stats = embedding_engine.last_stats
+        if stats:
+            print(f"Last embedding run: {stats['chunks']} chunks in {stats['batches']} batches ({stats['chunks_per_sec']:.1f} chunks/sec, {stats['retries']} retries)")
+    return vectors
     #model="models/embedding-001" specifies the embedding model to use (a Gemini model for embedding).
-    #content=t is the text content being embedded.
     #task_type="retrieval_document" informs the model that the embeddings are meant for document retrieval tasks.
+    #Vectors are returned in the same order as the input texts.
     
     
-def generate_answer(context_chunks, query):
+def build_answer_prompt(context_chunks, query):
     context = "\n\n".join(context_chunks)
-    prompt = f"""You are a helpful assistant that answers questions STRICTLY based on the provided document context.
+    return f"""You are a helpful assistant that answers questions STRICTLY based on the provided document context.
 
 IMPORTANT RULES:
 1. Answer ONLY based on the information provided in the Context below
@@ -42,5 +87,54 @@ Question: {query}
 
 Answer based solely on the above context:"""
 
-    response = chat_model.generate_content(prompt)
-    return response.text.strip()
+
+def stream_answer(context_chunks, query, document_id=None, chunk_ids=None, stats=None, model=None):
+    #Streaming version of generate_answer: yields the answer text as it is generated, so the UI can
+    #show it immediately. A cached answer is yielded in one piece.
+    #document_id/chunk_ids identify what the answer is based on, for the answer cache.
+    #Without chunk_ids, the chunks are identified by their text.
+    #stats: optional dict, filled with time_to_first_token, total_seconds, chars, prompt_tokens and cached.
+    #model: chat model to use instead of chat_model (e.g. utils.fakes.FakeChatModel).
+    stats = {} if stats is None else stats
+    if chunk_ids is None:
+        chunk_ids = [text_sha256(chunk) for chunk in context_chunks]
+    query_vector = []
+
+    def embed_query():
+        #Served from the embedding cache: search_similar_chunks already embedded this question.
+        query_vector.append(embed_fn([query])[0])
+        return query_vector[0]
+
+    started = time.perf_counter()
+    cached = answer_cache.lookup(query, document_id, chunk_ids, embed_query)
+    if cached is not None:
+        cache_stats = answer_cache.stats()
+        print(f"Answer cache hit ({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['saved_seconds']:.1f}s of generation saved)")
+        elapsed = time.perf_counter() - started
+        stats.update(time_to_first_token=elapsed, total_seconds=elapsed, chars=len(cached), prompt_tokens=0,
+                     cached=True)
+        observe("generate_answer", elapsed)
+        yield cached
+        return
+
+    parts = []
+    for text in stream_generate(model or chat_model or get_chat_model(), build_answer_prompt(context_chunks, query),
+                                stats):
+        parts.append(text)
+        yield text
+    stats["cached"] = False
+    observe("generate_answer", time.perf_counter() - started)
+    print(f"Answer generated: first token after {stats['time_to_first_token'] or 0:.2f}s, {stats['total_seconds']:.2f}s total")
+    if answer_cache.similarity_threshold is not None and not query_vector:
+        #The lookup only embeds the question when there are answers to compare it with, but later paraphrases
+        #can only match this answer if it is stored with its question's vector.
+        try:
+            embed_query()
+        except Exception as e:
+            print(f"Could not embed the question for the answer cache, caching it for exact matches only: {e}")
+    answer_cache.store(query, document_id, chunk_ids, "".join(parts).strip(), time.perf_counter() - started,
+                       query_vector[0] if query_vector else None)
+
+
+def generate_answer(context_chunks, query, document_id=None, chunk_ids=None):
+    return "".join(stream_answer(context_chunks, query, document_id, chunk_ids)).strip()
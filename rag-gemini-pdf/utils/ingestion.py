@@ -0,0 +1,248 @@
+#Streaming ingestion pipeline:
+#  extract (page by page) -> chunk (incrementally) -> embed (in batches) -> upsert (in fixed-size pages)
+#Each stage runs in its own thread and hands work to the next one through a bounded queue,
+#so a slow stage makes the earlier ones wait (backpressure) instead of piling everything up in memory.
+import contextvars
+import queue
+import threading
+import time
+import uuid
+
+from utils.document_loader import iter_unstructured_file, iter_chunk_records, count_pages
+from utils.document_registry import file_sha256, text_sha256
+from utils.qdrant_client import upsert_chunk_page, delete_points, set_chunk_positions, count_document_points
+from telemetry import observe, traced
+
+_DONE = object() #Marks the end of a stage's output.
+
+
+class _StageError:
+    #Carries an exception from a worker thread to the thread consuming its queue.
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, item, stop):
+    #Blocks while the queue is full, giving up once the pipeline is stopped (the consumer may be gone).
+    #Returns whether the item was queued.
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _run_stage(items, out_queue, stop):
+    #Pushes every item of `items` into out_queue, then _DONE (or a _StageError).
+    try:
+        for item in items:
+            if not _put(out_queue, item, stop):
+                return
+        _put(out_queue, _DONE, stop)
+    except Exception as e:
+        _put(out_queue, _StageError(e), stop)
+
+
+def _drain(in_queue, stop):
+    #Yields items from a stage's queue until it is done, re-raising errors from the stage.
+    while not stop.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_metadata(chunk):
+    #Position of a chunk in the source document, stored in the point payload.
+    return {
+        "page": chunk.page,
+        "page_end": chunk.page_end,
+        "char_start": chunk.char_start,
+        "char_end": chunk.char_end,
+        "token_count": chunk.tokens,
+    }
+
+
+@traced("ingest_document")
+def ingest_document(file_path, embed_fn, collection_name="doc_chunks", document_id=None,
+                    max_tokens=300, overlap_tokens=30, embed_batch_size=64, upsert_page_size=256, max_pending=4,
+                    progress_callback=None, registry=None, name=None, content_hash=None):
+    #Streams a PDF/DOCX/PPTX file into the vector store and returns (document_id, number of chunks).
+    #overlap_tokens: tokens repeated between consecutive chunks of the same section.
+    #embed_batch_size: chunks per embed_fn call.
+    #upsert_page_size: points per upsert request.
+    #max_pending: how many batches each queue may hold before the stage feeding it has to wait.
+    #progress_callback: optional callable(progress dict), called after every upserted page.
+    #document_id: the indexed document this file is a new version of (e.g. the one the user uploaded earlier
+    #   in this session), or None for a new document. Documents are never matched by name: the registry is
+    #   shared by every session and client, and another user's file may have the same name.
+    #registry: optional DocumentRegistry. With it, a file whose bytes are already indexed is not processed
+    #   again, and a new version of a registered document only embeds and upserts the chunks whose text
+    #   changed; points of chunks that disappeared are deleted.
+    existing = {}
+    if registry is not None:
+        content_hash = content_hash or file_sha256(file_path)
+        known = registry.find_by_hash(content_hash)
+        if known and count_document_points(known["document_id"], collection_name):
+            print(f"Document already indexed as {known['document_id']}, skipping ingestion")
+            return known["document_id"], known["chunk_count"]
+        if known:
+            registry.forget(known["document_id"]) #Registered, but its points are gone from the collection.
+        if document_id is not None and registry.find_by_id(document_id):
+            existing = registry.chunk_points(document_id)
+    if document_id is None:
+        document_id = f"doc_{uuid.uuid4().hex}"
+
+    total_pages = count_pages(file_path)
+    progress = {
+        "document_id": document_id,
+        "total_pages": total_pages,
+        "pages_read": 0,
+        "chunks_embedded": 0,
+        "chunks_upserted": 0,
+        "chunks_reused": 0,
+        "chunks_deleted": 0,
+    }
+    #(chunk_index, chunk_hash, point_id) for every chunk of the new version, filled in by the stages below.
+    reused_points, new_points = [], []
+    #(point_id, chunk_index, position metadata) for reused chunks: the same text may now be on another page
+    #or at other offsets even when its chunk_index is unchanged.
+    repositioned = []
+
+    #Seconds spent extracting pages and chunking them, recorded as the "extract" and "chunk" stages.
+    #Both run interleaved in stage 1, so chunking time is the stage's time minus the extraction time.
+    timings = {"extract": 0.0, "chunk": 0.0}
+
+    def pages():
+        page_iter = iter(iter_unstructured_file(file_path))
+        while True:
+            started = time.perf_counter()
+            page = next(page_iter, None)
+            timings["extract"] += time.perf_counter() - started
+            if page is None:
+                return
+            progress["pages_read"] += 1
+            yield page
+
+    def timed_chunks(chunks):
+        chunks = iter(chunks)
+        while True:
+            started, extracted = time.perf_counter(), timings["extract"]
+            chunk = next(chunks, None)
+            timings["chunk"] += time.perf_counter() - started - (timings["extract"] - extracted)
+            if chunk is None:
+                return
+            yield chunk
+
+    def indexed_chunks(chunks):
+        #Numbers chunks and drops the ones whose text is already stored for this document.
+        for index, chunk in enumerate(chunks):
+            chunk_hash = text_sha256(chunk.text)
+            matches = existing.get(chunk_hash)
+            if matches:
+                point_id, old_index = matches.pop()
+                reused_points.append((index, chunk_hash, point_id))
+                repositioned.append((point_id, index, chunk_metadata(chunk)))
+                progress["chunks_reused"] += 1
+            else:
+                yield index, chunk_hash, chunk
+
+    def embedded_batches(chunk_batches):
+        for batch in chunk_batches:
+            vectors = embed_fn([chunk.text for _, _, chunk in batch])
+            progress["chunks_embedded"] += len(batch)
+            yield batch, vectors
+
+    stop = threading.Event()
+    chunk_queue = queue.Queue(maxsize=max_pending)
+    vector_queue = queue.Queue(maxsize=max_pending)
+
+    #Stage 1: extract + chunk (skipping unchanged chunks), grouped into embedding batches.
+    chunk_records = timed_chunks(iter_chunk_records(pages(), max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+    chunk_batches = _batched(indexed_chunks(chunk_records), embed_batch_size)
+    #Stage 2: embed each batch.
+    vector_batches = embedded_batches(_drain(chunk_queue, stop))
+
+    #Each stage thread runs in a copy of this context, so its spans (embed, upsert) belong to this ingest.
+    workers = [
+        threading.Thread(target=contextvars.copy_context().run, args=(_run_stage, chunk_batches, chunk_queue, stop),
+                         daemon=True),
+        threading.Thread(target=contextvars.copy_context().run, args=(_run_stage, vector_batches, vector_queue, stop),
+                         daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    #Stage 3 (this thread): regroup embedded chunks into fixed-size pages and upsert them.
+    page_chunks, page_vectors = [], []
+
+    def flush():
+        point_ids = upsert_chunk_page([chunk.text for _, _, chunk in page_chunks], page_vectors, document_id,
+                                      collection_name=collection_name,
+                                      metadata=[chunk_metadata(chunk) for _, _, chunk in page_chunks],
+                                      chunk_indexes=[index for index, _, _ in page_chunks])
+        new_points.extend((index, chunk_hash, point_id)
+                          for (index, chunk_hash, _), point_id in zip(page_chunks, point_ids))
+        progress["chunks_upserted"] += len(point_ids)
+        page_chunks.clear()
+        page_vectors.clear()
+        if progress_callback:
+            progress_callback(dict(progress))
+
+    try:
+        for batch, vectors in _drain(vector_queue, stop):
+            page_chunks.extend(batch)
+            page_vectors.extend(vectors)
+            while len(page_chunks) >= upsert_page_size:
+                rest_chunks, rest_vectors = page_chunks[upsert_page_size:], page_vectors[upsert_page_size:]
+                del page_chunks[upsert_page_size:], page_vectors[upsert_page_size:]
+                flush()
+                page_chunks.extend(rest_chunks)
+                page_vectors.extend(rest_vectors)
+        if page_chunks:
+            flush()
+    except Exception:
+        #Don't leave half of a new version behind; the previous version's points are still intact.
+        if new_points:
+            delete_points([point_id for _, _, point_id in new_points], collection_name)
+        raise
+    finally:
+        stop.set() #Lets the worker threads exit if we stopped early because of an error.
+
+    #Chunks of the previous version that were not matched by the new one are stale.
+    stale = [point_id for matches in existing.values() for point_id, _ in matches]
+    if stale:
+        delete_points(stale, collection_name)
+        progress["chunks_deleted"] = len(stale)
+    if repositioned:
+        set_chunk_positions(repositioned, collection_name)
+
+    observe("extract", timings["extract"])
+    observe("chunk", timings["chunk"])
+    chunk_count = len(reused_points) + len(new_points)
+    if registry is not None:
+        registry.save_document(document_id, name, content_hash, sorted(reused_points + new_points))
+    if progress_callback and (progress["chunks_reused"] or progress["chunks_deleted"]):
+        progress_callback(dict(progress))
+
+    print(f"Streamed {chunk_count} chunks from {progress['pages_read']} pages for document: {document_id} "
+          f"({progress['chunks_upserted']} new, {progress['chunks_reused']} unchanged, {progress['chunks_deleted']} deleted)")
+    return document_id, chunk_count
@@ -0,0 +1,398 @@
+#Local, in-process vector store.
+#Implements the part of the QdrantClient API that utils/qdrant_client.py uses, so the same
+#create_or_get_collection / upload / search functions run against it without a network round trip.
+#Vectors live in a memory-mapped float32 matrix per collection (normalised, so cosine similarity is a
+#dot product), payloads in SQLite, and every document's rows are tracked as row ranges so a
+#document_id filter only scores that document's rows.
+#Requests are plain namespaces (request_models below), so VECTOR_STORE=local doesn't need qdrant-client.
+#Each collection has its own locks: writes to it run one at a time and update the in-memory state only
+#once SQLite has committed them; searches take a consistent snapshot of that state under a short lock
+#and score the memmap and read payloads without holding any.
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+_INITIAL_CAPACITY = 1024
+
+COSINE = "Cosine" #Equal to qdrant_client.models.Distance.COSINE, which is a str enum.
+
+#Stand-ins for the qdrant_client.models classes utils/qdrant_client.py builds requests with, taking the
+#same keyword arguments; qdrant_client.request_models() returns these when this store is in use.
+request_models = SimpleNamespace(
+    Distance=SimpleNamespace(COSINE=COSINE),
+    VectorParams=SimpleNamespace,
+    PointStruct=SimpleNamespace,
+    Filter=SimpleNamespace,
+    FieldCondition=SimpleNamespace,
+    MatchAny=SimpleNamespace,
+    MatchValue=SimpleNamespace,
+    PointIdsList=SimpleNamespace,
+    SetPayload=SimpleNamespace,
+    SetPayloadOperation=SimpleNamespace,
+)
+
+
+def _document_ranges(rows):
+    #Merges sorted row numbers into [start, stop) ranges.
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+    return ranges
+
+
+class _Collection:
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.db = sqlite3.connect(os.path.join(path, "points.db"), check_same_thread=False) #Used by writes only.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        #point_id is TEXT because ids are unsigned 64-bit integers (or UUID strings).
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            " row INTEGER PRIMARY KEY,"
+            " point_id TEXT NOT NULL UNIQUE,"
+            " document_id TEXT,"
+            " payload TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_points_document_id ON points(document_id)")
+        self.db.commit()
+        self.write_lock = threading.Lock() #Held for a whole write, SQLite commit included.
+        self.state_lock = threading.Lock() #Held while the in-memory state below changes or is read.
+        self._readers = queue.SimpleQueue() #Idle read connections, one per concurrent reader at most.
+
+        rows = self.db.execute("SELECT row, point_id, document_id FROM points ORDER BY row").fetchall()
+        self.size = rows[-1][0] + 1 if rows else 0 #Rows in use, including deleted ones (holes).
+        capacity = max(_INITIAL_CAPACITY, self.size)
+        self.vectors = self._open_matrix(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.row_of = {}
+        document_rows = {}
+        for row, point_id, document_id in rows:
+            self.alive[row] = True
+            self.row_of[point_id] = row
+            document_rows.setdefault(document_id, []).append(row)
+        self.free_rows = [row for row in range(self.size) if not self.alive[row]]
+        self.ranges = {document_id: _document_ranges(rows) for document_id, rows in document_rows.items()}
+
+    def _open_matrix(self, capacity):
+        file_path = os.path.join(self.path, "vectors.f32")
+        needed = capacity * self.dim * 4
+        with open(file_path, "ab") as f:
+            if f.tell() < needed:
+                f.truncate(needed)
+        return np.memmap(file_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _read(self, sql, params=()):
+        #Runs a query on a read connection of its own, so reads neither wait for a write nor see one
+        #that hasn't committed yet (WAL).
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(os.path.join(self.path, "points.db"), check_same_thread=False)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            self._readers.put(conn)
+
+    def _grow(self, rows_needed):
+        #Call with state_lock held. Readers keep the matrix they took a snapshot of, which stays mapped.
+        capacity = len(self.alive)
+        if rows_needed <= capacity:
+            return
+        while capacity < rows_needed:
+            capacity *= 2
+        self.vectors.flush()
+        self.vectors = self._open_matrix(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.alive)] = self.alive
+        self.alive = alive
+
+    def _add_range(self, document_id, row):
+        ranges = self.ranges.setdefault(document_id, [])
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1 #The common case: a document's chunks are appended one after another.
+        else:
+            ranges.append([row, row + 1])
+            ranges.sort()
+
+    def _remove_range(self, document_id, row):
+        ranges = self.ranges.get(document_id, [])
+        for i, (start, stop) in enumerate(ranges):
+            if start <= row < stop:
+                pieces = [piece for piece in ([start, row], [row + 1, stop]) if piece[0] < piece[1]]
+                ranges[i:i + 1] = pieces
+                break
+        if not ranges:
+            self.ranges.pop(document_id, None)
+
+    def _commit(self, fn, *args):
+        #Runs fn on the write connection as one transaction: committed, or rolled back if it raises.
+        try:
+            fn(*args)
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            raise
+
+    def upsert(self, points):
+        with self.write_lock:
+            #1. Plan rows and validate every point, without touching the in-memory state.
+            free_rows, size = list(self.free_rows), self.size
+            planned = {} #point_id -> (row, document_id, payload JSON, normalised vector); the last one wins
+            for point in points:
+                point_id = str(point.id)
+                payload = point.payload or {}
+                vector = np.asarray(point.vector, dtype=np.float32)
+                if vector.shape != (self.dim,):
+                    raise ValueError(f"Vector dimension error: expected dim: {self.dim}, got {vector.size}")
+                norm = np.linalg.norm(vector)
+                row = planned[point_id][0] if point_id in planned else self.row_of.get(point_id)
+                if row is None:
+                    row = free_rows.pop() if free_rows else size
+                    size = max(size, row + 1)
+                planned[point_id] = (row, payload.get("document_id"), json.dumps(payload),
+                                     vector / norm if norm else vector)
+            replaced = [self.row_of[point_id] for point_id in planned if point_id in self.row_of]
+            old_documents = dict(self.db.execute(
+                f"SELECT row, document_id FROM points WHERE row IN ({','.join('?' * len(replaced))})", replaced,
+            ).fetchall()) if replaced else {}
+            #2. Write the payloads; nothing in memory has changed if this fails.
+            self._commit(self.db.executemany, "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)",
+                         [(row, point_id, document_id, payload)
+                          for point_id, (row, document_id, payload, _) in planned.items()])
+            #3. Vectors, then the state. New rows aren't alive until the state is updated, so readers
+            #   don't score them before that.
+            with self.state_lock:
+                self._grow(size)
+            for row, _, _, vector in planned.values():
+                self.vectors[row] = vector
+            self.vectors.flush()
+            with self.state_lock:
+                for row, document_id in old_documents.items():
+                    self._remove_range(document_id, row)
+                for point_id, (row, document_id, _, _) in planned.items():
+                    self.row_of[point_id] = row
+                    self.alive[row] = True
+                    self._add_range(document_id, row)
+                self.free_rows = free_rows
+                self.size = size
+
+    def delete(self, point_ids):
+        with self.write_lock:
+            rows = [self.row_of[str(point_id)] for point_id in dict.fromkeys(point_ids) if str(point_id) in self.row_of]
+            if not rows:
+                return
+            documents = dict(self.db.execute(
+                f"SELECT row, document_id FROM points WHERE row IN ({','.join('?' * len(rows))})", rows).fetchall())
+            self._commit(self.db.executemany, "DELETE FROM points WHERE row = ?", [(row,) for row in rows])
+            with self.state_lock:
+                for point_id in point_ids:
+                    self.row_of.pop(str(point_id), None)
+                for row in rows:
+                    self._remove_range(documents.get(row), row)
+                    self.alive[row] = False
+                    self.free_rows.append(row)
+
+    def set_payloads(self, updates):
+        #updates: [(payload, point_ids)], merged into the stored payloads in one transaction.
+        def apply():
+            for payload, point_ids in updates:
+                for point_id in point_ids:
+                    row = self.row_of.get(str(point_id))
+                    if row is None:
+                        continue
+                    found = self.db.execute("SELECT payload FROM points WHERE row = ?", (row,)).fetchone()
+                    current = json.loads(found[0])
+                    current.update(payload)
+                    self.db.execute("UPDATE points SET payload = ? WHERE row = ?", (json.dumps(current), row))
+        with self.write_lock:
+            self._commit(apply)
+
+    def _snapshot(self, query_filter):
+        #(matrix, rows to score or None for all rows, alive mask of the first size rows), taken together
+        #so a concurrent write is either fully visible or not at all.
+        conditions = query_filter.must if query_filter is not None and query_filter.must else []
+        payload_matches = []
+        for condition in conditions:
+            if condition.key == "document_id":
+                continue
+            values = _match_values(condition)
+            payload_matches.append(np.array([row for (row,) in self._read(
+                f"SELECT row FROM points WHERE json_extract(payload, '$.{condition.key}')"
+                f" IN ({','.join('?' * len(values))})", list(values),
+            )], dtype=np.int64))
+        with self.state_lock:
+            if not conditions:
+                return self.vectors, None, self.alive[:self.size].copy()
+            rows = None
+            for condition in conditions:
+                if condition.key != "document_id":
+                    continue
+                #Precomputed row ranges: no payload lookups needed.
+                matched = [np.arange(start, stop) for value in _match_values(condition)
+                           for start, stop in self.ranges.get(value, [])]
+                matched = np.concatenate(matched) if matched else np.empty(0, dtype=np.int64)
+                rows = matched if rows is None else np.intersect1d(rows, matched)
+            for matched in payload_matches:
+                rows = matched if rows is None else np.intersect1d(rows, matched)
+            return self.vectors, rows[self.alive[rows]], None
+
+    def search(self, query_vector, limit, query_filter=None, with_vectors=False):
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        vectors, rows, alive = self._snapshot(query_filter)
+        if rows is None:
+            scores = vectors[:len(alive)] @ query
+            scores[~alive] = -np.inf
+            rows = np.arange(len(alive))
+        else:
+            scores = vectors[rows] @ query
+        if not len(rows):
+            return []
+        k = min(limit, len(rows))
+        #argpartition finds the top k in linear time; only those k are sorted.
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        top_rows = [int(rows[i]) for i in top]
+        found = {row: (point_id, payload) for row, point_id, payload in self._read(
+            f"SELECT row, point_id, payload FROM points WHERE row IN ({','.join('?' * len(top_rows))})", top_rows,
+        )} if top_rows else {}
+        hits = []
+        for i, row in zip(top, top_rows):
+            if row not in found:
+                continue #Deleted since the snapshot.
+            point_id, payload = found[row]
+            hits.append(SimpleNamespace(
+                id=int(point_id) if point_id.isdigit() else point_id,
+                score=float(scores[i]),
+                payload=json.loads(payload),
+                vector=vectors[row].tolist() if with_vectors else None,
+            ))
+        return hits
+
+    def retrieve(self, point_ids, with_vectors=False):
+        with self.state_lock:
+            vectors = self.vectors
+            rows = {point_id: self.row_of.get(str(point_id)) for point_id in point_ids}
+        wanted = [row for row in rows.values() if row is not None]
+        payloads = dict(self._read(
+            f"SELECT row, payload FROM points WHERE row IN ({','.join('?' * len(wanted))})", wanted,
+        )) if wanted else {}
+        return [
+            SimpleNamespace(id=point_id, payload=json.loads(payloads[row]),
+                            vector=vectors[row].tolist() if with_vectors else None)
+            for point_id, row in rows.items() if row in payloads
+        ]
+
+    def count(self, query_filter=None):
+        _, rows, alive = self._snapshot(query_filter)
+        return int(alive.sum()) if rows is None else len(rows)
+
+    def close(self):
+        with self.write_lock:
+            self.vectors.flush()
+            self.db.close()
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+def _match_values(condition):
+    values = getattr(condition.match, "any", None)
+    return [condition.match.value] if values is None else values
+
+
+class LocalVectorStore:
+    #path: directory holding one sub-directory per collection.
+    request_models = request_models
+
+    def __init__(self, path="vector_store"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock() #Guards _collections only; each collection has its own locks.
+        self._collections = {}
+        for name in os.listdir(path):
+            config_path = os.path.join(path, name, "config.json")
+            if os.path.exists(config_path):
+                with open(config_path) as f:
+                    self._collections[name] = _Collection(os.path.join(path, name), json.load(f)["size"])
+
+    def _collection(self, collection_name):
+        with self._lock:
+            collection = self._collections.get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection `{collection_name}` doesn't exist")
+        return collection
+
+    def get_collections(self):
+        with self._lock:
+            return SimpleNamespace(collections=[SimpleNamespace(name=name) for name in sorted(self._collections)])
+
+    def get_collection(self, collection_name):
+        collection = self._collection(collection_name)
+        vectors = SimpleNamespace(size=collection.dim, distance=COSINE)
+        return SimpleNamespace(
+            points_count=collection.count(),
+            config=SimpleNamespace(params=SimpleNamespace(vectors=vectors)),
+        )
+
+    def recreate_collection(self, collection_name, vectors_config):
+        if vectors_config.distance != COSINE:
+            raise ValueError("LocalVectorStore only supports cosine distance")
+        with self._lock:
+            self._drop(collection_name)
+            collection_path = os.path.join(self.path, collection_name)
+            os.makedirs(collection_path)
+            with open(os.path.join(collection_path, "config.json"), "w") as f:
+                json.dump({"size": vectors_config.size, "distance": COSINE}, f)
+            self._collections[collection_name] = _Collection(collection_path, vectors_config.size)
+            return True
+
+    def delete_collection(self, collection_name):
+        with self._lock:
+            return self._drop(collection_name)
+
+    def _drop(self, collection_name):
+        collection = self._collections.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        shutil.rmtree(os.path.join(self.path, collection_name), ignore_errors=True)
+        return True
+
+    def upsert(self, collection_name, points, **kwargs):
+        self._collection(collection_name).upsert(points)
+
+    def delete(self, collection_name, points_selector, **kwargs):
+        self._collection(collection_name).delete(points_selector.points)
+
+    def set_payload(self, collection_name, payload, points, **kwargs):
+        self._collection(collection_name).set_payloads([(payload, points)])
+
+    def batch_update_points(self, collection_name, update_operations, **kwargs):
+        #Only SetPayloadOperation is used by utils/qdrant_client.py; the batch is one transaction.
+        self._collection(collection_name).set_payloads(
+            [(operation.set_payload.payload, operation.set_payload.points) for operation in update_operations])
+
+    def search(self, collection_name, query_vector, limit=10, query_filter=None, with_vectors=False, **kwargs):
+        return self._collection(collection_name).search(query_vector, limit, query_filter, with_vectors)
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        return self._collection(collection_name).retrieve(ids, with_vectors)
+
+    def count(self, collection_name, count_filter=None, exact=True):
+        return SimpleNamespace(count=self._collection(collection_name).count(count_filter))
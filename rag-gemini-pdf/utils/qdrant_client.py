@@ -1,24 +1,102 @@
-#QdrantClient-Main class to interact with Qdrant (connect, search, insert, etc.)
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-#PointStruct-Used to represent a single data point in Qdrant
+#qdrant_client (QdrantClient and the request models) takes over a second to import, so it is imported
+#where it is first used rather than here, and not at all with VECTOR_STORE=local (see request_models).
 #uuid: For generating unique IDs
 import uuid, os
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
+from utils.document_registry import DocumentRegistry
+from utils.bm25_index import BM25Index, tokenize
+from telemetry import traced
 load_dotenv()
 
 #uuid-generate unique identifiers for vector points
 
-qdrant = QdrantClient(
-    url=os.getenv("QDRANT_URL"),
-    api_key=os.getenv("QDRANT_API_KEY")
-)
+#The vector store client, created on first use by get_qdrant() and then shared by the whole process;
+#assign a client here (e.g. utils.fakes.LatencyProxy around one) to use that instead.
+qdrant = None
+_qdrant_lock = threading.Lock()
+
+
+def get_qdrant():
+    #VECTOR_STORE=local keeps the index in-process (utils/local_vector_store.py) instead of on a Qdrant server;
+    #both expose the same client methods, so the functions below work with either.
+    global qdrant
+    with _qdrant_lock:
+        if qdrant is None:
+            if os.getenv("VECTOR_STORE", "qdrant").lower() == "local":
+                from utils.local_vector_store import LocalVectorStore
+                qdrant = LocalVectorStore(os.getenv("VECTOR_STORE_PATH", "vector_store"))
+            else:
+                #QdrantClient-Main class to interact with Qdrant (connect, search, insert, etc.)
+                from qdrant_client import QdrantClient
+                qdrant = QdrantClient(
+                    url=os.getenv("QDRANT_URL"),
+                    api_key=os.getenv("QDRANT_API_KEY")
+                )
+        return qdrant
+
+def request_models():
+    #The request classes for the client in use: qdrant_client.models for a Qdrant server, plain namespaces
+    #for the local store (which needs neither qdrant-client nor its models).
+    local_models = getattr(get_qdrant(), "request_models", None)
+    if local_models is not None:
+        return local_models
+    from qdrant_client import models
+    return models
+
+def warm_up():
+    #Creates the client and loads its request models, so the first request doesn't pay for either.
+    request_models()
+
+#BM25 index over the same chunks, kept in step with the collection by the functions below.
+lexical_index = BM25Index(os.getenv("BM25_INDEX_PATH", "bm25_index.db"))
+#Runs the vector and lexical searches of a hybrid query side by side.
+_search_pool = ThreadPoolExecutor(max_workers=8)
+SEARCH_VECTOR_TIMEOUT = float(os.getenv("SEARCH_VECTOR_TIMEOUT", "10"))
+
+#Which documents (by file hash) and chunks (by text hash) are already in the collection.
+document_registry = DocumentRegistry(os.getenv("DOCUMENT_REGISTRY_PATH", "document_registry.db"))
+
+def document_ids(document_id):
+    #document_id arguments of the search functions: one id, a list of ids or None (every document).
+    #Returns a list of ids or None.
+    if not document_id:
+        return None
+    return list(document_id) if isinstance(document_id, (list, tuple, set)) else [document_id]
+
+def document_filter(document_id):
+    #Matches only the points of one document, or of any of a list of documents (one MatchAny condition,
+    #so several documents are searched with a single request).
+    models = request_models()
+    if isinstance(document_id, (list, tuple, set)):
+        match = models.MatchAny(any=list(document_id))
+    else:
+        match = models.MatchValue(value=document_id)
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="document_id",
+                match=match
+            )
+        ]
+    )
+
+def recreate_collection(collection_name, size=768):
+    #(Re)creates an empty collection and drops its lexical index, which would otherwise point at deleted chunks.
+    models = request_models()
+    get_qdrant().recreate_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=size, distance=models.Distance.COSINE)
+    )
+    lexical_index.clear(collection_name)
 
 #function to create a Qdrant collection (if it doesn’t exist) or recreate it (if clear_existing=True).
 def create_or_get_collection(collection_name="doc_chunks", clear_existing=False):
     try:
         # Check if collection exists and get its info
-        collections = qdrant.get_collections().collections
+        collections = get_qdrant().get_collections().collections
         #.collections gives you the list of individual collection metadata objects.
         #get_collections() fetches all existing collections in your Qdrant instance.
         #Checks if a collection with the desired name already exists.
@@ -27,15 +105,12 @@ def create_or_get_collection(collection_name="doc_chunks", clear_existing=False)
         if existing_collection:
             if clear_existing:
                 print(f"Clearing existing collection '{collection_name}' for new document...")
-                qdrant.recreate_collection(
-                    collection_name=collection_name,
-                    vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-                )
+                recreate_collection(collection_name, size=768)
                 return collection_name
                 
             # Get collection info to check vector size
             #Get full configuration details of the existing collection.
-            collection_info = qdrant.get_collection(collection_name)
+            collection_info = get_qdrant().get_collection(collection_name)
             expected_size = 768  # Google embedding-001 model dimension. size=768: Vector dimension (matches Google Gemini embedding model)
             
             if hasattr(collection_info.config.params.vectors, 'size'):#Checks if the vectors object has a property called size.
@@ -48,26 +123,82 @@ def create_or_get_collection(collection_name="doc_chunks", clear_existing=False)
             
             if actual_size != expected_size:
                 print(f"Collection exists but has wrong vector size ({actual_size} vs {expected_size}). Recreating...")
-                qdrant.recreate_collection(
-                    collection_name=collection_name,
-                    vectors_config=VectorParams(size=expected_size, distance=Distance.COSINE)
-                )
+                recreate_collection(collection_name, size=expected_size)
         else:
             # Create new collection
-            qdrant.recreate_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-            )
+            recreate_collection(collection_name, size=768)
     except Exception as e:
         print(f"Error managing collection: {e}")
         # Fallback: recreate collection
-        qdrant.recreate_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-        )
+        recreate_collection(collection_name, size=768)
     
     return collection_name
 
+def new_point_id():
+    return uuid.uuid4().int >> 64
+
+def build_points(chunks, vectors, document_id, start_index=0, metadata=None, chunk_indexes=None, point_ids=None):
+    #Pairs each chunk with its vector and metadata. start_index lets a streamed page of chunks
+    #keep numbering on from the previous page.
+    #metadata: optional list of dicts (one per chunk, e.g. page and char offsets) merged into the payload.
+    #chunk_indexes/point_ids: optional explicit values per chunk (used when only changed chunks are re-uploaded).
+    models = request_models() #PointStruct-Used to represent a single data point in Qdrant
+    return [
+        models.PointStruct(
+            id=point_ids[i] if point_ids else new_point_id(), 
+            vector=vec, #The embedding vector for that chunk.
+            payload={ #Metadata stored along with the vector:
+                **(metadata[i] if metadata else {}),
+                "text": chunk, #The original chunk.
+                "document_id": document_id, #Used to group all chunks from the same document.
+                "chunk_index": chunk_indexes[i] if chunk_indexes else start_index + i #The index of the chunk (0-based).
+            }
+        )
+        for i, (chunk, vec) in enumerate(zip(chunks, vectors))
+    ]
+
+@traced("upsert")
+def upsert_chunk_page(chunks, vectors, document_id, start_index=0, collection_name="doc_chunks", metadata=None,
+                      chunk_indexes=None):
+    #Uploads one fixed-size page of already embedded chunks (used by the streaming ingestion pipeline).
+    #Returns the ids of the uploaded points.
+    point_ids = [new_point_id() for _ in chunks]
+    points = build_points(chunks, vectors, document_id, start_index, metadata, chunk_indexes, point_ids)
+    get_qdrant().upsert(collection_name=collection_name, points=points)
+    lexical_index.add(collection_name, document_id, point_ids, chunks,
+                      chunk_indexes or range(start_index, start_index + len(chunks)))
+    return point_ids
+
+def delete_points(point_ids, collection_name="doc_chunks"):
+    #Removes points that no longer belong to a document (e.g. chunks removed by an edit).
+    models = request_models()
+    for start in range(0, len(point_ids), 1000):
+        get_qdrant().delete(collection_name=collection_name,
+                            points_selector=models.PointIdsList(points=point_ids[start:start + 1000]))
+    lexical_index.delete(collection_name, point_ids)
+
+def set_chunk_positions(positions, collection_name="doc_chunks"):
+    #positions: list of (point_id, chunk_index, metadata) for unchanged chunks of a new document version;
+    #chunk_index and the positional metadata (page, char offsets, ...) are rewritten together.
+    models = request_models()
+    operations = [
+        models.SetPayloadOperation(set_payload=models.SetPayload(payload={**metadata, "chunk_index": chunk_index},
+                                                                 points=[point_id]))
+        for point_id, chunk_index, metadata in positions
+    ]
+    for start in range(0, len(operations), 500):
+        get_qdrant().batch_update_points(collection_name=collection_name, update_operations=operations[start:start + 500])
+    lexical_index.set_chunk_indexes(collection_name, [(point_id, chunk_index) for point_id, chunk_index, _ in positions])
+
+def count_document_points(document_id, collection_name="doc_chunks"):
+    #Number of points stored for a document; 0 means the registry entry is stale.
+    try:
+        return get_qdrant().count(collection_name=collection_name, count_filter=document_filter(document_id), exact=True).count
+    except Exception as e:
+        print(f"Error counting points for {document_id}: {e}")
+        return 0
+
+@traced("upload_chunks_to_qdrant")
 def upload_chunks_to_qdrant(chunks, embed_fn, collection_name="doc_chunks", document_id=None):
     #embed_fn-A function that converts a list of text chunks into a list of vectors (embeddings).
     #document_id: Optional. If given, will tag all chunks with this ID. If not, a unique ID is generated.
@@ -80,24 +211,12 @@ def upload_chunks_to_qdrant(chunks, embed_fn, collection_name="doc_chunks", docu
         
         # Generate document ID if not provided
         if document_id is None:
-            import time
-            document_id = f"doc_{int(time.time())}"
-            #time.time() returns the current time in seconds
+            document_id = f"doc_{uuid.uuid4().hex}"
+            #A random id, so two uploads in the same second can't share a document_id
         
-        points = [
-            PointStruct(
-                id=uuid.uuid4().int >> 64, 
-                vector=vec, #The embedding vector for that chunk.
-                payload={ #Metadata stored along with the vector:
-                    "text": chunk, #The original chunk.
-                    "document_id": document_id, #Used to group all chunks from the same document.
-                    "chunk_index": i #The index of the chunk (0-based).
-                }
-            )
-            for i, (chunk, vec) in enumerate(zip(chunks, vectors))
-        ]
-        qdrant.upsert(collection_name=collection_name, points=points) #Uploads (or updates) all the points into the Qdrant collection.
-        print(f"Uploaded {len(points)} chunks for document: {document_id}") #Displays how many chunks were uploaded.
+        #Uploads all the points into the Qdrant collection and indexes their text for lexical search.
+        point_ids = upsert_chunk_page(chunks, vectors, document_id, collection_name=collection_name)
+        print(f"Uploaded {len(point_ids)} chunks for document: {document_id}") #Displays how many chunks were uploaded.
         return document_id #Returns the document_id for reference/tracking.
         
     except Exception as e:
@@ -107,44 +226,117 @@ def upload_chunks_to_qdrant(chunks, embed_fn, collection_name="doc_chunks", docu
             create_or_get_collection(collection_name)
             # Retry upload after recreating collection
             vectors = embed_fn(chunks)
-            points = [
-                PointStruct(
-                    id=uuid.uuid4().int >> 64, 
-                    vector=vec, 
-                    payload={
-                        "text": chunk,
-                        "document_id": document_id,
-                        "chunk_index": i
-                    }
-                )
-                for i, (chunk, vec) in enumerate(zip(chunks, vectors))
-            ]
-            qdrant.upsert(collection_name=collection_name, points=points)
+            upsert_chunk_page(chunks, vectors, document_id, collection_name=collection_name)
             return document_id
             #[Chunks] --(embed_fn)--> [Vectors] --(with metadata)--> [PointStructs] --> Qdrant Upload
             
             
-#This function searches for the top_k most semantically similar text chunks 
-# in the Qdrant vector database based on a user’s query.
-def search_similar_chunks(query, embed_fn, collection_name="doc_chunks", top_k=5, document_id=None):
-    query_vector = embed_fn([query])[0] #Used to produce query vector
+@traced("vector_search")
+def vector_search(query, embed_fn, collection_name="doc_chunks", limit=5, document_id=None, vectors=None):
+    #Dense search: returns [(point_id, score, payload)].
+    #vectors: optional dict, filled with point_id -> stored vector of every hit (for reranking).
+    query_vector = embed_fn([query])[0] #Used to produce query vector (a repeated question is served from the embedding cache)
     
     # Add filter for specific document if provided
     search_filter = None #We initialize search_filter as None. This means no filtering by default.
     if document_id:
-        search_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="document_id",
-                    match=MatchValue(value=document_id)
-                )
-            ]
-        )
+        search_filter = document_filter(document_id)
     
-    results = qdrant.search(
+    results = get_qdrant().search(
         collection_name=collection_name, 
         query_vector=query_vector, 
-        limit=top_k,
-        query_filter=search_filter
+        limit=limit,
+        query_filter=search_filter,
+        with_vectors=vectors is not None
     )
-    return [hit.payload["text"] for hit in results]
+    if vectors is not None:
+        vectors.update((hit.id, hit.vector) for hit in results)
+    return [(hit.id, hit.score, hit.payload) for hit in results]
+
+@traced("lexical_search")
+def lexical_search(query, collection_name="doc_chunks", limit=5, document_id=None):
+    #BM25 search over the same chunks: returns [(point_id, score, payload)] without calling the embedding API.
+    return lexical_index.search(collection_name, query, limit, document_ids(document_id))
+
+def fetch_vectors(point_ids, collection_name="doc_chunks"):
+    #point_id -> stored vector, for hits that came without one (e.g. found only by the lexical search).
+    if not point_ids:
+        return {}
+    records = get_qdrant().retrieve(collection_name=collection_name, ids=list(point_ids), with_payload=False,
+                                    with_vectors=True)
+    return {record.id: record.vector for record in records}
+
+def neighbour_chunks(document_id, chunk_indexes, collection_name="doc_chunks"):
+    #[(point_id, payload)] of a document's chunks at the given chunk_index positions, read from the lexical
+    #index (which holds the text of every chunk) instead of another vector store request.
+    return lexical_index.chunks_at(collection_name, document_id, chunk_indexes)
+
+def reciprocal_rank_fusion(result_lists, k=60):
+    #Combines ranked lists by summing 1 / (k + rank); only ranks matter, so BM25 and cosine scores
+    #don't have to be on the same scale.
+    scores, payloads = {}, {}
+    for results in result_lists:
+        for rank, (point_id, _, payload) in enumerate(results, start=1):
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank)
+            payloads.setdefault(point_id, payload)
+    return [(point_id, scores[point_id], payloads[point_id]) for point_id in sorted(scores, key=scores.get, reverse=True)]
+
+def search_chunks(query, embed_fn, collection_name="doc_chunks", top_k=5, document_id=None, mode="hybrid",
+                  candidates=None, vector_timeout=SEARCH_VECTOR_TIMEOUT, vectors=None):
+    #Returns the top_k hits as [(point_id, score, payload)].
+    #document_id: one document, a list of documents (searched together) or None for the whole collection.
+    #mode: "vector", "lexical" or "hybrid" (both searches in parallel, fused with reciprocal_rank_fusion).
+    #candidates: how many hits each search contributes to the fusion (default 4 * top_k, at least 20).
+    #vector_timeout: in hybrid mode, seconds to wait for the embedding + vector search before answering
+    #   from the lexical results alone.
+    #vectors: optional dict, filled with point_id -> vector for the hits the vector search returned.
+    if mode == "vector":
+        return vector_search(query, embed_fn, collection_name, top_k, document_id, vectors)
+    if mode == "lexical":
+        return lexical_search(query, collection_name, top_k, document_id)
+
+    candidates = candidates or max(20, 4 * top_k)
+    #The vector search fills its own dict: after a timeout it may still finish while the caller reads vectors.
+    vector_vectors = {} if vectors is not None else None
+    #Each search runs in a copy of this context, so its span is a child of the caller's.
+    vector_future = _search_pool.submit(contextvars.copy_context().run, vector_search, query, embed_fn,
+                                        collection_name, candidates, document_id, vector_vectors)
+    lexical_future = _search_pool.submit(contextvars.copy_context().run, lexical_search, query, collection_name,
+                                         candidates, document_id)
+    try:
+        lexical_hits = lexical_future.result()
+    except Exception as e:
+        print(f"Lexical search failed, using vector search only: {e}")
+        lexical_hits = []
+    try:
+        vector_hits = vector_future.result(timeout=vector_timeout)
+    except FutureTimeout:
+        if not lexical_hits:
+            vector_hits = vector_future.result() #Nothing else to answer from, so keep waiting.
+        else:
+            print(f"Vector search took longer than {vector_timeout}s, using lexical results only")
+            vector_hits = []
+    except Exception as e:
+        if not lexical_hits:
+            raise
+        print(f"Vector search failed, using lexical results only: {e}")
+        vector_hits = []
+    if vector_hits and vectors is not None:
+        vectors.update(vector_vectors)
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits])
+    #RRF favours chunks that both searches rank reasonably well, which can push an exact match for a
+    #part number or clause id (found only by the lexical search) out of the top_k. Lexical hits that
+    #contain every identifier-like term of the query are therefore put first.
+    identifiers = {term for term in tokenize(query) if any(c.isdigit() for c in term)}
+    if identifiers:
+        exact = [hit for hit in lexical_hits if identifiers <= set(tokenize(hit[2]["text"]))]
+        exact_ids = {point_id for point_id, _, _ in exact}
+        fused = exact + [hit for hit in fused if hit[0] not in exact_ids]
+    return fused[:top_k]
+
+#This function searches for the top_k most similar text chunks in the Qdrant vector database
+#(and the lexical index, see search_chunks) based on a user’s query.
+@traced("search_similar_chunks")
+def search_similar_chunks(query, embed_fn, collection_name="doc_chunks", top_k=5, document_id=None, mode="hybrid"):
+    hits = search_chunks(query, embed_fn, collection_name, top_k, document_id, mode)
+    return [payload["text"] for _, _, payload in hits]
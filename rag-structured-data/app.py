@@ -1,59 +1,17 @@
 import streamlit as st
-import pandas as pd
 import os
-import json
-from metadata import extract_metadata#for creating metadata
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # telemetry.py, shared by both pipelines
 from route_query import route_query#for selecting the functions 
-from common.db import save_to_sqlite#for saving the data to the sqllite
-
-#function to convert raw SQL results into a friendly natural language answer using an LLM.
-#we are passing the data-result(output), query-original question and sql-query-sql query that is executed
-def format_result_with_llm(data, query, sql_query):
-    """Use LLM to convert SQL query results into natural language sentences"""
-    from common.llm_config import model #importing gemini model
-    
-    #if the length of the result is 0 then sql query is not returning anything
-    if not data or len(data) == 0:
-        return "No data found matching your query."
-    
-    # Prepare the data for the LLM, by converting it into json
-    data_str = json.dumps(data, indent=2)
-    
-    # Create a prompt for the LLM to format the answer
-    prompt = f"""
-You are a data assistant. Convert the SQL query result into a natural, conversational sentence.
-
-User's Original Question: "{query}"
-SQL Query Executed: {sql_query}
-Query Result: {data_str}
-
-Instructions:
-- Write a clear, natural sentence that answers the user's question
-- Use the actual values from the result
-- Make it conversational and easy to understand
-- If it's a count, say "The total number of rows is X"
-- If it's a sum, say "The total sum of [column] is X"
-- If it's an average, say "The average [column] is X"
-- If it's multiple records, summarize appropriately
-- Don't include technical SQL terms
-- Just provide the natural language answer, nothing else
-
-Answer:"""
-
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        # Fallback to simple formatting if LLM fails
-        if len(data) == 1 and len(data[0]) == 1:#if there is only 1 row or column or the output is just a single number
-            value = list(data[0].values())[0]
-            return f"The result is {value}."
-        else:
-            return f"Found {len(data)} records in the data."
-        
+from metadata import combine_metadata#for questions over several tables
+from result_formatter import stream_result_with_llm#for turning sql results into sentences
+from table_ingestion import TABLE_FILE_TYPES, ingest_table, table_preview#for loading the file into the sqllite database
 
 #st.title("📊 Gemini Structured Data Assistant (SQLite + SQL Routing)")
 
+if 'tables' not in st.session_state:
+    st.session_state.tables = {}  # upload id -> (ingested table, preview), so reruns don't read the file again
+
 # Check if file was uploaded from main app, otherwise show file uploader
 if 'uploaded_file_path' in st.session_state:
     file_path = st.session_state.uploaded_file_path
@@ -63,13 +21,11 @@ if 'uploaded_file_path' in st.session_state:
     
     #st.success(f"Processing file: {file_name}")
     
-    if file_ext == ".csv":
-        df = pd.read_csv(file_path)
-    elif file_ext == ".xlsx":
-        df = pd.read_excel(file_path)
-    else:
+    if file_ext.lower() not in TABLE_FILE_TYPES:
         st.error("Unsupported file format")
         st.stop()
+    source = file_path
+    upload_id = file_path
         
     uploaded_file_processed = True
 else:
@@ -81,35 +37,46 @@ else:
         table_name = os.path.splitext(uploaded_file.name)[0]
         #getting the file extension
         file_ext = os.path.splitext(uploaded_file.name)[-1]
-        if file_ext == ".csv":
-            df = pd.read_csv(uploaded_file)
-        elif file_ext ==".xlsx":
-            df = pd.read_excel(uploaded_file)
-        else:
+        if file_ext.lower() not in TABLE_FILE_TYPES:
             st.error("Unsupported file format")
             st.stop()
+        source = uploaded_file
+        file_name = uploaded_file.name
+        upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
         uploaded_file_processed = True
 
 if uploaded_file_processed:
 
+    # Streamlit reruns this script on every interaction: an upload is ingested (and previewed) once per
+    # session; ingest_table itself reuses the table and metadata when another session loaded this file
+    if upload_id not in st.session_state.tables:
+        with st.spinner("Loading data..."):
+            table = ingest_table(source, file_name, table_name)
+        # Preview the first rows from the Parquet copy, or straight from the table
+        st.session_state.tables[upload_id] = (table, table_preview(table))
+    table, preview = st.session_state.tables[upload_id]
+    metadata = table["metadata"]
     st.success("✅ File uploaded successfully!")
-    st.dataframe(df.head())
+    if table["already_loaded"]:
+        st.caption(f"{table['rows']:,} rows (already loaded)")
+    else:
+        st.caption(f"{table['rows']:,} rows loaded in {table['seconds']:.1f}s")
 
-    # Save the datadrame, table name to SQLite-uploaded_data.db
-    save_to_sqlite(df, table_name, "uploaded_data.db")
+    st.dataframe(preview)
 
-    # Extract and display metadata pass the table name and the data frame
-    metadata = extract_metadata(df, table_name)
     #st.subheader("🧠 Extracted Metadata")
     #st.json(metadata)  # Display metadata as formatted JSON
 
     # Ask a query
     st.subheader("💬 Ask a Question")
+    # Tables loaded in this session can be queried together (joined or combined in one SQL query)
+    loaded_tables = {loaded["table_name"]: loaded["metadata"] for loaded, _ in st.session_state.tables.values()}
+    selected_tables = st.multiselect("Tables:", sorted(loaded_tables), default=[metadata["table_name"]])
     user_query = st.text_input("Enter your query related to the data")
 
-    if user_query:#when user query is entered
+    if user_query and selected_tables:#when user query is entered
         with st.spinner("🤖 Thinking..."):
-            response = route_query(user_query, metadata)
+            response = route_query(user_query, combine_metadata([loaded_tables[name] for name in selected_tables]))
         st.subheader("📬 Gemini Response")
         
         # Check if there's an error
@@ -124,6 +91,8 @@ if uploaded_file_processed:
             function_name = function_call.get("name", "❌ No function returned by LLM")
             
             st.write("**Function Called**:", function_name)
+            if response.get("cached"):
+                st.caption("⚡ Reused the plan of an earlier question (no Gemini call)")
             
             # Display the query if it's a SQL function
             if function_name == "execute_sql_query":
@@ -141,9 +110,14 @@ if uploaded_file_processed:
                     if isinstance(sql_result, list) and len(sql_result) > 0:
                         # Get the SQL query for context
                         sql_query = function_call.get("arguments", {}).get("query", "")
-                        # Convert data to natural language using LLM
-                        answer_text = format_result_with_llm(sql_result, user_query, sql_query)
-                        st.write(answer_text)
+                        # Convert data to natural language using LLM, showing the sentence as it is generated
+                        generation_stats = {}
+                        st.write_stream(stream_result_with_llm(sql_result, user_query, sql_query, generation_stats))
+                        if generation_stats.get("total_seconds") is not None:
+                            st.caption(f"⏱️ First words after {generation_stats['time_to_first_token'] or 0:.1f}s, "
+                                       f"complete after {generation_stats['total_seconds']:.1f}s")
+                        if result.get("truncated"):
+                            st.caption(f"Only the first {result['max_rows']} rows of the result were used.")
                         
                     elif isinstance(sql_result, list) and len(sql_result) == 0:
                         st.write("No data found matching your query.")
@@ -0,0 +1,72 @@
+#Benchmark: SQLite vs the columnar DuckDB engine on the query shapes route_query typically generates.
+#Loads a synthetic sales table (see bench_loader.py), mirrors it into DuckDB and runs every query on both
+#engines through execute_sql_query (index advisor off, so SQLite is measured as uploaded).
+#Run from rag-structured-data/:  python benchmarks/bench_engines.py [--rows 5000000] [--repeat 5]
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("INDEX_ADVISOR", "0")
+os.environ.setdefault("COLUMNAR_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.duckdb"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #telemetry.py
+from bench_loader import make_csv
+from common.columnar import get_columnar_store
+from common.loader import load_file_to_sqlite
+from common.sql_executor import execute_sql_query
+
+QUERIES = {
+    "count": "SELECT COUNT(*) FROM sales",
+    "group by": "SELECT region, SUM(quantity) AS units FROM sales GROUP BY region",
+    "filtered sum": "SELECT SUM(quantity * unit_price) FROM sales WHERE region = 'North' AND discount > 0.1",
+    "distinct count": "SELECT COUNT(DISTINCT product) FROM sales",
+    "top n": "SELECT product, SUM(quantity * unit_price) AS revenue FROM sales GROUP BY product ORDER BY revenue DESC LIMIT 10",
+    "monthly": "SELECT substr(order_date, 1, 7) AS month, AVG(unit_price) FROM sales GROUP BY month ORDER BY month",
+    "like filter": "SELECT COUNT(*) FROM sales WHERE product LIKE 'sku-001%'",
+}
+
+
+def _rows(result):
+    #Row values in a comparable order (groups without ORDER BY come back in any order).
+    return sorted((tuple(round(v, 6) if isinstance(v, float) else v for v in row.values()) for row in result["result"]),
+                  key=repr)
+
+
+def timed(query, engine, db_path, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = execute_sql_query(query, db_path=db_path, engine=engine, timeout=300)
+        times.append(time.perf_counter() - started)
+    if "error" in result:
+        raise RuntimeError(f"{engine}: {result['error']}")
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    csv_path = os.path.join(workdir, "sales.csv")
+    db_path = os.path.join(workdir, "bench.db")
+    make_csv(csv_path, args.rows)
+    stats = load_file_to_sqlite(csv_path, "sales", ".csv", db_path=db_path, engine="pyarrow")
+    get_columnar_store().mirror_table("sales", stats["columns"], db_path)
+
+    print(f"\n{'query':>15} {'sqlite ms':>10} {'duckdb ms':>10} {'speedup':>8}  same result")
+    for name, query in QUERIES.items():
+        sqlite_seconds, sqlite_result = timed(query, "sqlite", db_path, args.repeat)
+        duckdb_seconds, duckdb_result = timed(query, "duckdb", db_path, args.repeat)
+        same = _rows(sqlite_result) == _rows(duckdb_result)
+        print(f"{name:>15} {sqlite_seconds * 1000:>10.1f} {duckdb_seconds * 1000:>10.1f} "
+              f"{sqlite_seconds / duckdb_seconds:>7.1f}x  {same if duckdb_result['engine'] == 'duckdb' else 'fell back'}")
+
+
+if __name__ == "__main__":
+    main()
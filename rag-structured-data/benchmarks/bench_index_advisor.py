@@ -0,0 +1,68 @@
+#Benchmark: query latency per query shape before and after the index advisor builds its indexes.
+#Loads a synthetic sales table (see bench_loader.py), runs a workload of filter / group-by queries
+#through execute_sql_query, and prints the advisor's before/after report.
+#Run from rag-structured-data/:  python benchmarks/bench_index_advisor.py [--rows 2000000] [--rounds 10]
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #telemetry.py
+from bench_loader import make_csv
+from common.index_advisor import get_advisor
+from common.loader import load_file_to_sqlite
+from common.sql_executor import execute_sql_query
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+
+def workload(rng):
+    #One query of each shape, with random literal values.
+    product = f"SKU-{rng.randrange(500):05d}"
+    month = rng.randint(1, 12)
+    return [
+        f"SELECT SUM(quantity) FROM sales WHERE product = '{product}'",
+        f"SELECT COUNT(*), AVG(unit_price) FROM sales WHERE region = '{rng.choice(REGIONS)}' AND product = '{product}'",
+        f"SELECT SUM(quantity * unit_price) FROM sales WHERE order_date BETWEEN '2024-{month:02d}-01' AND '2024-{month:02d}-07'",
+        f"SELECT * FROM sales WHERE order_id = {rng.randrange(1_000_000)}",
+        "SELECT region, SUM(quantity) FROM sales GROUP BY region",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--min-hits", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    csv_path = os.path.join(workdir, "sales.csv")
+    db_path = os.path.join(workdir, "bench.db")
+    make_csv(csv_path, args.rows)
+    load_file_to_sqlite(csv_path, "sales", ".csv", db_path=db_path)
+
+    advisor = get_advisor(db_path)
+    advisor.min_hits = args.min_hits
+    rng = random.Random(0)
+    for _ in range(args.rounds):
+        for query in workload(rng):
+            result = execute_sql_query(query, db_path=db_path)
+            if "error" in result:
+                print(result["error"])
+        advisor.flush() #Let indexes triggered by this round finish before the next one.
+
+    print(f"\n{'runs':>4} {'before ms':>10} {'runs':>4} {'after ms':>10} {'speedup':>8}  shape / index")
+    for entry in advisor.report():
+        before, after = entry["avg_ms_before"], entry["avg_ms_after"]
+        speedup = f"{before / after:.0f}x" if before and after else "-"
+        print(f"{entry['runs_before']:>4} {before or 0:>10.1f} {entry['runs_after']:>4} {after or 0:>10.1f} "
+              f"{speedup:>8}  {entry['shape'][:90]}")
+        if entry["index"]:
+            print(f"{'':>43}{entry['index']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#Benchmark: loading a large CSV into SQLite the old way (pd.read_csv + DataFrame.to_sql) vs the
+#chunked loader in common/loader.py, with the pandas C parser and with pyarrow.
+#Every mode runs in its own subprocess so the reported peak RSS belongs to that mode alone.
+#Run from rag-structured-data/:  python benchmarks/bench_loader.py [--rows 2000000] [--csv data.csv]
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "..")) #telemetry.py
+
+MODES = ("pandas_to_sql", "loader_c", "loader_pyarrow")
+
+
+def make_csv(path, rows, seed=0):
+    #Sales-like data: ids, zip codes with leading zeros, categories, prices, dates and some gaps.
+    rng = random.Random(seed)
+    regions = ["North", "South", "East", "West", "Central"]
+    products = [f"SKU-{i:05d}" for i in range(500)]
+    with open(path, "w") as f:
+        f.write("order_id,zip_code,region,product,quantity,unit_price,discount,order_date\n")
+        for i in range(rows):
+            discount = "" if rng.random() < 0.3 else f"{rng.random() * 0.3:.2f}"
+            f.write(f"{i},{rng.randint(0, 99999):05d},{rng.choice(regions)},{rng.choice(products)},"
+                    f"{rng.randint(1, 50)},{rng.uniform(1, 500):.2f},{discount},"
+                    f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}\n")
+
+
+def run_mode(mode, csv_path, db_path):
+    #Runs inside the subprocess; prints one JSON line with the results.
+    import pandas as pd
+    from common.loader import load_file_to_sqlite, peak_rss_mb
+
+    started = time.perf_counter()
+    if mode == "pandas_to_sql":
+        import sqlite3
+        df = pd.read_csv(csv_path)
+        conn = sqlite3.connect(db_path)
+        df.to_sql("sales", conn, if_exists="replace", index=False)
+        conn.close()
+        rows = len(df)
+    else:
+        engine = "pyarrow" if mode == "loader_pyarrow" else None
+        rows = load_file_to_sqlite(csv_path, "sales", ".csv", db_path=db_path, engine=engine)["rows"]
+    seconds = time.perf_counter() - started
+    print(json.dumps({"rows": rows, "seconds": seconds, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--csv", help="existing CSV to load instead of a generated one")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args.run_mode, args.csv, args.db)
+        return
+
+    workdir = tempfile.mkdtemp()
+    csv_path = args.csv
+    if csv_path is None:
+        csv_path = os.path.join(workdir, "sales.csv")
+        make_csv(csv_path, args.rows)
+    size_mb = os.path.getsize(csv_path) / (1024 * 1024)
+    print(f"CSV: {csv_path} ({size_mb:.0f} MB)")
+
+    print(f"{'mode':>16} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'peak RSS MB':>12}")
+    for mode in args.modes:
+        db_path = os.path.join(workdir, f"{mode}.db")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--csv", csv_path, "--db", db_path],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>16} {result['rows']:>10} {result['seconds']:>9.2f} "
+              f"{result['rows'] / result['seconds']:>10.0f} {result['peak_rss_mb'] or 0:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
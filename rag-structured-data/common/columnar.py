@@ -0,0 +1,217 @@
+#Columnar execution engine for large tables (optional, needs the duckdb package).
+#Tables above COLUMNAR_MIN_ROWS are mirrored from SQLite into a DuckDB database file, streamed through
+#Arrow record batches with the column types the loader chose. execute_sql_query then runs aggregations
+#on those tables in DuckDB, which scans columns instead of rows and uses every core, and still streams
+#the result rows back without building a DataFrame. Smaller tables, and everything when duckdb isn't
+#installed, stay on SQLite.
+import datetime
+import decimal
+import os
+import re
+import threading
+import time
+import uuid
+
+from common.db import DB_PATH, get_manager, quote_identifier
+from common.sql_guard import split_literals
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+COLUMNAR_DB_PATH = os.getenv("COLUMNAR_DB_PATH", "columnar.duckdb")
+COLUMNAR_MIN_ROWS = int(os.getenv("COLUMNAR_MIN_ROWS", "1000000")) #Tables this large are mirrored.
+SQL_ENGINE = os.getenv("SQL_ENGINE", "auto") #"auto", "sqlite" or "duckdb".
+
+_DUCKDB_TYPES = {"INTEGER": "BIGINT", "REAL": "DOUBLE", "TEXT": "VARCHAR"}
+_LIKE_RE = re.compile(r"\blike\b", re.IGNORECASE)
+_FLOAT_CAST_RE = re.compile(r"\bas\s+(?:real|float)\b", re.IGNORECASE)
+
+
+def columnar_available():
+    return duckdb is not None
+
+
+def _to_duckdb(text):
+    text = _LIKE_RE.sub("ILIKE", text)
+    return _FLOAT_CAST_RE.sub("AS DOUBLE", text)
+
+
+def to_duckdb_dialect(query):
+    #The generated SQL is written for SQLite, so outside string literals and quoted identifiers:
+    #- LIKE becomes ILIKE: SQLite's LIKE ignores ASCII case, DuckDB's doesn't.
+    #- CAST(... AS REAL/FLOAT) becomes AS DOUBLE: SQLite's REAL is 64-bit, DuckDB's is 32-bit and would
+    #  turn 19.99 into 19.9899997711.
+    #Integer division is configured on the connection instead.
+    return "".join(text if is_literal else _to_duckdb(text) for text, is_literal in split_literals(query))
+
+
+def python_value(value):
+    #The value as SQLite would have returned it: DuckDB gives Decimal for arithmetic with decimal
+    #literals (SUM(qty * 1.5)) and date/time objects, which the result formatter's json.dumps and
+    #the service's responses can't serialise.
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta, uuid.UUID)):
+        return str(value)
+    return value
+
+
+class ColumnarStore:
+    #threads: DuckDB worker threads per query (default: all cores).
+    def __init__(self, db_path=COLUMNAR_DB_PATH, threads=None):
+        self.db_path = db_path
+        self._conn = duckdb.connect(db_path)
+        self._conn.execute(f"SET threads = {int(threads or os.cpu_count() or 1)}")
+        self._conn.execute("SET integer_division = true") #5 / 2 = 2, as in SQLite.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirrored_tables (table_name VARCHAR PRIMARY KEY, rows BIGINT, mirrored_at DOUBLE)"
+        )
+        #Queries come from the LLM: they may not read or write files (read_csv('/etc/...'), COPY, ATTACH).
+        #Mirroring still works, since it only scans Arrow data registered from Python.
+        self._conn.execute("SET enable_external_access = false")
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._tables = {name: rows for name, rows in self._conn.execute(
+            "SELECT table_name, rows FROM _mirrored_tables").fetchall()}
+
+    def cursor(self):
+        #DuckDB connections aren't safe to share between threads; every thread gets its own cursor.
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self._conn.cursor()
+        return cursor
+
+    def has_table(self, table_name):
+        return table_name in self._tables
+
+    def table_rows(self, table_name):
+        return self._tables.get(table_name, 0)
+
+    def mirror_table(self, table_name, affinities, sqlite_db_path=DB_PATH, batch_rows=100_000, parquet_path=None):
+        #Copies the table into DuckDB, batch by batch: from its Parquet copy when there is one (already
+        #columnar and typed), else from SQLite. Queries keep using the previous copy until the new one
+        #is swapped in.
+        import pandas as pd
+        import pyarrow as pa
+        started = time.perf_counter()
+        arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string()}
+        names = list(affinities)
+        schema = pa.schema([(name, arrow_types[affinities[name]]) for name in names])
+        staging = quote_identifier(f"{table_name}__loading")
+        column_sql = ", ".join(f"{quote_identifier(name)} {_DUCKDB_TYPES[affinities[name]]}" for name in names)
+        if parquet_path is not None:
+            import pyarrow.parquet as pq
+            batches = (pa.Table.from_batches([batch]) for batch in
+                       pq.ParquetFile(parquet_path, memory_map=True).iter_batches(batch_size=batch_rows, columns=names))
+            source = None
+        else:
+            source = get_manager(sqlite_db_path).connection().execute(
+                f"SELECT {', '.join(quote_identifier(name) for name in names)} FROM {quote_identifier(table_name)}")
+            #Faster than building per-column lists.
+            batches = (pa.Table.from_pandas(pd.DataFrame.from_records(batch, columns=names), schema=schema,
+                                            preserve_index=False)
+                       for batch in iter(lambda: source.fetchmany(batch_rows), []))
+        rows, in_transaction = 0, False
+        with self._write_lock:
+            conn = self._conn.cursor()
+            try:
+                conn.execute(f"CREATE OR REPLACE TABLE {staging} ({column_sql})")
+                for batch in batches:
+                    conn.register("_batch", batch)
+                    conn.execute(f"INSERT INTO {staging} SELECT * FROM _batch")
+                    conn.unregister("_batch")
+                    rows += batch.num_rows
+                conn.execute("BEGIN TRANSACTION")
+                in_transaction = True
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+                conn.execute(f"ALTER TABLE {staging} RENAME TO {quote_identifier(table_name)}")
+                conn.execute("INSERT OR REPLACE INTO _mirrored_tables VALUES (?, ?, ?)", (table_name, rows, time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                if in_transaction:
+                    conn.execute("ROLLBACK")
+                conn.execute(f"DROP TABLE IF EXISTS {staging}")
+                raise
+            finally:
+                if source is not None:
+                    source.close()
+                conn.close()
+            self._tables[table_name] = rows
+        print(f"Mirrored '{table_name}' ({rows} rows) into DuckDB in {time.perf_counter() - started:.1f}s")
+        return rows
+
+    def drop_table(self, table_name):
+        with self._write_lock:
+            self._conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+            self._conn.execute("DELETE FROM _mirrored_tables WHERE table_name = ?", (table_name,))
+            self._tables.pop(table_name, None)
+
+    def execute(self, query, max_rows, timeout):
+        #Runs an already validated query. Returns (rows as dicts, truncated); raises TimeoutError when
+        #the query is interrupted after timeout seconds.
+        cursor = self.cursor()
+        timer = threading.Timer(timeout, cursor.interrupt)
+        timer.start()
+        try:
+            cursor.execute(to_duckdb_dialect(query))
+            columns = [column[0] for column in cursor.description]
+            result = []
+            while len(result) < max_rows:
+                rows = cursor.fetchmany(min(1000, max_rows - len(result)))
+                if not rows:
+                    break
+                result.extend({column: python_value(value) for column, value in zip(columns, row)} for row in rows)
+            truncated = len(result) >= max_rows and cursor.fetchone() is not None
+        except duckdb.InterruptException as e:
+            raise TimeoutError(str(e)) from e
+        finally:
+            timer.cancel()
+        return result, truncated
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_columnar_store(db_path=COLUMNAR_DB_PATH):
+    #One ColumnarStore per DuckDB file for the whole process, or None when duckdb isn't installed.
+    if duckdb is None:
+        return None
+    with _stores_lock:
+        if db_path not in _stores:
+            try:
+                _stores[db_path] = ColumnarStore(db_path)
+            except duckdb.IOException as e:
+                #The file is locked by another process: this one stays on SQLite.
+                print(f"Columnar engine disabled: {e}")
+                _stores[db_path] = None
+        return _stores[db_path]
+
+
+def sync_table(table_name, rows, affinities, sqlite_db_path=DB_PATH, parquet_path=None):
+    #Called after a table is (re)loaded: mirrors it when it is large enough for the columnar engine,
+    #and drops an outdated mirror otherwise.
+    store = get_columnar_store() if SQL_ENGINE != "sqlite" else None
+    if store is None:
+        return False
+    if rows >= COLUMNAR_MIN_ROWS or SQL_ENGINE == "duckdb":
+        store.mirror_table(table_name, affinities, sqlite_db_path, parquet_path=parquet_path)
+        return True
+    if store.has_table(table_name):
+        store.drop_table(table_name)
+    return False
+
+
+def choose_engine(tables):
+    #"duckdb" when every table the query reads is mirrored (and large enough, unless SQL_ENGINE forces
+    #duckdb), else "sqlite".
+    if SQL_ENGINE == "sqlite" or not tables:
+        return "sqlite"
+    store = get_columnar_store()
+    if store is None or not all(store.has_table(table) for table in tables):
+        return "sqlite"
+    if SQL_ENGINE == "duckdb" or max(store.table_rows(table) for table in tables) >= COLUMNAR_MIN_ROWS:
+        return "duckdb"
+    return "sqlite"
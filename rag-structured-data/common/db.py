@@ -1,6 +1,136 @@
+#SQLite access layer shared by the loader and the query executor.
+#Every thread gets its own long-lived connection (sqlite3 connections must not be shared across threads),
+#opened once per database and closed when the thread ends, with WAL journaling, so one session can load a file while others keep querying,
+#plus tuned cache/mmap settings and a larger prepared-statement cache.
+import os
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from itertools import count
 
-def save_to_sqlite(df, table_name, db_path):
-    conn = sqlite3.connect(db_path)
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
-    conn.close()
+DB_PATH = os.getenv("STRUCTURED_DB_PATH", "uploaded_data.db")
+
+PRAGMAS = {
+    "journal_mode": "WAL", #Readers don't block the writer and the writer doesn't block readers.
+    "synchronous": "NORMAL", #Safe with WAL, and far fewer fsyncs than FULL.
+    "cache_size": -64 * 1024, #Page cache in KiB (negative value): 64 MiB per connection.
+    "mmap_size": 256 * 1024 * 1024, #Read pages through a memory map instead of read() calls.
+    "temp_store": "MEMORY", #Sorts and temporary indexes for GROUP BY/ORDER BY stay in memory.
+    "busy_timeout": 30000, #Wait up to 30s for a lock instead of failing with "database is locked".
+}
+
+
+class _ThreadConnection:
+    #Holds a thread's connection in the manager's thread-local storage. Python drops a thread's
+    #thread-local values when the thread ends, and the finalizer set on this holder then closes the
+    #connection, so worker threads that come and go don't leak database handles.
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class ConnectionManager:
+    #cached_statements: how many prepared statements each connection keeps for reuse.
+    def __init__(self, db_path=DB_PATH, cached_statements=256, pragmas=None):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {} #key -> open connection of a live thread, for close_all
+        self._keys = count()
+
+    def connection(self):
+        #The calling thread's connection, opened on first use.
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements, check_same_thread=False)
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            holder = self._local.holder = _ThreadConnection(conn)
+            key = next(self._keys)
+            with self._lock:
+                self._connections[key] = conn
+            weakref.finalize(holder, _close_connection, self._connections, self._lock, key, conn)
+        return holder.conn
+
+    @contextmanager
+    def transaction(self):
+        #Runs the block as one write transaction on this thread's connection.
+        conn = self.connection()
+        if conn.in_transaction:
+            conn.commit() #Finish the implicit transaction Python's sqlite3 may have opened.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def open_connections(self):
+        with self._lock:
+            return len(self._connections)
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass #Closed already, or owned by a thread that is busy with it.
+        self._local = threading.local()
+
+
+def _close_connection(connections, lock, key, conn):
+    #Finalizer of a _ThreadConnection: the thread that owned conn has ended.
+    with lock:
+        connections.pop(key, None)
+    try:
+        conn.close()
+    except sqlite3.ProgrammingError:
+        pass
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path=DB_PATH):
+    #One ConnectionManager per database file for the whole process.
+    with _managers_lock:
+        manager = _managers.get(db_path)
+        if manager is None:
+            manager = _managers[db_path] = ConnectionManager(db_path)
+        return manager
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def save_to_sqlite(df, table_name, db_path=DB_PATH):
+    #The new data is written to a staging table and swapped in with a rename, all in one transaction, so
+    #queries from other sessions see either the old table or the complete new one, never a half-loaded
+    #table, and a failed write leaves no staging table behind. (DataFrame.to_sql commits on its own, so
+    #the staging table is created and filled here instead.)
+    import pandas as pd
+
+    manager = get_manager(db_path)
+    staging = f"{table_name}__loading"
+    df = df.copy()
+    df.columns = [str(name) for name in df.columns]
+    for name in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[name]):
+            df[name] = df[name].dt.strftime("%Y-%m-%d %H:%M:%S")
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    with manager.transaction() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+        conn.execute(pd.io.sql.get_schema(df, staging))
+        conn.executemany(f"INSERT INTO {quote_identifier(staging)} VALUES ({', '.join('?' * len(df.columns))})",
+                         rows)
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+        conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table_name)}")
@@ -0,0 +1,245 @@
+#Workload-driven index advisor for the uploaded tables.
+#Every executed query is logged with its shape (the SQL with literals replaced by ?) and latency. The
+#columns it filters on (equality first, then one range column) or groups by are counted, and once the
+#same column set has been used min_hits times an index on it is created, extended with the other
+#columns the query reads so it is covering when that stays small. Automatic indexes the planner hasn't
+#used for unused_seconds are dropped again. All of this runs on one background thread, so the query path
+#only pays for queueing a log entry; report() compares the latency of each shape before and after an
+#automatic index started serving it. The log keeps the latest INDEX_ADVISOR_LOG_ROWS queries.
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.db import DB_PATH, get_manager, quote_identifier
+from common.sql_guard import strip_sql, table_aliases
+
+INDEX_PREFIX = "idx_auto_"
+MAX_INDEX_COLUMNS = 4 #Covering columns are only added while the index stays this narrow.
+MAX_LOG_ROWS = int(os.getenv("INDEX_ADVISOR_LOG_ROWS", "100000")) #Query log entries kept for report().
+
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_WHERE_RE = re.compile(r"\bwhere\b(.*?)(?=\bgroup\s+by\b|\border\s+by\b|\bhaving\b|\blimit\b|\bwindow\b|$)",
+                       re.IGNORECASE | re.DOTALL)
+_GROUP_RE = re.compile(r"\bgroup\s+by\b(.*?)(?=\bhaving\b|\border\s+by\b|\blimit\b|\bwindow\b|$)",
+                       re.IGNORECASE | re.DOTALL)
+_EQUALITY_OPS = ("=", "==", "in", "is")
+_RANGE_OPS = ("<", ">", "<=", ">=", "between")
+_PLAN_INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+
+
+def query_shape(query):
+    #The query with literals replaced by ? and whitespace collapsed: queries differing only in values
+    #share a shape.
+    shape = _NUMBER_RE.sub("?", strip_sql(query, keep_identifiers=True).replace("''", "?"))
+    return " ".join(shape.split()).lower()
+
+
+def _column_pattern(columns):
+    names = "|".join(re.escape(name) for name in sorted(columns, key=len, reverse=True))
+    return re.compile(rf'(?:(\w+)\.)?(?<![\w"])"?({names})"?(?![\w"])', re.IGNORECASE)
+
+
+def index_candidates(conn, query):
+    #[(table, key columns, covering columns)] for the tables the query filters or groups.
+    #Subqueries are not looked into; unqualified columns are only attributed when the query reads one table.
+    aliases = table_aliases(conn, query)
+    tables = set(aliases.values())
+    if not tables:
+        return []
+    stripped = strip_sql(query, keep_identifiers=True) #Column names like "Unit Price" are quoted.
+    candidates = []
+    for table in sorted(tables):
+        columns = {row[1].lower(): row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")}
+        if not columns:
+            continue
+        pattern = _column_pattern(columns)
+
+        def own_columns(text, with_ops=False):
+            found = []
+            for match in pattern.finditer(text):
+                qualifier, name = match.groups()
+                if qualifier is not None and aliases.get(qualifier) != table:
+                    continue
+                if qualifier is None and len(tables) > 1:
+                    continue
+                column = columns[name.lower()]
+                if with_ops:
+                    op = re.match(r"\s*(==|=|<=|>=|<|>|\bin\b|\bis\b|\bbetween\b)", text[match.end():], re.IGNORECASE)
+                    found.append((column, op.group(1).lower() if op else None))
+                else:
+                    found.append(column)
+            return found
+
+        where = _WHERE_RE.search(stripped)
+        group = _GROUP_RE.search(stripped)
+        equality, ranges = [], []
+        for column, op in own_columns(where.group(1), with_ops=True) if where else []:
+            if op in _EQUALITY_OPS and column not in equality:
+                equality.append(column)
+            elif op in _RANGE_OPS and column not in ranges:
+                ranges.append(column)
+        key = equality + [column for column in ranges[:1] if column not in equality]
+        if not key and group:
+            key = list(dict.fromkeys(own_columns(group.group(1))))
+        if not key:
+            continue
+        rest = [column for column in dict.fromkeys(own_columns(stripped)) if column not in key]
+        covering = rest if len(key) + len(rest) <= MAX_INDEX_COLUMNS else []
+        candidates.append((table, tuple(key[:MAX_INDEX_COLUMNS]), tuple(covering)))
+    return candidates
+
+
+class IndexAdvisor:
+    #min_hits: queries on the same column set before an index is created.
+    #unused_seconds: automatic indexes unused for this long are dropped.
+    #max_indexes_per_table: automatic indexes kept per table (each one slows down loading).
+    #max_log_rows: query log entries kept; older ones are deleted every 50 queries.
+    def __init__(self, db_path=DB_PATH, min_hits=3, unused_seconds=7 * 24 * 3600, max_indexes_per_table=5,
+                 max_log_rows=MAX_LOG_ROWS):
+        self.db_path = db_path
+        self.min_hits = min_hits
+        self.unused_seconds = unused_seconds
+        self.max_indexes_per_table = max_indexes_per_table
+        self.max_log_rows = max_log_rows
+        self.manager = get_manager(db_path)
+        self._hits = {} #(table, key columns) -> count
+        self._logged = 0
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+        self._worker.submit(self._create_tables).result()
+
+    def _create_tables(self):
+        with self.manager.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _query_log ("
+                " executed_at REAL NOT NULL,"
+                " shape TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " seconds REAL NOT NULL,"
+                " used_index TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_log_shape ON _query_log(shape)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _auto_indexes ("
+                " index_name TEXT PRIMARY KEY,"
+                " table_name TEXT NOT NULL,"
+                " columns TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+
+    def record(self, query, seconds):
+        #Called after a query ran successfully; the analysis happens on the background thread.
+        self._worker.submit(self._analyze, query, seconds, time.time())
+
+    def flush(self):
+        #Waits until every recorded query has been analysed (and any index it triggered built).
+        self._worker.submit(lambda: None).result()
+
+    def _analyze(self, query, seconds, executed_at):
+        try:
+            conn = self.manager.connection()
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+            used = [match.group(1) for *_, detail in plan for match in [_PLAN_INDEX_RE.search(detail)] if match]
+            used_auto = [name for name in used if name.startswith(INDEX_PREFIX)]
+            with self.manager.transaction() as conn:
+                conn.execute("INSERT INTO _query_log VALUES (?, ?, ?, ?, ?)",
+                             (executed_at, query_shape(query), query, seconds, used_auto[0] if used_auto else None))
+                conn.executemany("UPDATE _auto_indexes SET last_used = ? WHERE index_name = ?",
+                                 [(executed_at, name) for name in used_auto])
+            for table, key, covering in index_candidates(conn, query):
+                with self._lock:
+                    hits = self._hits[(table, key)] = self._hits.get((table, key), 0) + 1
+                if hits >= self.min_hits:
+                    self._ensure_index(conn, table, key, covering)
+            self._logged += 1
+            if self._logged % 50 == 0:
+                self.trim_log()
+                self.drop_unused()
+        except Exception as e:
+            print(f"Index advisor skipped a query: {e}")
+
+    def _existing_indexes(self, conn, table):
+        #{index name: [columns]} for the table's indexes.
+        indexes = {}
+        for row in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+            name = row[1]
+            indexes[name] = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(name)})")]
+        return indexes
+
+    def _ensure_index(self, conn, table, key, covering):
+        indexes = self._existing_indexes(conn, table)
+        wanted = {c.lower() for c in covering}
+        for columns in indexes.values():
+            columns = [c.lower() for c in columns if c is not None]
+            if columns[:len(key)] == [c.lower() for c in key] and wanted <= set(columns):
+                return #An existing index already starts with these columns and covers the query.
+        if sum(name.startswith(INDEX_PREFIX) for name in indexes) >= self.max_indexes_per_table:
+            return
+        columns = list(key) + list(covering)
+        index_name = f"{INDEX_PREFIX}{table}_{'_'.join(columns)}"
+        started = time.perf_counter()
+        with self.manager.transaction() as conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} ON {quote_identifier(table)} "
+                         f"({', '.join(quote_identifier(c) for c in columns)})")
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO _auto_indexes VALUES (?, ?, ?, ?, ?)",
+                         (index_name, table, ",".join(columns), now, now))
+        #Fresh statistics so the planner picks the new index where it helps; analysis_limit makes ANALYZE
+        #sample each index instead of reading all of it.
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute(f"ANALYZE {quote_identifier(table)}")
+        print(f"Index advisor created {index_name} in {time.perf_counter() - started:.1f}s")
+
+    def trim_log(self):
+        #Deletes all but the latest max_log_rows query log entries (rowids grow with every insert).
+        with self.manager.transaction() as conn:
+            conn.execute("DELETE FROM _query_log WHERE rowid <= (SELECT MAX(rowid) FROM _query_log) - ?",
+                         (self.max_log_rows,))
+
+    def drop_unused(self):
+        #Drops automatic indexes the planner hasn't used for unused_seconds, and forgets indexes that
+        #vanished with their table (a reloaded file replaces the table).
+        conn = self.manager.connection()
+        existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        cutoff = time.time() - self.unused_seconds
+        with self.manager.transaction() as conn:
+            for index_name, last_used in conn.execute("SELECT index_name, last_used FROM _auto_indexes").fetchall():
+                if index_name in existing and last_used >= cutoff:
+                    continue
+                if index_name in existing:
+                    conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(index_name)}")
+                    print(f"Index advisor dropped unused index {index_name}")
+                conn.execute("DELETE FROM _auto_indexes WHERE index_name = ?", (index_name,))
+
+    def report(self):
+        #Per query shape: runs and average latency without and with an automatic index.
+        conn = self.manager.connection()
+        shapes = {}
+        for shape, indexed, runs, avg_seconds, index_name in conn.execute(
+            "SELECT shape, used_index IS NOT NULL, COUNT(*), AVG(seconds), MAX(used_index)"
+            " FROM _query_log GROUP BY shape, used_index IS NOT NULL"
+        ):
+            entry = shapes.setdefault(shape, {"shape": shape, "runs_before": 0, "avg_ms_before": None,
+                                              "runs_after": 0, "avg_ms_after": None, "index": None})
+            suffix = "after" if indexed else "before"
+            entry[f"runs_{suffix}"] = runs
+            entry[f"avg_ms_{suffix}"] = avg_seconds * 1000
+            if indexed:
+                entry["index"] = index_name
+        return sorted(shapes.values(), key=lambda entry: -(entry["runs_before"] + entry["runs_after"]))
+
+
+_advisors = {}
+_advisors_lock = threading.Lock()
+
+
+def get_advisor(db_path=DB_PATH):
+    #One IndexAdvisor per database file for the whole process.
+    with _advisors_lock:
+        advisor = _advisors.get(db_path)
+        if advisor is None:
+            advisor = _advisors[db_path] = IndexAdvisor(db_path)
+        return advisor
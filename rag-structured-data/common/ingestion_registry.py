@@ -0,0 +1,119 @@
+#Registry of loaded structured files.
+#Streamlit re-executes app.py on every interaction, so without this every keystroke in the query box
+#re-read the file, rewrote its table and rebuilt the metadata. Each loaded table is recorded with the
+#content hash of its file, its row count, column affinities and metadata; a rerun on the same file finds
+#that record and reuses the table as is. The registry lives in the same database as the tables it
+#describes, so a record can never outlive (or refer to a different copy of) its table.
+import hashlib
+import json
+import os
+import time
+
+from common.db import DB_PATH, get_manager
+
+REGISTRY_TABLE = "_ingestion_registry"
+
+
+def source_fingerprint(source):
+    #Cheap identity of a file that doesn't read its contents: path, size and modification time for files
+    #on disk, Streamlit's upload id for uploaded files. None when the source has neither.
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        return f"path:{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
+    file_id = getattr(source, "file_id", None)
+    if file_id:
+        return f"upload:{file_id}:{getattr(source, 'size', '')}"
+    return None
+
+
+def file_sha256(source, block_size=1024 * 1024):
+    #Hashes a path or file-like object in blocks; a file-like object is rewound afterwards.
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+class IngestionRegistry:
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.manager = get_manager(db_path)
+        with self.manager.transaction() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} ("
+                " table_name TEXT PRIMARY KEY,"
+                " file_name TEXT,"
+                " fingerprint TEXT,"
+                " content_hash TEXT NOT NULL,"
+                " rows INTEGER NOT NULL,"
+                " columns TEXT NOT NULL,"
+                " metadata TEXT NOT NULL,"
+                " loaded_at REAL NOT NULL)"
+            )
+
+    def _record(self, table_name):
+        conn = self.manager.connection()
+        row = conn.execute(
+            f"SELECT table_name, file_name, fingerprint, content_hash, rows, columns, metadata, loaded_at"
+            f" FROM {REGISTRY_TABLE} WHERE table_name = ?",
+            (table_name,),
+        ).fetchone()
+        if row is None:
+            return None
+        table_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+        ).fetchone()
+        if not table_exists:
+            return None #Dropped outside the app: the file has to be loaded again.
+        record = dict(zip(("table_name", "file_name", "fingerprint", "content_hash", "rows", "columns",
+                           "metadata", "loaded_at"), row))
+        record["columns"] = json.loads(record["columns"])
+        record["metadata"] = json.loads(record["metadata"])
+        return record
+
+    def get(self, table_name):
+        #The record for table_name whatever file it came from, or None (for queries by table name).
+        return self._record(table_name)
+
+    def lookup(self, table_name, source):
+        #The record for table_name if it was loaded from this very file, else None.
+        #The fingerprint is checked first so an unchanged file isn't even read; only when it differs
+        #(a new upload of possibly the same bytes, or a touched file) is the content hash compared.
+        record = self._record(table_name)
+        if record is None:
+            return None
+        fingerprint = source_fingerprint(source)
+        if fingerprint is not None and fingerprint == record["fingerprint"]:
+            return record
+        if file_sha256(source) != record["content_hash"]:
+            return None
+        if fingerprint is not None:
+            with self.manager.transaction() as conn:
+                conn.execute(f"UPDATE {REGISTRY_TABLE} SET fingerprint = ? WHERE table_name = ?",
+                             (fingerprint, table_name))
+            record["fingerprint"] = fingerprint
+        return record
+
+    def save(self, table_name, source, file_name, rows, columns, metadata, content_hash=None):
+        #content_hash: file_sha256(source), when the caller has computed it already.
+        with self.manager.transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {REGISTRY_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (table_name, file_name, source_fingerprint(source), content_hash or file_sha256(source), rows,
+                 json.dumps(columns), json.dumps(metadata), time.time()),
+            )
+
+    def forget(self, table_name):
+        with self.manager.transaction() as conn:
+            conn.execute(f"DELETE FROM {REGISTRY_TABLE} WHERE table_name = ?", (table_name,))
+
+    def list_tables(self):
+        conn = self.manager.connection()
+        return [name for (name,) in conn.execute(f"SELECT table_name FROM {REGISTRY_TABLE} ORDER BY table_name")]
@@ -1,8 +1,9 @@
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+from gemini_client import get_chat_model #Gemini, imported and configured on first use
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+#None uses the process-wide Gemini model, created on first use; assign another model
+#(e.g. gemini_fakes.FakeChatModel) to use that for SQL generation and answers instead.
+model = None
 
-model = genai.GenerativeModel("gemini-2.5-flash")
+
+def get_model():
+    return model or get_chat_model()
@@ -0,0 +1,249 @@
+#Streaming bulk loader for CSV/XLSX uploads.
+#The file is read in chunks (never as one DataFrame), column types are inferred once from a sample and
+#locked for the rest of the file, the table is created with matching SQLite affinities, and rows go in
+#with executemany inside large transactions. Indexes are built after the data is in.
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from common.db import DB_PATH, get_manager, quote_identifier
+from telemetry import traced
+
+try:
+    import resource #Not available on Windows; peak RSS is then reported as None.
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    #Peak resident set size of this process so far.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 #bytes on macOS, KiB on Linux
+
+
+def infer_affinity(series):
+    #SQLite column affinity for a sampled column.
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        #Integer columns with missing values come back as float from pandas.
+        if len(values) and np.all(np.mod(values, 1) == 0) and values.abs().max() < 2 ** 53:
+            return "INTEGER"
+        return "REAL"
+    return "TEXT"
+
+
+def _sqlite_values(series, affinity):
+    #Column values as Python objects sqlite3 can bind (numpy scalars can't be), with missing values as None.
+    if affinity == "INTEGER" and pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=object)
+        mask = series.isna().to_numpy()
+        integral = ~mask & (np.mod(series.fillna(0).to_numpy(), 1) == 0)
+        values[integral] = series.to_numpy()[integral].astype(np.int64).astype(object)
+        values[mask] = None
+        return values.tolist()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+    values = series.to_numpy(dtype=object)
+    values[pd.isna(series).to_numpy()] = None
+    return values.tolist()
+
+
+def _iter_csv_chunks(source, chunk_rows, text_columns, engine):
+    if engine == "pyarrow":
+        #pandas' pyarrow engine can't read in chunks, so use pyarrow's streaming CSV reader directly.
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        convert_options = pacsv.ConvertOptions(column_types={name: pa.string() for name in text_columns})
+        reader = pacsv.open_csv(source, read_options=pacsv.ReadOptions(block_size=16 * 1024 * 1024),
+                                convert_options=convert_options)
+        for batch in reader:
+            yield batch.to_pandas()
+        return
+    #Text columns are read as strings in every chunk, so values such as zip codes keep their leading zeros.
+    yield from pd.read_csv(source, chunksize=chunk_rows, dtype={name: str for name in text_columns})
+
+
+def _iter_xlsx_chunks(source, chunk_rows, sheet_name=None):
+    #openpyxl's read-only mode streams rows instead of building the whole workbook in memory.
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"column_{i + 1}" for i, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(columns)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _iter_parquet_chunks(source, chunk_rows):
+    #Record batches of a Parquet file, read through a memory map.
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(source, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def parquet_affinity(arrow_type):
+    import pyarrow as pa
+    if pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type):
+        return "INTEGER"
+    if pa.types.is_floating(arrow_type):
+        return "REAL"
+    return "TEXT"
+
+
+def xlsx_sheet_names(source):
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+        _rewind(source)
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def read_typed_chunks(source, file_ext=None, chunk_rows=100_000, sample_rows=10_000, engine=None, sheet_name=None):
+    #Returns (column affinities, sample DataFrame, iterator of chunk DataFrames) for a CSV/XLSX/Parquet
+    #file. The types are inferred once from the sample and every chunk is read with them.
+    if file_ext is None:
+        file_ext = os.path.splitext(getattr(source, "name", str(source)))[-1]
+    file_ext = file_ext.lower()
+
+    if file_ext == ".parquet":
+        #Parquet files carry their schema: no inference needed.
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(source)
+        affinities = {name: parquet_affinity(schema.field(name).type) for name in schema.names}
+        sample = next(_iter_parquet_chunks(source, sample_rows), pd.DataFrame(columns=schema.names))
+        return affinities, sample, _iter_parquet_chunks(source, chunk_rows)
+
+    #Infer column types from a sample and lock them for the whole file.
+    if file_ext == ".csv":
+        sample = pd.read_csv(source, nrows=sample_rows)
+        _rewind(source)
+        raw_sample = pd.read_csv(source, nrows=sample_rows, dtype=str)
+    elif file_ext == ".xlsx":
+        sample = next(_iter_xlsx_chunks(source, sample_rows, sheet_name), pd.DataFrame())
+    else:
+        raise ValueError(f"Unsupported file format: {file_ext}")
+    _rewind(source)
+    affinities = {str(name): infer_affinity(sample[name]) for name in sample.columns}
+    if file_ext == ".csv":
+        #Codes such as zip codes or ids with leading zeros look numeric but must stay text.
+        for name in sample.columns:
+            if affinities[str(name)] == "INTEGER" and raw_sample[name].str.match(r"^-?0\d").any():
+                affinities[str(name)] = "TEXT"
+                sample[name] = raw_sample[name]
+    text_columns = [name for name, affinity in affinities.items() if affinity == "TEXT"]
+
+    if file_ext == ".csv":
+        chunks = _iter_csv_chunks(source, chunk_rows, text_columns, engine)
+    else:
+        chunks = _iter_xlsx_chunks(source, chunk_rows, sheet_name)
+    return affinities, sample, chunks
+
+
+@traced("load_table")
+def load_file_to_sqlite(source, table_name, file_ext=None, db_path=DB_PATH, chunk_rows=100_000,
+                        sample_rows=10_000, commit_rows=500_000, engine=None, indexes=(), sheet_name=None,
+                        progress_callback=None):
+    #Loads a CSV/XLSX/Parquet file (path or file-like object) into table_name and returns load statistics:
+    #rows, seconds, rows_per_sec, peak_rss_mb, the column affinities and a small sample DataFrame
+    #(for previews and extract_metadata).
+    #engine: "pyarrow" to parse CSV with pyarrow's multithreaded streaming reader, else pandas' C parser.
+    #commit_rows: rows per write transaction.
+    #indexes: columns (or tuples of columns) to index once the data is loaded.
+    #progress_callback: optional callable(rows loaded so far), called after every chunk.
+    started = time.perf_counter()
+
+    #1. Column types, locked for the whole file.
+    affinities, sample, chunks = read_typed_chunks(source, file_ext, chunk_rows, sample_rows, engine, sheet_name)
+
+    #2. Create a staging table with proper affinities and bulk-insert into it. Readers keep using the
+    #   current table until the staging table is swapped in.
+    manager = get_manager(db_path)
+    conn = manager.connection()
+    staging = f"{table_name}__loading"
+    column_sql = ", ".join(f"{quote_identifier(name)} {affinity}" for name, affinity in affinities.items())
+    insert_sql = (f"INSERT INTO {quote_identifier(staging)} VALUES "
+                  f"({', '.join('?' * len(affinities))})")
+    #The staging table is thrown away if the process dies mid-load, so it doesn't need fsyncs.
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    conn.execute("PRAGMA synchronous=OFF")
+    rows_loaded = 0
+    try:
+        with manager.transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+            conn.execute(f"CREATE TABLE {quote_identifier(staging)} ({column_sql})")
+        pending = 0
+        conn.execute("BEGIN IMMEDIATE")
+        for chunk in chunks:
+            chunk.columns = [str(name) for name in chunk.columns]
+            columns = [_sqlite_values(chunk[name], affinity) if name in chunk else [None] * len(chunk)
+                       for name, affinity in affinities.items()]
+            conn.executemany(insert_sql, zip(*columns))
+            rows_loaded += len(chunk)
+            pending += len(chunk)
+            if pending >= commit_rows:
+                conn.commit()
+                conn.execute("BEGIN IMMEDIATE")
+                pending = 0
+            if progress_callback:
+                progress_callback(rows_loaded)
+        conn.commit()
+        #The swap and everything after it (indexes, registry) changes live data and must be durable again.
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+
+        #3. Swap the new table in and build the indexes, now that all rows are there.
+        with manager.transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+            conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table_name)}")
+            for index in indexes:
+                index_columns = (index,) if isinstance(index, str) else tuple(index)
+                index_name = quote_identifier(f"idx_{table_name}_{'_'.join(index_columns)}")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {quote_identifier(table_name)} "
+                             f"({', '.join(quote_identifier(c) for c in index_columns)})")
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+        raise
+    finally:
+        conn.execute(f"PRAGMA synchronous={synchronous}") #In case the load failed before the swap.
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "table_name": table_name,
+        "rows": rows_loaded,
+        "seconds": seconds,
+        "rows_per_sec": rows_loaded / seconds if seconds > 0 else float("inf"),
+        "peak_rss_mb": peak_rss_mb(),
+        "columns": affinities,
+        "sample": sample,
+    }
+    print(f"Loaded {rows_loaded} rows into '{table_name}' in {seconds:.1f}s "
+          f"({stats['rows_per_sec']:.0f} rows/sec, peak RSS {stats['peak_rss_mb'] or 0:.0f} MB)")
+    return stats
@@ -0,0 +1,134 @@
+#Parquet copies of uploaded files, keyed by content hash.
+#The first time a file is seen it is parsed once and written as compressed, dictionary-encoded Parquet
+#(one dataset per XLSX sheet). Later loads, profiling and previews read those files instead of parsing
+#the CSV/XLSX again: Parquet keeps the column types, is read through a memory map, and lets readers
+#pick only the columns and row groups they need.
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from common.loader import read_typed_chunks, xlsx_sheet_names
+
+PARQUET_CACHE_DIR = os.getenv("PARQUET_CACHE_DIR", "parquet_cache")
+ROW_GROUP_ROWS = 100_000 #Rows per row group: the unit profiling samples and readers skip by.
+SAMPLE_ROW_GROUPS = 8 #Row groups read at most for a profiling sample.
+
+
+def _arrow_schema(affinities):
+    import pyarrow as pa
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string()}
+    return pa.schema([(name, types[affinity]) for name, affinity in affinities.items()])
+
+
+def _arrow_table(chunk, affinities, schema):
+    #The chunk converted to the locked column types (integer columns with gaps arrive as floats,
+    #text columns may hold numbers or dates from XLSX cells).
+    import pyarrow as pa
+    chunk.columns = [str(name) for name in chunk.columns]
+    columns = {}
+    for name, affinity in affinities.items():
+        series = chunk[name] if name in chunk else pd.Series([None] * len(chunk), dtype=object)
+        if affinity == "INTEGER":
+            series = pd.to_numeric(series, errors="coerce").astype("Int64")
+        elif affinity == "REAL":
+            series = pd.to_numeric(series, errors="coerce").astype("float64")
+        else:
+            series = series.astype(object).map(str, na_action="ignore")
+        columns[name] = series
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+
+def _dataset_name(sheet_name):
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", sheet_name) or "sheet"
+
+
+def write_parquet(source, path, file_ext=None, sheet_name=None, chunk_rows=ROW_GROUP_ROWS, engine=None):
+    #Converts one CSV file or XLSX sheet to Parquet, chunk by chunk. Returns (rows, affinities).
+    import pyarrow.parquet as pq
+    affinities, _, chunks = read_typed_chunks(source, file_ext, chunk_rows, engine=engine, sheet_name=sheet_name)
+    schema = _arrow_schema(affinities)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd", use_dictionary=True) as writer:
+        for chunk in chunks:
+            writer.write_table(_arrow_table(chunk, affinities, schema), row_group_size=chunk_rows)
+            rows += len(chunk)
+    return rows, affinities
+
+
+class ParquetCache:
+    #directory: one sub-directory per content hash, with a manifest.json listing its datasets.
+    def __init__(self, directory=PARQUET_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, content_hash):
+        #The manifest ({"datasets": [{"sheet", "path", "rows", "columns"}], ...}) or None.
+        manifest_path = os.path.join(self.directory, content_hash, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for dataset in manifest["datasets"]:
+            dataset["path"] = os.path.join(self.directory, content_hash, dataset["file"])
+        return manifest
+
+    def store(self, source, content_hash, file_ext, engine=None):
+        #Converts the file (every sheet of an XLSX workbook) and returns its manifest. The datasets are
+        #written to a temporary directory and renamed into place, so a half-written cache is never used.
+        existing = self.get(content_hash)
+        if existing is not None:
+            return existing
+        started = time.perf_counter()
+        file_ext = file_ext.lower()
+        sheets = xlsx_sheet_names(source) if file_ext == ".xlsx" else [None]
+        staging = tempfile.mkdtemp(prefix=f".{content_hash}.", dir=self.directory)
+        try:
+            datasets = []
+            for sheet_name in sheets:
+                file_name = f"{_dataset_name(sheet_name) if sheet_name else 'data'}.parquet"
+                rows, affinities = write_parquet(source, os.path.join(staging, file_name), file_ext, sheet_name,
+                                                 engine=engine)
+                datasets.append({"sheet": sheet_name, "file": file_name, "rows": rows, "columns": affinities})
+                if hasattr(source, "seek"):
+                    source.seek(0)
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump({"content_hash": content_hash, "created_at": time.time(), "datasets": datasets}, f)
+            try:
+                os.rename(staging, os.path.join(self.directory, content_hash))
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True) #Another session cached the same file first.
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        print(f"Cached {len(datasets)} Parquet dataset(s) for {content_hash[:12]} in {time.perf_counter() - started:.1f}s")
+        return self.get(content_hash)
+
+
+def read_parquet_sample(path, sample_rows, columns=None):
+    #Up to sample_rows rows spread over the file: at most SAMPLE_ROW_GROUPS row groups picked at even
+    #intervals, so only those row groups (and only the requested columns) are decompressed however
+    #large the file is.
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    groups = parquet_file.num_row_groups
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    wanted = min(groups, SAMPLE_ROW_GROUPS)
+    picked = sorted({round(i * (groups - 1) / max(1, wanted - 1)) for i in range(wanted)})
+    table = parquet_file.read_row_groups(picked, columns=columns)
+    if table.num_rows > sample_rows:
+        step = table.num_rows / sample_rows
+        table = table.take([int(i * step) for i in range(sample_rows)])
+    return table.to_pandas()
+
+
+def read_parquet_head(path, rows=5):
+    #The first rows, for previews, without reading past the first batch.
+    import pyarrow.parquet as pq
+    batch = next(pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=rows), None)
+    return batch.to_pandas() if batch is not None else pd.DataFrame()
@@ -0,0 +1,205 @@
+#Persistent NL-to-SQL plan cache for route_query.
+#A plan (the function call the LLM chose: SQL or a static answer) is stored under the table's schema
+#fingerprint and the normalised question, so asking the same question about the same schema again skips
+#the LLM call. SQL plans are also stored as templates with the question's literal values (numbers, quoted
+#strings and known column values) replaced by placeholders, so "sales in North" can reuse the SQL
+#generated for "sales in South". Least recently used plans are evicted past max_entries, and a table's
+#plans are dropped when it is loaded with a different schema.
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+_SPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_QUOTED_RE = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+
+
+def normalize_question(question):
+    #Case, repeated whitespace and trailing punctuation don't change the question.
+    return _SPACE_RE.sub(" ", question.strip().lower()).rstrip(" ?!.")
+
+
+def schema_fingerprint(metadata):
+    #Table name plus column names and types; statistics from the profile are left out, since new data
+    #with the same columns doesn't change which SQL answers a question.
+    schema = [metadata["table_name"], [[str(c["name"]), c["type"]] for c in metadata["columns"]]]
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()
+
+
+def _known_values(metadata):
+    #Text values listed in the table profile, lower-cased -> stored spelling.
+    values = {}
+    for column in metadata["columns"]:
+        for value, _ in column.get("profile", {}).get("top_values", []):
+            if isinstance(value, str) and not value.isdigit():
+                values.setdefault(value.lower(), value)
+    return values
+
+
+def extract_literals(question, metadata):
+    #[(start, end, value, is_number)] for the literal values mentioned in the question.
+    found = []
+    for match in _QUOTED_RE.finditer(question):
+        found.append((match.start(), match.end(), match.group(1) or match.group(2), False))
+    lowered = question.lower()
+    for lowered_value, value in _known_values(metadata).items():
+        for match in re.finditer(rf"(?<!\w){re.escape(lowered_value)}(?!\w)", lowered):
+            found.append((match.start(), match.end(), value, False))
+    for match in _NUMBER_RE.finditer(question):
+        found.append((match.start(), match.end(), match.group(), True))
+    #Keep the earliest, longest match where spans overlap (e.g. a number inside a quoted string).
+    found.sort(key=lambda literal: (literal[0], -literal[1]))
+    literals, end = [], -1
+    for literal in found:
+        if literal[0] >= end:
+            literals.append(literal)
+            end = literal[1]
+    return literals
+
+
+def _sql_literal(value, is_number):
+    return value if is_number else "'" + value.replace("'", "''") + "'"
+
+
+def _literal_pattern(value, is_number):
+    if is_number:
+        return re.compile(rf"(?<![\w.]){re.escape(value)}(?![\w.])")
+    return re.compile(re.escape(_sql_literal(value, False)), re.IGNORECASE)
+
+
+def template_question(question, literals):
+    #The normalised question with its literals replaced by {0}, {1}, ...
+    parts, last = [], 0
+    for i, (start, end, _, _) in enumerate(literals):
+        parts.append(question[last:start] + "{" + str(i) + "}")
+        last = end
+    parts.append(question[last:])
+    return normalize_question("".join(parts))
+
+
+def make_template(question, sql, metadata):
+    #(template question, SQL template, literal kinds), or None when the question has no literals or the
+    #SQL doesn't use each of them exactly once.
+    literals = extract_literals(question, metadata)
+    if not literals or len({value.lower() for _, _, value, _ in literals}) < len(literals):
+        return None
+    sql_template = sql.replace("{", "{{").replace("}", "}}")
+    for i, (_, _, value, is_number) in enumerate(literals):
+        pattern = _literal_pattern(value, is_number)
+        if len(pattern.findall(sql_template)) != 1:
+            return None
+        sql_template = pattern.sub("{" + str(i) + "}", sql_template)
+    kinds = [is_number for _, _, _, is_number in literals]
+    return template_question(question, literals), sql_template, kinds
+
+
+class PlanCache:
+    #max_entries: plans kept on disk; least recently used ones are evicted past it.
+    def __init__(self, db_path="plan_cache.db", max_entries=5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits_exact = 0
+        self.hits_template = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        #kind is "exact" (question -> function call) or "template" (question template -> SQL template).
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            " fingerprint TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " table_name TEXT NOT NULL,"
+            " plan TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (fingerprint, kind, question))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_last_used ON plans(last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_table ON plans(table_name)")
+        self._conn.commit()
+
+    def _get(self, fingerprint, kind, question):
+        row = self._conn.execute(
+            "SELECT plan FROM plans WHERE fingerprint = ? AND kind = ? AND question = ?",
+            (fingerprint, kind, question),
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE plans SET last_used = ? WHERE fingerprint = ? AND kind = ? AND question = ?",
+            (time.time(), fingerprint, kind, question),
+        )
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def lookup(self, question, metadata):
+        #Returns (function_call, "exact" | "template") or (None, None).
+        fingerprint = schema_fingerprint(metadata)
+        with self._lock:
+            function_call = self._get(fingerprint, "exact", normalize_question(question))
+            if function_call is not None:
+                self.hits_exact += 1
+                return function_call, "exact"
+        literals = extract_literals(question, metadata)
+        if literals:
+            with self._lock:
+                template = self._get(fingerprint, "template", template_question(question, literals))
+            if template is not None and template["kinds"] == [is_number for _, _, _, is_number in literals]:
+                sql = template["sql"].format(*(_sql_literal(value, is_number) for _, _, value, is_number in literals))
+                with self._lock:
+                    self.hits_template += 1
+                return {"name": "execute_sql_query", "arguments": {"query": sql}}, "template"
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def store(self, question, metadata, function_call):
+        #Call only for plans that worked (SQL that executed without an error, or a static answer).
+        fingerprint = schema_fingerprint(metadata)
+        table_name = metadata["table_name"]
+        rows = [(fingerprint, "exact", normalize_question(question), table_name, json.dumps(function_call))]
+        if function_call.get("name") == "execute_sql_query":
+            template = make_template(question, function_call.get("arguments", {}).get("query", ""), metadata)
+            if template is not None:
+                template_question, sql_template, kinds = template
+                rows.append((fingerprint, "template", template_question, table_name,
+                             json.dumps({"sql": sql_template, "kinds": kinds})))
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?, ?, ?)", [row + (now,) for row in rows])
+            count = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM plans WHERE rowid IN (SELECT rowid FROM plans ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += count - self.max_entries
+            self._conn.commit()
+
+    def invalidate_table(self, table_name, keep_fingerprint=None):
+        #Drops the table's plans, except those for keep_fingerprint (the table's current schema).
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM plans WHERE table_name = ? AND fingerprint != ?", (table_name, keep_fingerprint or ""))
+            self._conn.commit()
+
+    def stats(self):
+        hits = self.hits_exact + self.hits_template
+        total = hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        return {
+            "hits_exact": self.hits_exact,
+            "hits_template": self.hits_template,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
@@ -1,29 +1,112 @@
+import os
 import sqlite3
-import pandas as pd
+import time
+from common.db import DB_PATH, get_manager
+from common.sql_guard import QUERY_TIMEOUT_SECONDS, SQLGuardError, prepare_query, read_only, table_aliases, time_budget
+from common.columnar import choose_engine, get_columnar_store
+from common.index_advisor import get_advisor
+from telemetry import traced
 
-DB_PATH = "uploaded_data.db"
+MAX_RESULT_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000")) #Rows returned at most; the rest is not fetched.
+FETCH_SIZE = 1000 #Rows pulled from SQLite per fetchmany call.
+INDEX_ADVISOR = os.getenv("INDEX_ADVISOR", "1") == "1" #Log queries and create indexes for hot columns.
 
-def execute_sql_query(query: str):
+def _run_sqlite(conn, query, max_rows, timeout):
+    with read_only(conn), time_budget(conn, timeout):
+        cursor = conn.execute(query)
+        try:
+            columns = [column[0] for column in cursor.description]
+            #Rows are streamed in batches straight into dicts, without building a DataFrame,
+            #and fetching stops at max_rows.
+            result = []
+            while len(result) < max_rows:
+                rows = cursor.fetchmany(min(FETCH_SIZE, max_rows - len(result)))
+                if not rows:
+                    break
+                result.extend(dict(zip(columns, row)) for row in rows)
+            truncated = len(result) >= max_rows and cursor.fetchone() is not None
+        finally:
+            cursor.close()
+    return result, truncated
+
+
+@traced("execute_sql_query")
+def execute_sql_query(query: str, max_rows=None, db_path=None, timeout=None, engine=None):
+    #engine: "sqlite" or "duckdb"; by default large tables mirrored into the columnar store run on
+    #DuckDB and everything else on SQLite (see common/columnar.py).
+    max_rows = MAX_RESULT_ROWS if max_rows is None else max_rows
+    timeout = QUERY_TIMEOUT_SECONDS if timeout is None else timeout
     try:
-        conn = sqlite3.connect(DB_PATH)
+        #Reuses this thread's pooled connection instead of opening a new one per query.
+        conn = get_manager(db_path or DB_PATH).connection()
 
-        # Check if it's a SELECT query-as it returns the data
-        if query.strip().lower().startswith("select"):
-            df = pd.read_sql_query(query, conn)
-            result = df.to_dict(orient="records")#converts the df to list of dictionaries
-            message = {
-                "query": query,
-                "result": result
-            }
-        
+        #Only a single read-only query whose estimated cost is acceptable gets here; it comes back
+        #with a LIMIT when it had none.
+        guarded_query = prepare_query(conn, query, max_rows)
+        engine = engine or choose_engine(set(table_aliases(conn, query).values()))
+        started = time.perf_counter()
+        if engine == "duckdb":
+            try:
+                result, truncated = get_columnar_store().execute(guarded_query, max_rows, timeout)
+            except TimeoutError:
+                raise
+            except Exception as e:
+                #SQLite-only syntax or functions (julianday, date('now'), ...): run it where it was meant to run.
+                print(f"DuckDB could not run the query, using SQLite: {e}")
+                engine = "sqlite"
+                started = time.perf_counter()
+        if engine == "sqlite":
+            result, truncated = _run_sqlite(conn, guarded_query, max_rows, timeout)
+        seconds = time.perf_counter() - started
+        if INDEX_ADVISOR and engine == "sqlite":
+            get_advisor(db_path or DB_PATH).record(query, seconds)
+        message = {
+            "query": query,
+            "result": result,#list of dictionaries, one per row
+            "engine": engine
+        }
+        if truncated:
+            message["truncated"] = True
+            message["max_rows"] = max_rows
 
-        conn.close()
         return message
 
+    except SQLGuardError as e:
+        return {
+            "query": query,
+            "error": str(e),
+            "error_type": e.kind,
+            **e.details
+        }
+    except TimeoutError:
+        return {
+            "query": query,
+            "error": f"❌ Query stopped after {timeout:g}s. Try a more specific question.",
+            "error_type": "timeout"
+        }
+    except sqlite3.DatabaseError as e:
+        if "not authorized" in str(e):
+            return {
+                "query": query,
+                "error": "❌ Only read-only queries can be executed.",
+                "error_type": "rejected"
+            }
+        if "interrupted" in str(e):
+            return {
+                "query": query,
+                "error": f"❌ Query stopped after {timeout:g}s. Try a more specific question.",
+                "error_type": "timeout"
+            }
+        return {
+            "query": query,
+            "error": f"❌ SQL Execution Error: {e}",
+            "error_type": "sql_error"
+        }
     except Exception as e:
         return {
             "query": query,
-            "error": f"❌ SQL Execution Error: {e}"
+            "error": f"❌ SQL Execution Error: {e}",
+            "error_type": "sql_error"
         }
 
 def get_static_response():
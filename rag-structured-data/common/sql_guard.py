@@ -0,0 +1,216 @@
+#Checks LLM-generated SQL before execute_sql_query runs it.
+#1. The statement must be a single read-only query (SELECT or WITH ... SELECT). An SQLite authorizer
+#   enforces this while the statement is prepared, so a write hidden anywhere in it is refused too.
+#2. EXPLAIN QUERY PLAN is used to estimate how many rows the query will visit: full scans of large tables
+#   nested inside each other (missing join conditions, cross joins) are rejected before they run.
+#3. A LIMIT is added when the query has none, and a progress handler aborts it past a wall-clock budget.
+#Refusals raise SQLGuardError with a kind ("rejected" or "too_expensive"); execute_sql_query turns them,
+#and queries aborted by the time budget ("timeout"), into structured error results.
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from common.db import quote_identifier
+
+MAX_SCAN_ROWS = int(os.getenv("SQL_MAX_SCAN_ROWS", "50000000")) #Estimated rows a query may visit.
+QUERY_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "10"))
+PROGRESS_STEPS = 10000 #SQLite VM instructions between two checks of the clock.
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_LIMIT_RE = re.compile(r"\blimit\b", re.IGNORECASE)
+_PLAN_TABLE_RE = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS (\S+))?")
+_IDENTIFIER = r'"(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|\w+'
+_TABLE_REF_RE = re.compile(rf"(?:\bfrom|\bjoin|,)\s+({_IDENTIFIER})(?:\s+(?:as\s+)?({_IDENTIFIER}))?", re.IGNORECASE)
+_NOT_ALIASES = frozenset(
+    "where join inner left right full outer cross natural on using group order limit having union except"
+    " intersect window as".split()
+)
+
+#Actions a read-only query needs; anything else (writes, ATTACH, PRAGMA, ...) is denied.
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+if hasattr(sqlite3, "SQLITE_RECURSIVE"):
+    _ALLOWED_ACTIONS.add(sqlite3.SQLITE_RECURSIVE)
+
+
+class SQLGuardError(Exception):
+    #kind: "rejected" (not a single read-only query) or "too_expensive" (estimated cost over the limit).
+    #details: extra fields for the error result, e.g. estimated_rows and full_scans.
+    def __init__(self, kind, message, **details):
+        super().__init__(message)
+        self.kind = kind
+        self.details = details
+
+
+def strip_sql(query, keep_identifiers=False):
+    #The query without comments and with string literals and quoted identifiers blanked out, so keywords
+    #and semicolons inside them are not mistaken for SQL.
+    #keep_identifiers: only blank string literals, for callers that look for column names.
+    query = _COMMENT_RE.sub(" ", query)
+    if keep_identifiers:
+        return _STRING_RE.sub(lambda match: "''" if match.group().startswith("'") else match.group(), query)
+    return _STRING_RE.sub("''", query)
+
+
+def split_literals(query):
+    #[(text, is_literal)] pieces of the query, string literals and quoted identifiers marked, so rewrites
+    #can leave them untouched.
+    pieces, last = [], 0
+    for match in _STRING_RE.finditer(query):
+        pieces.append((query[last:match.start()], False))
+        pieces.append((match.group(), True))
+        last = match.end()
+    pieces.append((query[last:], False))
+    return pieces
+
+
+def _top_level(query):
+    #Drops parenthesised parts (subqueries, function arguments) of a stripped query.
+    depth, kept = 0, []
+    for char in query:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            kept.append(char)
+    return "".join(kept)
+
+
+def validate_sql(query):
+    #Returns the query without a trailing semicolon, or raises SQLGuardError.
+    query = query.strip().rstrip(";").strip()
+    stripped = strip_sql(query).strip()
+    if not stripped:
+        raise SQLGuardError("rejected", "❌ Empty query.")
+    if ";" in stripped:
+        raise SQLGuardError("rejected", "❌ Only a single statement can be executed.")
+    first_word = stripped.split(None, 1)[0].lower()
+    if first_word not in ("select", "with"):
+        raise SQLGuardError("rejected", "❌ Only SELECT queries can be executed.")
+    return query
+
+
+def add_limit(query, limit):
+    #Appends LIMIT when the outermost query has none; existing limits are left alone.
+    if _LIMIT_RE.search(_top_level(strip_sql(query))):
+        return query
+    return f"{query}\nLIMIT {int(limit)}"
+
+
+def _authorizer(action, arg1, arg2, db_name, trigger):
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+@contextmanager
+def read_only(conn):
+    #Refuses every action other than reading while the block runs.
+    conn.set_authorizer(_authorizer)
+    try:
+        yield conn
+    finally:
+        conn.set_authorizer(None)
+
+
+@contextmanager
+def time_budget(conn, seconds):
+    #Aborts the running statement (sqlite3.OperationalError "interrupted") once seconds have passed.
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_STEPS)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def _unquote(identifier):
+    if identifier[0] in "\"`[":
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def table_aliases(conn, query):
+    #{alias: table} for the tables in the query's FROM/JOIN clauses (query plans name tables by alias).
+    tables = {name.lower(): name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(_COMMENT_RE.sub(" ", query)):
+        table = tables.get(_unquote(table).lower())
+        if table is None:
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[_unquote(alias)] = table
+    return aliases
+
+
+def _table_rows(conn, table, cache):
+    #Row count of a table, as recorded at load time when available, else from the largest rowid
+    #(an index lookup, not a count over the table).
+    if table not in cache:
+        rows = None
+        try:
+            found = conn.execute("SELECT rows FROM _ingestion_registry WHERE table_name = ?", (table,)).fetchone()
+            rows = found[0] if found else None
+        except sqlite3.OperationalError:
+            pass #No registry in this database.
+        if rows is None:
+            try:
+                rows = conn.execute(f"SELECT max(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+            except sqlite3.OperationalError:
+                rows = 0 #A view, CTE or WITHOUT ROWID table: not estimated.
+        cache[table] = rows
+    return cache[table]
+
+
+def estimate_cost(conn, query):
+    #(estimated rows visited, full scans) from EXPLAIN QUERY PLAN. Tables joined at the same level
+    #multiply: a full scan inside another full scan visits rows_a * rows_b rows, while an index search
+    #adds only a few rows per outer row. Independent subqueries add up.
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    aliases = table_aliases(conn, query)
+    children = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    sizes, full_scans = {}, []
+
+    def cost(parent):
+        loop, total = 1, 0
+        for node_id, detail in children.get(parent, []):
+            match = _PLAN_TABLE_RE.match(detail)
+            if match:
+                kind, table, alias = match.groups()
+                table = aliases.get(alias or table, table)
+                rows = _table_rows(conn, table, sizes)
+                if kind == "SCAN":
+                    full_scans.append({"table": table, "rows": rows})
+                    loop *= max(rows, 1)
+                elif "AUTOMATIC" in detail:
+                    total += rows #SQLite builds a temporary index over the table first.
+            total += cost(node_id)
+        return total + (loop if loop > 1 else 0)
+
+    return cost(0), full_scans
+
+
+def prepare_query(conn, query, max_rows, max_scan_rows=MAX_SCAN_ROWS):
+    #Validates the query and returns it with a row limit (max_rows + 1, so truncation can be detected),
+    #or raises SQLGuardError.
+    query = validate_sql(query)
+    try:
+        with read_only(conn):
+            estimated_rows, full_scans = estimate_cost(conn, query)
+    except sqlite3.DatabaseError as e:
+        if "not authorized" in str(e):
+            raise SQLGuardError("rejected", "❌ Only read-only queries can be executed.") from e
+        raise
+    if estimated_rows > max_scan_rows:
+        tables = ", ".join(f"{scan['table']} ({scan['rows']:,} rows)" for scan in full_scans)
+        raise SQLGuardError(
+            "too_expensive",
+            f"❌ Query rejected: it would visit about {estimated_rows:,} rows (full scans of {tables}). "
+            "Check the join conditions or add filters.",
+            estimated_rows=estimated_rows, full_scans=full_scans,
+        )
+    return add_limit(query, max_rows + 1)
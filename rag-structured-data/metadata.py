@@ -1,15 +1,183 @@
-def extract_metadata(df, table_name):
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from common.db import DB_PATH, get_manager, quote_identifier
+from common.parquet_cache import read_parquet_sample
+
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "20000")) #Rows profiled at most per table.
+METADATA_TOKEN_BUDGET = int(os.getenv("METADATA_TOKEN_BUDGET", "1200")) #Size of the summary sent to the LLM.
+MAX_VALUE_CHARS = 40 #Longer values are cut in the profile.
+
+
+def extract_metadata(df, table_name, rows=None, profile=None):
     metadata = {
         "table_name": table_name,
         "columns": []
     }
+    if rows is not None:
+        metadata["row_count"] = rows
 
     for col in df.columns:
         dtype = str(df[col].dtype)#getting the data type of each column
         #adding each of the column name and its datatype to the metadata
-        metadata["columns"].append({
+        column = {
             "name": col,
             "type": dtype
-        })
+        }
+        #adding the column statistics from profile_table, when the table was profiled
+        if profile is not None and col in profile["columns"]:
+            column["profile"] = profile["columns"][col]
+        metadata["columns"].append(column)
+    if profile is not None:
+        metadata["profile_sampled_rows"] = profile["sampled_rows"]
 
     return metadata
+
+
+def combine_metadata(metadatas):
+    #One schema for a question over several tables, so route_query can JOIN or UNION them in one query.
+    #"columns" lists every column qualified with its table name (what the plan cache fingerprints and
+    #takes known values from); "tables" keeps the per-table metadata for summarize_metadata.
+    if len(metadatas) == 1:
+        return metadatas[0]
+    return {
+        "table_name": ", ".join(metadata["table_name"] for metadata in metadatas),
+        "tables": list(metadatas),
+        "columns": [dict(column, name=f"{metadata['table_name']}.{column['name']}")
+                    for metadata in metadatas for column in metadata["columns"]],
+    }
+
+
+def _sample_table(conn, table_name, sample_rows):
+    #Reads at most sample_rows random rows. Rows are picked by rowid (a B-tree lookup each), so the cost
+    #depends on the sample size, not on the table size.
+    table = quote_identifier(table_name)
+    max_rowid = conn.execute(f"SELECT max(rowid) FROM {table}").fetchone()[0] or 0
+    if max_rowid <= sample_rows:
+        return pd.read_sql_query(f"SELECT * FROM {table}", conn)
+    #choice(n) draws from range(n) without materialising it (numpy switches to a set-based draw when the
+    #sample is small against n), so picking the rowids stays O(sample_rows) too.
+    rowids = np.random.default_rng(0).choice(max_rowid, size=sample_rows, replace=False) + 1
+    rowids.sort()
+    parts = []
+    for start in range(0, len(rowids), 900): #Stay below SQLite's bound-parameter limit.
+        batch = [int(rowid) for rowid in rowids[start:start + 900]]
+        parts.append(pd.read_sql_query(
+            f"SELECT * FROM {table} WHERE rowid IN ({','.join('?' * len(batch))})", conn, params=batch))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _json_value(value):
+    #Plain Python value for the profile (numpy scalars and timestamps aren't JSON serialisable).
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+        value = value[:MAX_VALUE_CHARS] + "…"
+    return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+
+def profile_column(series, top_k=5, samples=3):
+    #Null rate, distinct count, min/max, the most frequent values and a few sample values of one column.
+    values = series.dropna()
+    profile = {
+        "null_rate": round(float(series.isna().mean()), 4) if len(series) else 0.0,
+        "distinct": int(values.nunique()),
+    }
+    if not len(values):
+        return profile
+    if pd.api.types.is_numeric_dtype(values):
+        profile["min"] = _json_value(values.min())
+        profile["max"] = _json_value(values.max())
+    else:
+        values = values.astype(str)
+        profile["min"] = _json_value(values.min()) #Dates stored as text sort correctly too.
+        profile["max"] = _json_value(values.max())
+    if profile["distinct"] == len(values):
+        profile["unique"] = True #Every sampled value is different, e.g. an id column.
+    if profile["distinct"] <= len(values) // 2:
+        #A categorical column: its frequent values are the exact spellings to use in WHERE clauses.
+        counts = values.value_counts()
+        profile["top_values"] = [[_json_value(value), int(count)] for value, count in counts.head(top_k).items()]
+    else:
+        profile["sample_values"] = [_json_value(value) for value in values.head(samples)]
+    return profile
+
+
+def profile_table(table_name, db_path=DB_PATH, sample_rows=PROFILE_SAMPLE_ROWS, top_k=5, samples=3, parquet_path=None):
+    #Column statistics of a loaded table, computed on a random sample for large tables.
+    #parquet_path: the table's Parquet copy (common/parquet_cache.py); when given, the sample is read
+    #from its row groups instead of from SQLite.
+    #Returns {"columns": {name: profile}, "sampled_rows", "seconds"}.
+    started = time.perf_counter()
+    if parquet_path is not None:
+        sample = read_parquet_sample(parquet_path, sample_rows)
+    else:
+        sample = _sample_table(get_manager(db_path).connection(), table_name, sample_rows)
+    profile = {
+        "columns": {col: profile_column(sample[col], top_k, samples) for col in sample.columns},
+        "sampled_rows": len(sample),
+    }
+    profile["seconds"] = time.perf_counter() - started
+    print(f"Profiled '{table_name}' ({len(sample)} sampled rows) in {profile['seconds']:.2f}s")
+    return profile
+
+
+def _format_values(values):
+    return ", ".join(repr(value) for value in values)
+
+
+def _column_line(column, detail):
+    #One line per column; detail 2 = everything, 1 = without sample/top values, 0 = name and type only.
+    line = f"- {column['name']} ({column['type']})"
+    profile = column.get("profile")
+    if profile is None or detail == 0:
+        return line
+    facts = []
+    if profile.get("null_rate"):
+        facts.append(f"{profile['null_rate']:.0%} null")
+    if profile.get("unique"):
+        facts.append("unique")
+    else:
+        facts.append(f"{profile['distinct']} distinct")
+    if "min" in profile:
+        facts.append(f"range {profile['min']!r}..{profile['max']!r}")
+    if detail == 2:
+        if "top_values" in profile:
+            facts.append("values: " + _format_values(value for value, _ in profile["top_values"]))
+        elif "sample_values" in profile:
+            facts.append("e.g. " + _format_values(profile["sample_values"]))
+    return line + ": " + "; ".join(facts)
+
+
+def summarize_metadata(metadata, token_budget=METADATA_TOKEN_BUDGET):
+    #Compact text description of the table for the SQL-generating prompt, kept within token_budget
+    #(estimated at 4 characters per token). Detail is dropped column by column, from the last column
+    #backwards, until the summary fits. Combined metadata (combine_metadata) is summarised table by
+    #table, each within an equal share of the budget.
+    if "tables" in metadata:
+        share = token_budget // max(len(metadata["tables"]), 1)
+        return "\n\n".join(summarize_metadata(table, share) for table in metadata["tables"])
+    header = f"Table: {metadata['table_name']}"
+    if metadata.get("row_count") is not None:
+        header += f" ({metadata['row_count']:,} rows)"
+    if metadata.get("profile_sampled_rows"):
+        header += f"; statistics from {metadata['profile_sampled_rows']:,} sampled rows"
+    columns = metadata["columns"]
+    #Each column's line is formatted once per detail level; the summary length (header, lines and
+    #newlines) is kept as a running total adjusted whenever one column loses detail
+    lines = [_column_line(column, 2) for column in columns]
+    total = len(header) + sum(len(line) + 1 for line in lines)
+    max_chars = token_budget * 4
+    for level in (1, 0):
+        for i in reversed(range(len(columns))):
+            if total <= max_chars:
+                return "\n".join([header] + lines)
+            line = _column_line(columns[i], level)
+            total += len(line) - len(lines[i])
+            lines[i] = line
+    return "\n".join([header] + lines)
@@ -0,0 +1,62 @@
+#Turns SQL results into a natural language answer with the LLM.
+#Shared by the Streamlit app and the HTTP service (service.py at the repository root).
+import json
+
+
+#function to convert raw SQL results into a friendly natural language answer using an LLM.
+#we are passing the data-result(output), query-original question and sql-query-sql query that is executed
+def stream_result_with_llm(data, query, sql_query, stats=None, llm=None):
+    """Use LLM to convert SQL query results into natural language sentences, yielding the text as it is generated"""
+    from common.llm_config import get_model #the gemini model, or the one assigned in llm_config
+    from gemini_client import stream_generate #streaming call to the gemini model
+    
+    #if the length of the result is 0 then sql query is not returning anything
+    if not data or len(data) == 0:
+        yield "No data found matching your query."
+        return
+    
+    # Prepare the data for the LLM, by converting it into json
+    data_str = json.dumps(data, indent=2)
+    
+    # Create a prompt for the LLM to format the answer
+    prompt = f"""
+You are a data assistant. Convert the SQL query result into a natural, conversational sentence.
+
+User's Original Question: "{query}"
+SQL Query Executed: {sql_query}
+Query Result: {data_str}
+
+Instructions:
+- Write a clear, natural sentence that answers the user's question
+- Use the actual values from the result
+- Make it conversational and easy to understand
+- If it's a count, say "The total number of rows is X"
+- If it's a sum, say "The total sum of [column] is X"
+- If it's an average, say "The average [column] is X"
+- If it's multiple records, summarize appropriately
+- Don't include technical SQL terms
+- Just provide the natural language answer, nothing else
+
+Answer:"""
+
+    produced = False
+    try:
+        for text in stream_generate(llm or get_model(), prompt, stats):
+            produced = True
+            yield text
+    except Exception as e:
+        print(f"Formatting the SQL result with the LLM failed: {e}")
+        # Fallback to simple formatting if LLM fails
+        if len(data) == 1 and len(data[0]) == 1:#if there is only 1 row or column or the output is just a single number
+            value = list(data[0].values())[0]
+            fallback = f"The result is {value}."
+        else:
+            fallback = f"Found {len(data)} records in the data."
+        #The first part of the answer has been sent already, so say that the rest is missing instead of
+        #failing the whole response.
+        yield f" (The answer was cut off. {fallback})" if produced else fallback
+
+
+def format_result_with_llm(data, query, sql_query):
+    """Use LLM to convert SQL query results into natural language sentences"""
+    return "".join(stream_result_with_llm(data, query, sql_query)).strip()
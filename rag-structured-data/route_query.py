@@ -1,11 +1,66 @@
 #in this file ot os decided which function has to be executed
 #and converts the natural language to sql query
-from common.llm_config import model #importing gemini-2.5 model
+from common.llm_config import get_model #the gemini-2.5 model, created on first use
 from common.sql_executor import execute_sql_query  # getting the sql executor function
+from metadata import summarize_metadata #compact, token-budgeted description of the table
+from common.plan_cache import PlanCache #reuses the SQL generated for earlier questions
+from telemetry import record_llm, span, traced #per-stage latency metrics
 import json
+import os
 import re
 
-def route_query(user_query, metadata):
+plan_cache = PlanCache(
+    db_path=os.getenv("PLAN_CACHE_PATH", "plan_cache.db"),
+    max_entries=int(os.getenv("PLAN_CACHE_SIZE", "5000")),
+)
+
+
+def run_function_call(function_call, raw_text=None):
+    name = function_call.get("name")
+    args = function_call.get("arguments", {})
+    query_or_text = args.get("query")
+
+    # If SQL, execute it and return result
+    if name == "execute_sql_query":
+        query_result = execute_sql_query(query_or_text)
+        return {
+            "function_call": function_call,
+            "result": query_result
+        }
+
+    # If static response
+    elif name == "get_static_response":
+        return {
+            "function_call": function_call,
+            "result": query_or_text
+        }
+
+    else:
+        return {
+            "error": "❌ Unknown function name in Gemini response.",
+            "function_call": function_call,
+            "raw": raw_text
+        }
+
+
+def _failed(routed):
+    #True for an unknown function or SQL that raised an error.
+    result = routed.get("result")
+    return "error" in routed or (isinstance(result, dict) and "error" in result)
+
+
+@traced("route_query")
+def route_query(user_query, metadata, use_cache=True):
+    # 0. A question already answered against this schema reuses its plan without calling Gemini
+    if use_cache:
+        function_call, cached = plan_cache.lookup(user_query, metadata)
+        if function_call is not None:
+            routed = run_function_call(function_call)
+            if not _failed(routed):
+                routed["cached"] = cached
+                return routed
+            # The cached SQL failed (e.g. a template filled with unusual values): ask Gemini instead
+
     # 1. System instruction
     system_instruction = """
 You are a data assistant. Your task is to analyze the user query and metadata of the uploaded table and decide:
@@ -23,22 +78,36 @@ Output format:
   }
 }
 Only use column names and table name from metadata. Don’t assume extra fields.
+When the metadata lists a column's values, use those exact spellings in filters.
+"""
+    if "tables" in metadata:
+        # Several tables (metadata.combine_metadata): the answer may need all of them
+        system_instruction += """The metadata describes several tables. JOIN or UNION them when the question needs more than one,
+and qualify column names with their table name.
 """
 
     # 2. Create input message
     message = [
         {"role": "user", "parts": [
             f"{system_instruction}\n\n"
-            f"Table Metadata:\n{json.dumps(metadata, indent=2)}\n\n"
+            f"Table Metadata:\n{summarize_metadata(metadata)}\n\n"
             f"User Query: {user_query}"
         ]}
     ]
 
     # 3. Call Gemini
+    model = get_model()
     try:
-        response = model.generate_content(message)
+        with span("sql_generation"):
+            response = model.generate_content(message)
     except Exception as e:
         return {"error": f"❌ Error calling Gemini: {e}"}
+    try:
+        response_bytes = len(response.text.encode("utf-8"))
+    except ValueError:
+        response_bytes = 0 #No text parts (blocked response); the parsing below reports it.
+    record_llm("generate", getattr(model, "model_name", type(model).__name__),
+               len(message[0]["parts"][0].encode("utf-8")), response_bytes, getattr(response, "usage_metadata", None))
 
     # 4. Parse JSON from Gemini
     try:
@@ -51,31 +120,13 @@ Only use column names and table name from metadata. Don’t assume extra fields.
         result_json = json.loads(raw_text)
         function_call = result_json.get("function_call", {})#from the function call defined above in system istructions getting the objects
 
-        name = function_call.get("name")
-        args = function_call.get("arguments", {})
-        query_or_text = args.get("query")
-
-        # 5. If SQL, execute it and return result
-        if name == "execute_sql_query":
-            query_result = execute_sql_query(query_or_text)
-            return {
-                "function_call": function_call,
-                "result": query_result
-            }
-
-        # 6. If static response
-        elif name == "get_static_response":
-            return {
-                "function_call": function_call,
-                "result": query_or_text
-            }
-
-        else:
-            return {
-                "error": "❌ Unknown function name in Gemini response.",
-                "function_call": function_call,
-                "raw": raw_text
-            }
+        # 5. Execute the SQL or return the static response
+        routed = run_function_call(function_call, raw_text)
+
+        # 6. Remember plans that worked, for the next time this question is asked
+        if use_cache and not _failed(routed):
+            plan_cache.store(user_query, metadata, function_call)
+        return routed
 
     except Exception as e:
         return {
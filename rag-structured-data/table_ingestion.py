@@ -0,0 +1,85 @@
+#Loading an uploaded CSV/XLSX file as a queryable table, shared by the Streamlit app and the HTTP
+#service (service.py at the repository root):
+#  registry lookup -> Parquet copy -> SQLite table -> profile + metadata -> DuckDB mirror
+#A file that is already loaded (same bytes, same table name) only costs the registry lookup.
+import os
+import time
+
+from common.columnar import sync_table
+from common.ingestion_registry import IngestionRegistry, file_sha256
+from common.loader import load_file_to_sqlite
+from common.parquet_cache import ParquetCache, read_parquet_head
+from common.plan_cache import schema_fingerprint
+from metadata import extract_metadata, profile_table
+from route_query import plan_cache
+from telemetry import traced
+
+TABLE_FILE_TYPES = (".csv", ".xlsx")
+
+ingestion_registry = IngestionRegistry()
+parquet_cache = ParquetCache()
+
+
+def table_name_for(file_name):
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+@traced("ingest_table")
+def ingest_table(source, file_name, table_name=None):
+    #Loads source (a path or file-like object) as table_name (default: the file name without its
+    #extension) unless the registry shows this very file is already loaded under that name.
+    #Returns {"table_name", "rows", "columns", "metadata", "parquet_path", "seconds", "already_loaded"}.
+    file_ext = os.path.splitext(file_name)[-1].lower()
+    if file_ext not in TABLE_FILE_TYPES:
+        raise ValueError(f"Unsupported file format: {file_ext or file_name}")
+    table_name = table_name or table_name_for(file_name)
+    started = time.perf_counter()
+    loaded = ingestion_registry.lookup(table_name, source)
+    if loaded is not None:
+        cached = parquet_cache.get(loaded["content_hash"])
+        return {
+            "table_name": table_name,
+            "rows": loaded["rows"],
+            "columns": loaded["columns"],
+            "metadata": loaded["metadata"],
+            "parquet_path": cached["datasets"][0]["path"] if cached else None,
+            "seconds": time.perf_counter() - started,
+            "already_loaded": True,
+        }
+
+    # Convert the file to Parquet once per content (every sheet of a workbook); loading, profiling and
+    # previews read the Parquet copy instead of parsing the CSV/XLSX again
+    content_hash = file_sha256(source)
+    cached = parquet_cache.get(content_hash) or parquet_cache.store(source, content_hash, file_ext)
+    parquet_path = cached["datasets"][0]["path"]  # the first sheet becomes the table
+    # Stream the Parquet copy into SQLite (uploaded_data.db unless STRUCTURED_DB_PATH is set) batch by batch
+    load_stats = load_file_to_sqlite(parquet_path, table_name, ".parquet")
+    # Metadata from the sample, which has the column types used for the table, with column statistics
+    # profiled from the Parquet copy; the registry keeps both for later uploads of the same file
+    profile = profile_table(table_name, parquet_path=parquet_path)
+    metadata = extract_metadata(load_stats["sample"], table_name, load_stats["rows"], profile)
+    ingestion_registry.save(table_name, source, file_name, load_stats["rows"], load_stats["columns"], metadata,
+                            content_hash)
+    # Large tables are also mirrored into DuckDB, which runs aggregations over them on all cores
+    sync_table(table_name, load_stats["rows"], load_stats["columns"], parquet_path=parquet_path)
+    # Plans generated for an older schema of this table no longer apply
+    plan_cache.invalidate_table(table_name, schema_fingerprint(metadata))
+    return {
+        "table_name": table_name,
+        "rows": load_stats["rows"],
+        "columns": load_stats["columns"],
+        "metadata": metadata,
+        "parquet_path": parquet_path,
+        "seconds": time.perf_counter() - started,
+        "already_loaded": False,
+    }
+
+
+def table_preview(table, rows=5):
+    #The first rows of an ingested table (as returned by ingest_table), as a DataFrame.
+    if table["parquet_path"] is not None:
+        return read_parquet_head(table["parquet_path"], rows)
+    import pandas as pd
+    from common.db import get_manager, quote_identifier
+    return pd.read_sql_query(f"SELECT * FROM {quote_identifier(table['table_name'])} LIMIT {int(rows)}",
+                             get_manager().connection())
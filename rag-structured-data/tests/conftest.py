@@ -0,0 +1,13 @@
+#Imports the pipeline's modules the way app.py does (from rag-structured-data, with the repository root
+#for telemetry.py), and points every database they open at import time to a temporary directory.
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+_data_dir = tempfile.mkdtemp(prefix="structured-tests-")
+for name, file_name in (("STRUCTURED_DB_PATH", "uploaded_data.db"), ("COLUMNAR_DB_PATH", "columnar.duckdb"),
+                        ("PLAN_CACHE_PATH", "plan_cache.db"), ("INGESTION_REGISTRY_PATH", "ingestion_registry.db"),
+                        ("PARQUET_CACHE_DIR", "parquet_cache")):
+    os.environ.setdefault(name, os.path.join(_data_dir, file_name))
+sys.path[:0] = [os.path.dirname(HERE), os.path.dirname(os.path.dirname(HERE))]
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from common.columnar import ColumnarStore, to_duckdb_dialect
+from common.loader import load_file_to_sqlite
+from common.sql_executor import execute_sql_query
+
+QUERIES = [
+    "SELECT region, SUM(qty * 1.5) AS total FROM sales GROUP BY region ORDER BY region",
+    "SELECT region, CAST(price AS REAL) AS price FROM sales ORDER BY price",
+    "SELECT CAST('19.99' AS REAL) AS small, CAST(1234567.89 AS FLOAT) AS large",
+    "SELECT COUNT(*) AS n, SUM(price) AS total FROM sales WHERE region LIKE 'north'",
+]
+
+
+@pytest.fixture(scope="module")
+def sales(tmp_path_factory):
+    #The same table in SQLite and mirrored into DuckDB.
+    data_dir = tmp_path_factory.mktemp("columnar")
+    csv_path = data_dir / "sales.csv"
+    csv_path.write_text("region,qty,price\nNorth,3,19.99\nSouth,5,1234567.89\nNorth,4,0.1\n")
+    db_path = str(data_dir / "data.db")
+    stats = load_file_to_sqlite(str(csv_path), "sales", ".csv", db_path=db_path)
+    store = ColumnarStore(str(data_dir / "columnar.duckdb"))
+    store.mirror_table("sales", stats["columns"], db_path)
+    return db_path, store
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_engines_return_the_same_rows(sales, query):
+    db_path, store = sales
+    sqlite_rows = execute_sql_query(query, db_path=db_path, engine="sqlite")["result"]
+    duckdb_rows, truncated = store.execute(query, max_rows=100, timeout=10)
+    assert not truncated
+    assert duckdb_rows == sqlite_rows
+    json.dumps(duckdb_rows) #What the result formatter sends to the LLM.
+
+
+def test_dialect_rewrites_only_outside_literals():
+    query = """SELECT CAST(x AS real), CAST(y as Float) FROM t WHERE "as real" LIKE 'as float'"""
+    assert to_duckdb_dialect(query) == (
+        """SELECT CAST(x AS DOUBLE), CAST(y AS DOUBLE) FROM t WHERE "as real" ILIKE 'as float'""")
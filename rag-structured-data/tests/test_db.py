@@ -0,0 +1,42 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from common.db import ConnectionManager, save_to_sqlite
+
+
+def test_connections_close_when_their_threads_end(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "data.db"))
+    opened = []
+
+    def query():
+        conn = manager.connection()
+        conn.execute("SELECT 1").fetchone()
+        opened.append(conn)
+
+    for _ in range(20):
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+    assert manager.open_connections() == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+    manager.connection()
+    assert manager.open_connections() == 1
+    manager.close_all()
+    assert manager.open_connections() == 0
+
+
+def test_save_to_sqlite_swaps_in_the_new_table(tmp_path):
+    db_path = str(tmp_path / "data.db")
+    save_to_sqlite(pd.DataFrame({"region": ["North"], "qty": [1]}), "sales", db_path)
+    df = pd.DataFrame({"region": ["North", None], "qty": [2.5, None],
+                       "day": pd.to_datetime(["2024-01-31", None])})
+    save_to_sqlite(df, "sales", db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT * FROM sales").fetchall() == [("North", 2.5, "2024-01-31 00:00:00"),
+                                                                  (None, None, None)]
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert tables == ["sales"]
@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from common.index_advisor import IndexAdvisor, index_candidates, query_shape
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE sales ("Region" TEXT, "Unit Price" REAL, qty INTEGER)')
+    yield conn
+    conn.close()
+
+
+def test_quoted_column_names_are_candidates(conn):
+    query = 'SELECT "Region", SUM(qty) FROM sales WHERE "Unit Price" > 10 GROUP BY "Region"'
+    assert index_candidates(conn, query) == [("sales", ("Unit Price",), ("Region", "qty"))]
+
+
+def test_string_literals_are_not_column_names(conn):
+    query = """SELECT qty FROM sales WHERE "Region" = 'Unit Price'"""
+    assert index_candidates(conn, query) == [("sales", ("Region",), ("qty",))]
+
+
+def test_shapes_keep_quoted_identifiers():
+    assert query_shape('SELECT "Unit Price" FROM sales WHERE qty > 5') != query_shape(
+        'SELECT "Region" FROM sales WHERE qty > 7')
+    assert query_shape("SELECT qty FROM sales WHERE \"Region\" = 'North'") == query_shape(
+        "SELECT qty FROM sales WHERE \"Region\" = 'South'")
+
+
+def test_query_log_keeps_the_latest_rows(tmp_path):
+    advisor = IndexAdvisor(str(tmp_path / "data.db"), min_hits=1000, max_log_rows=5)
+    with advisor.manager.transaction() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    for _ in range(120):
+        advisor.record("SELECT x FROM t", 0.001)
+    advisor.flush()
+    advisor.trim_log()
+    assert advisor.manager.connection().execute("SELECT COUNT(*) FROM _query_log").fetchone()[0] == 5
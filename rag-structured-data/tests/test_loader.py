@@ -0,0 +1,30 @@
+from common import loader
+from common.db import get_manager
+
+
+def test_swap_runs_with_the_previous_synchronous_setting(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "data.db")
+    csv_path = tmp_path / "sales.csv"
+    csv_path.write_text("region,qty\nNorth,3\nSouth,5\n")
+    conn = get_manager(db_path).connection()
+    during_swap = []
+    original = conn.execute
+
+    class Recorder:
+        #sqlite3.Connection.execute can't be patched, so the loader gets a connection proxy.
+        in_transaction = property(lambda self: conn.in_transaction)
+
+        def execute(self, sql, *args):
+            if sql.startswith("ALTER TABLE"):
+                during_swap.append(original("PRAGMA synchronous").fetchone()[0])
+            return original(sql, *args)
+
+        def __getattr__(self, name):
+            return getattr(conn, name)
+
+    manager = get_manager(db_path)
+    monkeypatch.setattr(manager, "connection", lambda: Recorder())
+    stats = loader.load_file_to_sqlite(str(csv_path), "sales", ".csv", db_path=db_path)
+    assert stats["rows"] == 2
+    assert during_swap == [1] #NORMAL, from db.PRAGMAS; the bulk insert ran with OFF (0).
+    assert original("PRAGMA synchronous").fetchone()[0] == 1
@@ -0,0 +1,32 @@
+from metadata import summarize_metadata
+
+PROFILE = {"null_rate": 0.1, "distinct": 3, "min": 1, "max": 9, "top_values": [("North", 4), ("South", 2)]}
+METADATA = {
+    "table_name": "sales",
+    "row_count": 1000,
+    "columns": [{"name": name, "type": "TEXT", "profile": dict(PROFILE)} for name in ("region", "city", "store")],
+}
+
+
+def test_keeps_every_detail_within_the_budget():
+    summary = summarize_metadata(METADATA, token_budget=1000)
+    assert summary.splitlines()[0] == "Table: sales (1,000 rows)"
+    assert summary.count("values: 'North', 'South'") == 3
+
+
+def test_drops_detail_from_the_last_column_first():
+    full = summarize_metadata(METADATA, token_budget=1000)
+    budget = (len(full) - 1) // 4
+    summary = summarize_metadata(METADATA, token_budget=budget)
+    assert len(summary) <= budget * 4
+    lines = summary.splitlines()
+    assert "values:" in lines[1] and "values:" not in lines[3]
+
+
+def test_falls_back_to_names_and_types():
+    summary = summarize_metadata(METADATA, token_budget=1)
+    assert summary.splitlines()[1:] == ["- region (TEXT)", "- city (TEXT)", "- store (TEXT)"]
+
+
+def test_combined_metadata_without_tables_is_empty():
+    assert summarize_metadata({"tables": []}) == ""
@@ -0,0 +1,35 @@
+from gemini_fakes import FakeChatModel, FakeResponseChunk
+from result_formatter import stream_result_with_llm
+
+DATA = [{"region": "North", "total": 7}, {"region": "South", "total": 5}]
+SQL = "SELECT region, SUM(qty) AS total FROM sales GROUP BY region"
+
+
+class FailingChatModel:
+    #Streams `before` and then fails, like a dropped connection mid-answer.
+    def __init__(self, before):
+        self.before = before
+
+    def generate_content(self, prompt, stream=False):
+        for text in self.before:
+            yield FakeResponseChunk(text)
+        raise ConnectionError("stream interrupted")
+
+
+def test_streams_the_model_answer():
+    model = FakeChatModel(lambda prompt: "North sold the most, 7 units.")
+    stats = {}
+    answer = "".join(stream_result_with_llm(DATA, "Which region sold most?", SQL, stats, model))
+    assert answer == "North sold the most, 7 units."
+    assert stats["chars"] == len(answer)
+
+
+def test_falls_back_when_the_model_fails_before_answering():
+    answer = "".join(stream_result_with_llm(DATA, "Which region sold most?", SQL, llm=FailingChatModel([])))
+    assert answer == "Found 2 records in the data."
+
+
+def test_notes_a_cut_off_answer_instead_of_raising():
+    answer = "".join(stream_result_with_llm(DATA, "Which region sold most?", SQL,
+                                            llm=FailingChatModel(["North sold "])))
+    assert answer == "North sold  (The answer was cut off. Found 2 records in the data.)"
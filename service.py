@@ -0,0 +1,415 @@
+#Headless HTTP service for both pipelines, for programmatic and concurrent use:
+#  POST /documents                      upload a PDF/DOCX/PPTX file and index it
+#  POST /documents/{document_id}/query  answer a question from one indexed document
+#  POST /tables                         upload a CSV/XLSX file and load it as a table
+#  POST /tables/{table_name}/query      answer a question about a loaded table
+#  POST /query                          answer a question from several documents and tables at once
+#  GET  /health
+#  GET  /metrics                        per-stage latency histograms and LLM counters (Prometheus text)
+#  GET  /metrics/summary                p50/p95/p99 per stage as JSON
+#The pipelines are blocking (SQLite, Qdrant, Gemini), so they never run on the event loop: every call
+#goes to one bounded thread pool. Ingests and queries each have a concurrency limit, and a request that
+#can't get a slot within API_QUEUE_TIMEOUT seconds is answered 503 instead of queueing without bound.
+#The pipelines' clients, caches and connection pools are module-level, so one process serves all users.
+#Query endpoints answer with JSON, or with "stream": true as newline-delimited JSON events
+#({"type": "plan" | "text" | "done"}) so the answer can be shown while it is generated.
+#Run from the repository root:  uvicorn service:app --host 0.0.0.0 --port 8000
+import asyncio
+import functools
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "rag-gemini-pdf"))
+sys.path.append(os.path.join(ROOT, "rag-structured-data"))
+
+from utils.context_builder import build_context
+from utils.document_registry import file_sha256
+from utils.gemini_llm import answer_cache, embed_fn, stream_answer
+from utils.ingestion import ingest_document
+from utils.qdrant_client import count_document_points, create_or_get_collection, document_registry, warm_up
+from gemini_client import get_chat_model
+from query_planner import fan_out, stream_plan_answer
+from result_formatter import stream_result_with_llm
+from route_query import route_query
+from table_ingestion import TABLE_FILE_TYPES, ingest_table, ingestion_registry, table_name_for, table_preview
+from telemetry import prometheus_text, summary
+
+DOCUMENT_FILE_TYPES = (".pdf", ".docx", ".pptx")
+API_MAX_INGESTS = int(os.getenv("API_MAX_INGESTS", "2")) #Uploads processed at once (CPU and memory heavy).
+API_MAX_QUERIES = int(os.getenv("API_MAX_QUERIES", "16")) #Questions answered at once.
+API_WORKERS = int(os.getenv("API_WORKERS", str(API_MAX_INGESTS + API_MAX_QUERIES))) #Threads running pipeline calls.
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "30")) #Seconds a request may wait for a slot.
+API_MAX_UPLOAD_MB = int(os.getenv("API_MAX_UPLOAD_MB", "200"))
+API_WARM_UP = os.getenv("API_WARM_UP", "1") == "1" #Create the Gemini and vector store clients at startup.
+
+_executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+_DONE = object()
+
+
+class _Limiter:
+    #At most `limit` requests hold a slot; the others wait up to API_QUEUE_TIMEOUT seconds.
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), API_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(503, f"Too many {self.name} in progress, try again shortly",
+                                headers={"Retry-After": "5"})
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "running": self.running, "waiting": self.waiting}
+
+
+ingest_limiter = _Limiter("uploads", API_MAX_INGESTS)
+query_limiter = _Limiter("queries", API_MAX_QUERIES)
+#One ingest per document / table name and per file content at a time: two uploads of the same file would
+#otherwise both write the same points or staging table. key -> [lock, requests holding or waiting for it];
+#an entry is removed when its last request is done, so the dict only holds what is being ingested now.
+_ingest_locks = {}
+
+
+async def run_blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def _iterate_blocking(iterator):
+    #Pulls a blocking iterator item by item on the thread pool.
+    pending = None
+    try:
+        while True:
+            pending = _executor.submit(next, iterator, _DONE)
+            item = await asyncio.wrap_future(pending)
+            pending = None
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            #Closed on the thread pool too, and only after a next() the client stopped waiting for has
+            #returned: closing a generator while another thread runs it fails with "generator already
+            #executing", and its cleanup may block.
+            if pending is not None:
+                pending.add_done_callback(lambda _: close())
+            else:
+                _executor.submit(close)
+
+
+def _ndjson(event):
+    #default=str: results from DuckDB may hold dates and decimals.
+    return json.dumps(event, default=str) + "\n"
+
+
+class _SlotResponse(StreamingResponse):
+    #Streaming response that releases a limiter slot once it has been sent, or failed to send. Released
+    #here rather than in the body generator, which never runs (and so never cleans up) when the client is
+    #gone before streaming starts; a BackgroundTask is skipped on a disconnect as well.
+    def __init__(self, content, limiter, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+def _streamed(events, limiter):
+    #NDJSON response for an async iterator of events; the query slot is held until the stream ends
+    #(or the client goes away).
+    async def body():
+        async for event in events:
+            yield _ndjson(event)
+    return _SlotResponse(body(), limiter, media_type="application/x-ndjson")
+
+
+async def _save_upload(upload, allowed_types):
+    #Copies an upload to a temporary file in 1 MB pieces; the caller deletes it.
+    file_ext = os.path.splitext(upload.filename or "")[-1].lower()
+    if file_ext not in allowed_types:
+        raise HTTPException(415, f"Unsupported file type '{file_ext}'. Expected one of: {', '.join(allowed_types)}")
+    limit = API_MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
+        try:
+            while block := await upload.read(1024 * 1024):
+                size += len(block)
+                if size > limit:
+                    raise HTTPException(413, f"Files are limited to {API_MAX_UPLOAD_MB} MB")
+                await run_blocking(tmp_file.write, block)
+        except BaseException:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    return tmp_file.name
+
+
+@asynccontextmanager
+async def _ingest_lock(key):
+    entry = _ingest_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _ingest_locks[key]
+
+
+async def _ingest(keys, upload, allowed_types, fn, *args):
+    #keys: what the upload writes to (e.g. ("table", name)); the file's content hash is locked as well, so
+    #the same bytes uploaded twice at once are ingested once and the second upload finds them indexed.
+    #The upload is received before taking a slot, so slow clients don't hold one, and the locks are taken
+    #before it too, so uploads waiting for each other don't hold slots that unrelated uploads could use.
+    path = await _save_upload(upload, allowed_types)
+    try:
+        content_hash = await run_blocking(file_sha256, path)
+        async with AsyncExitStack() as locks:
+            for key in sorted({*keys, ("content", content_hash)}): #Always in the same order: no deadlocks.
+                await locks.enter_async_context(_ingest_lock(key))
+            await ingest_limiter.acquire()
+            try:
+                return await run_blocking(fn, path, *args)
+            finally:
+                ingest_limiter.release()
+    finally:
+        os.unlink(path)
+
+
+def _warm_up():
+    #The clients are created on first use; doing it in the background right after startup keeps that
+    #(and the second-long imports behind it) off the first requests without delaying startup.
+    get_chat_model()
+    warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if API_WARM_UP:
+        _executor.submit(_warm_up)
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Unified Document QA", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "workers": API_WORKERS, "uploads": ingest_limiter.stats(), "queries": query_limiter.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/summary")
+async def metrics_summary():
+    return summary()
+
+
+def _index_document(path, name, replaces=None):
+    #Same flow as rag-gemini-pdf/app.py: reuse an indexed copy of these bytes, else stream the file in
+    #(as a new version of the document `replaces`, re-embedding only its changed chunks, when given).
+    content_hash = file_sha256(path)
+    existing = document_registry.find_by_hash(content_hash)
+    if existing and count_document_points(existing["document_id"]):
+        return {"document_id": existing["document_id"], "name": name, "chunks": existing["chunk_count"],
+                "already_indexed": True}
+    create_or_get_collection(clear_existing=False)
+    document_id, chunk_count = ingest_document(path, embed_fn, document_id=replaces, registry=document_registry,
+                                               name=name, content_hash=content_hash)
+    answer_cache.invalidate_document(document_id) # Answers from an earlier version may be outdated
+    return {"document_id": document_id, "name": name, "chunks": chunk_count, "already_indexed": False}
+
+
+@app.post("/documents")
+async def upload_document(file: UploadFile = File(...), replaces: str = Form(None)):
+    #replaces: id of the document this file is a new version of; without it the file is a new document,
+    #even when another one has the same name.
+    name = os.path.basename(file.filename or "document")
+    if replaces and await run_blocking(document_registry.find_by_id, replaces) is None:
+        raise HTTPException(404, f"Unknown document '{replaces}'")
+    #New documents never write to each other, so only a replaced document is locked besides the content.
+    keys = [("document", replaces)] if replaces else []
+    return await _ingest(keys, file, DOCUMENT_FILE_TYPES, _index_document, name, replaces)
+
+
+class DocumentQuery(BaseModel):
+    question: str
+    top_k: int = 5
+    token_budget: Optional[int] = None #Context tokens at most; CONTEXT_TOKEN_BUDGET when not given.
+    stream: bool = False
+
+
+def _document_answer(document_id, request, stats):
+    #Retrieval and context assembly, then the answer as it is generated (or in one piece from the answer cache).
+    chunks, chunk_ids = build_context(request.question, embed_fn, top_k=request.top_k, document_id=document_id,
+                                      token_budget=request.token_budget, stats=stats)
+    yield from stream_answer(chunks, request.question, document_id=document_id, chunk_ids=chunk_ids, stats=stats)
+
+
+@app.post("/documents/{document_id}/query")
+async def query_document(document_id: str, request: DocumentQuery):
+    if await run_blocking(document_registry.find_by_id, document_id) is None:
+        raise HTTPException(404, f"Unknown document '{document_id}'")
+    await query_limiter.acquire()
+    stats = {}
+    parts = _document_answer(document_id, request, stats)
+    if request.stream:
+        async def events():
+            async for text in _iterate_blocking(parts):
+                yield {"type": "text", "text": text}
+            yield {"type": "done", **stats}
+        return _streamed(events(), query_limiter)
+    try:
+        answer = await run_blocking(lambda: "".join(parts).strip())
+    finally:
+        query_limiter.release()
+    return {"document_id": document_id, "answer": answer, **stats}
+
+
+@app.post("/tables")
+async def upload_table(file: UploadFile = File(...), table_name: str = Form(None)):
+    file_name = os.path.basename(file.filename or "table")
+    table_name = table_name or table_name_for(file_name)
+
+    def load(path):
+        table = ingest_table(path, file_name, table_name)
+        preview = table_preview(table)
+        return {
+            "table_name": table["table_name"],
+            "rows": table["rows"],
+            "columns": table["columns"],
+            "seconds": table["seconds"],
+            "already_loaded": table["already_loaded"],
+            "preview": json.loads(preview.to_json(orient="records", date_format="iso")),
+        }
+
+    return await _ingest([("table", table_name)], file, TABLE_FILE_TYPES, load)
+
+
+class TableQuery(BaseModel):
+    question: str
+    answer: bool = True #Also phrase SQL results as a sentence with the LLM.
+    stream: bool = False
+
+
+def _sql_rows(routed):
+    #The rows of a successful SQL result, else None.
+    result = routed.get("result")
+    if routed.get("function_call", {}).get("name") != "execute_sql_query" or not isinstance(result, dict):
+        return None
+    rows = result.get("result")
+    return rows if isinstance(rows, list) and rows else None
+
+
+def _answer_parts(routed, question, stats):
+    rows = _sql_rows(routed)
+    if rows is None:
+        return iter(())
+    sql_query = routed["function_call"].get("arguments", {}).get("query", "")
+    return stream_result_with_llm(rows, question, sql_query, stats)
+
+
+@app.post("/tables/{table_name}/query")
+async def query_table(table_name: str, request: TableQuery):
+    table = await run_blocking(ingestion_registry.get, table_name)
+    if table is None:
+        raise HTTPException(404, f"Unknown table '{table_name}'")
+    await query_limiter.acquire()
+    stats = {}
+    try:
+        routed = await run_blocking(route_query, request.question, table["metadata"])
+    except BaseException:
+        query_limiter.release()
+        raise
+    parts = _answer_parts(routed, request.question, stats) if request.answer else iter(())
+    if request.stream:
+        async def events():
+            yield {"type": "plan", **routed}
+            async for text in _iterate_blocking(parts):
+                yield {"type": "text", "text": text}
+            yield {"type": "done", **stats}
+        return _streamed(events(), query_limiter)
+    try:
+        answer = await run_blocking(lambda: "".join(parts).strip())
+    finally:
+        query_limiter.release()
+    return {**routed, "answer": answer or None, **stats}
+
+
+class PlannedQuery(BaseModel):
+    question: str
+    documents: Optional[List[str]] = None #Document ids to search; None searches every indexed document.
+    search_documents: bool = True
+    tables: List[str] = [] #Table names to query together.
+    top_k: int = 5
+    token_budget: Optional[int] = None
+    latency_budget: Optional[float] = None #Seconds for the search and the SQL; PLANNER_LATENCY_BUDGET by default.
+    stream: bool = False
+
+
+@app.post("/query")
+async def query_all(request: PlannedQuery):
+    #One answer from documents and tables searched in parallel (query_planner.py).
+    for document_id in request.documents or []:
+        if await run_blocking(document_registry.find_by_id, document_id) is None:
+            raise HTTPException(404, f"Unknown document '{document_id}'")
+    tables = []
+    for table_name in request.tables:
+        table = await run_blocking(ingestion_registry.get, table_name)
+        if table is None:
+            raise HTTPException(404, f"Unknown table '{table_name}'")
+        tables.append(table["metadata"])
+    await query_limiter.acquire()
+    stats = {}
+    try:
+        plan = await run_blocking(fan_out, request.question, request.documents, tables, request.top_k,
+                                  request.token_budget, request.latency_budget,
+                                  search_documents=request.search_documents)
+    except BaseException:
+        query_limiter.release()
+        raise
+    summary_fields = {"branches": plan["branches"], "tables": plan["tables"], "document_ids": plan["document_ids"],
+                      **plan["context"]}
+    parts = stream_plan_answer(plan, request.question, stats)
+    if request.stream:
+        async def events():
+            yield {"type": "plan", **summary_fields}
+            async for text in _iterate_blocking(parts):
+                yield {"type": "text", "text": text}
+            yield {"type": "done", **stats}
+        return _streamed(events(), query_limiter)
+    try:
+        answer = await run_blocking(lambda: "".join(parts).strip())
+    finally:
+        query_limiter.release()
+    return {**summary_fields, "answer": answer, **stats}
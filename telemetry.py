@@ -0,0 +1,249 @@
+#Tracing and metrics for both pipelines.
+#span("embed") times a block (or, as @traced("embed"), a function) and records the duration in the
+#histogram of that stage; spans opened inside it become its children in the same trace. LLM calls also
+#count requests, bytes and tokens. Everything is kept in process: prometheus_text() renders it for a
+#Prometheus scrape (service.py serves it on /metrics), summary() gives p50/p95/p99 per stage, and with
+#TELEMETRY_JSONL set every finished span is appended to that file as one JSON line.
+#A span costs under 10 microseconds, negligible next to the millisecond-scale stages it times;
+#TELEMETRY=0 turns recording off.
+import bisect
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+TELEMETRY = os.getenv("TELEMETRY", "1") == "1"
+TELEMETRY_JSONL = os.getenv("TELEMETRY_JSONL") #Path of a JSON-lines span log (off by default).
+
+#Histogram bucket bounds in seconds: 0.1ms to ~2 minutes, each 1.5x the previous one, so estimated
+#percentiles are within half a bucket (+-25%) of the true value.
+BUCKETS = tuple(round(0.0001 * 1.5 ** i, 6) for i in range(35))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) #The last one is +Inf.
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        #Estimated by linear interpolation inside the bucket holding the q-th observation.
+        with self._lock:
+            counts, total, largest = list(self.counts), self.count, self.max
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else largest
+                return min(lower + (upper - lower) * (rank - seen) / count, largest)
+            seen += count
+        return largest
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {} #(name, labels) -> Histogram
+        self.counters = {} #(name, labels) -> float
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        #(histogram items, counter items), safe to iterate while other threads record.
+        with self._lock:
+            return sorted(self.histograms.items(), key=lambda item: item[0]), sorted(self.counters.items())
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+_jsonl_lock = threading.Lock()
+_jsonl_file = None
+
+
+def _write_span(record):
+    global _jsonl_file
+    line = json.dumps(record, default=str) + "\n"
+    with _jsonl_lock:
+        if _jsonl_file is None:
+            _jsonl_file = open(TELEMETRY_JSONL, "a", encoding="utf-8")
+        _jsonl_file.write(line)
+        _jsonl_file.flush()
+
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def set(self, **attributes):
+        #Attributes only known once the work is done (rows, cached, engine, ...), for the span log.
+        self.attributes.update(attributes)
+
+
+class _NoSpan:
+    def set(self, **attributes):
+        pass
+
+
+@contextmanager
+def span(name, **attributes):
+    #Times the block as stage `name`. Yields the Span, whose set() adds attributes for the span log.
+    if not TELEMETRY:
+        yield _NoSpan()
+        return
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.seconds = time.perf_counter() - current.started
+        registry.histogram("stage_seconds", stage=name).observe(current.seconds)
+        if error is not None:
+            registry.count("stage_errors_total", stage=name)
+        if TELEMETRY_JSONL:
+            _write_span({"trace_id": current.trace_id, "span_id": current.span_id, "parent_id": current.parent_id,
+                         "name": name, "start": time.time() - current.seconds, "seconds": current.seconds,
+                         "error": error, **current.attributes})
+
+
+def traced(name):
+    #Decorator form of span(name).
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(name, seconds):
+    #Records a duration measured elsewhere (e.g. summed over a generator) as stage `name`.
+    if TELEMETRY:
+        registry.histogram("stage_seconds", stage=name).observe(seconds)
+
+
+def record_llm(kind, model, prompt_bytes, response_bytes, usage=None):
+    #kind: "generate" or "embed". usage: the response's usage_metadata, when the API returned one.
+    if not TELEMETRY:
+        return
+    registry.count("llm_requests_total", kind=kind, model=model)
+    registry.count("llm_prompt_bytes_total", prompt_bytes, kind=kind, model=model)
+    registry.count("llm_response_bytes_total", response_bytes, kind=kind, model=model)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens:
+        registry.count("llm_prompt_tokens_total", prompt_tokens, kind=kind, model=model)
+    if response_tokens:
+        registry.count("llm_response_tokens_total", response_tokens, kind=kind, model=model)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+
+def prometheus_text():
+    #The metrics in the Prometheus text exposition format.
+    lines = []
+    histograms, counters = registry.snapshot()
+    for name in sorted({name for (name, _), _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), histogram in histograms:
+            if metric != name:
+                continue
+            with histogram._lock:
+                counts, total, seconds = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {seconds}")
+            lines.append(f"{name}_count{_labels(labels)} {total}")
+    for name in sorted({name for (name, _), _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{_labels(labels)} {value}" for (metric, labels), value in counters if metric == name)
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    #{stage: {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}} plus the LLM counters.
+    histograms, counters = registry.snapshot()
+    errors = {dict(labels)["stage"]: value for (name, labels), value in counters if name == "stage_errors_total"}
+    stages = {}
+    for (name, labels), histogram in histograms:
+        if name != "stage_seconds" or not histogram.count:
+            continue
+        stage = dict(labels)["stage"]
+        stages[stage] = {
+            "count": histogram.count,
+            "errors": errors.get(stage, 0),
+            "mean_ms": histogram.sum / histogram.count * 1000,
+            "p50_ms": histogram.quantile(0.5) * 1000,
+            "p95_ms": histogram.quantile(0.95) * 1000,
+            "p99_ms": histogram.quantile(0.99) * 1000,
+            "max_ms": histogram.max * 1000,
+        }
+    llm = {}
+    for (name, labels), value in counters:
+        if name.startswith("llm_"):
+            labels = dict(labels)
+            llm.setdefault(f"{labels['kind']}:{labels['model']}", {})[name] = value
+    return {"stages": stages, "llm": llm}
+
+
+def format_summary(stages):
+    #A fixed-width table of summary()["stages"], for benchmarks and logs.
+    lines = [f"{'stage':<24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for stage, entry in stages.items():
+        lines.append(f"{stage:<24} {entry['count']:>7} {entry['p50_ms']:>9.1f} {entry['p95_ms']:>9.1f} "
+                     f"{entry['p99_ms']:>9.1f} {entry['max_ms']:>9.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,17 @@
+#Imports service.py from the repository root, with the local vector store, every database and cache in a
+#temporary directory and no client warm-up at startup.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_data_dir = tempfile.mkdtemp(prefix="service-tests-")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("API_WARM_UP", "0")
+for name, file_name in (("VECTOR_STORE_PATH", "vector_store"), ("BM25_INDEX_PATH", "bm25_index.db"),
+                        ("DOCUMENT_REGISTRY_PATH", "document_registry.db"),
+                        ("EMBEDDING_CACHE_PATH", "embedding_cache.db"), ("STRUCTURED_DB_PATH", "uploaded_data.db"),
+                        ("PLAN_CACHE_PATH", "plan_cache.db"), ("PARQUET_CACHE_DIR", "parquet_cache"),
+                        ("COLUMNAR_DB_PATH", "columnar.duckdb")):
+    os.environ.setdefault(name, os.path.join(_data_dir, file_name))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import pytest
+
+import service
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_slot_is_released_when_the_client_is_gone_before_streaming():
+    limiter = service._Limiter("queries", 1)
+
+    async def events():
+        yield {"type": "text", "text": "never sent"}
+
+    async def disconnected_send(message):
+        raise OSError("connection reset")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def respond():
+        await limiter.acquire()
+        response = service._streamed(events(), limiter)
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, disconnected_send)
+
+    run(respond())
+    assert limiter.running == 0
+
+
+def test_iterator_is_closed_after_the_next_call_in_flight_returns():
+    started, unblock, closed = threading.Event(), threading.Event(), threading.Event()
+    errors = []
+
+    def answer():
+        try:
+            started.set()
+            unblock.wait(5)
+            yield "first"
+            yield "second"
+        finally:
+            closed.set()
+
+    async def consume_then_disconnect():
+        stream = service._iterate_blocking(answer())
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        try:
+            await stream.aclose()
+        except Exception as e:
+            errors.append(e)
+
+    run(consume_then_disconnect())
+    assert not closed.is_set() #Still running next() on the thread pool.
+    unblock.set()
+    assert closed.wait(5)
+    assert errors == []
+
+
+def test_ingest_locks_are_dropped_when_done():
+    async def ingest_twice():
+        async def hold(seconds):
+            async with service._ingest_lock(("table", "sales")):
+                await asyncio.sleep(seconds)
+        await asyncio.gather(hold(0.01), hold(0.01))
+
+    run(ingest_twice())
+    assert service._ingest_locks == {}
+
+
+class _Upload:
+    def __init__(self, name, data):
+        self.filename = name
+        self._data = data
+
+    async def read(self, size):
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+
+def test_uploads_waiting_for_the_same_content_hold_no_slot(monkeypatch):
+    limiter = service._Limiter("uploads", 2)
+    monkeypatch.setattr(service, "ingest_limiter", limiter)
+    release = threading.Event()
+    loaded = []
+
+    def load(path, name):
+        loaded.append(name)
+        if name == "first":
+            release.wait(5)
+        return name
+
+    async def upload(name, data, key):
+        return await service._ingest([("table", key)], _Upload(f"{name}.csv", data), (".csv",), load, name)
+
+    async def uploads():
+        first = asyncio.ensure_future(upload("first", b"a\n1\n", "sales"))
+        await asyncio.sleep(0.05)
+        same_bytes = asyncio.ensure_future(upload("same bytes", b"a\n1\n", "sales copy"))
+        await asyncio.sleep(0.05)
+        assert limiter.running == 1 #"same bytes" waits for "first" without a slot.
+        assert await asyncio.wait_for(upload("other", b"a\n2\n", "stock"), 5) == "other"
+        release.set()
+        return await first, await same_bytes
+
+    assert run(uploads()) == ("first", "same bytes")
+    assert loaded == ["first", "other", "same bytes"]
+    assert service._ingest_locks == {}